@@ -0,0 +1,88 @@
+""" Tracks built per second and bytes kept per track, eager vs compact
+
+Builds 100k tracks from freshly decoded api pages, like a large playlist or a user's
+likes, and keeps them alive.  Run with `python -m benchmarks.compact_tracks`
+"""
+import gc
+import json
+import time
+import tracemalloc
+
+from sclib.sync import SoundcloudAPI, Track
+from tests.stub import make_track_obj
+
+COUNT = 100_000
+PAGE_SIZE = 50
+MODES = [('eager', False), ('compact', True), ('compact subset', ('duration', 'permalink_url'))]
+
+
+def full_track_obj(track_id):
+    """ Track object with the fields and nested objects the api returns """
+    return make_track_obj(
+        track_id,
+        title=f'Artist {track_id} - Song {track_id}',
+        description='A description of the track ' * 8,
+        duration=215000, full_duration=215000, genre='Electronic', tag_list='"deep house" chill',
+        permalink=f'song-{track_id}', permalink_url=f'https://soundcloud.com/artist/song-{track_id}',
+        created_at='2024-01-01T00:00:00Z', display_date='2024-01-01T00:00:00Z', last_modified='2024-01-02T00:00:00Z',
+        comment_count=12, likes_count=340, playback_count=12000, reposts_count=5, download_count=0,
+        commentable=True, downloadable=False, streamable=True, public=True, sharing='public', state='finished',
+        policy='ALLOW', monetization_model='NOT_APPLICABLE', license='all-rights-reserved',
+        uri=f'https://api.soundcloud.com/tracks/{track_id}', urn=f'soundcloud:tracks:{track_id}',
+        waveform_url=f'https://wave.sndcdn.com/{track_id}_m.json',
+        user={
+            'id': track_id, 'username': f'artist {track_id}', 'permalink': 'artist',
+            'avatar_url': f'https://i1.sndcdn.com/avatars-{track_id}-large.jpg', 'followers_count': 1000,
+            'city': 'Berlin', 'country_code': 'DE', 'verified': False,
+        },
+        visuals={'urn': f'soundcloud:users:{track_id}', 'enabled': True, 'visuals': [
+            {'urn': f'soundcloud:visuals:{track_id}', 'entry_time': 0, 'visual_url': 'https://i1.sndcdn.com/visuals.jpg'}
+        ]},
+        publisher_metadata={'id': track_id, 'artist': f'Artist {track_id}', 'contains_music': True, 'isrc': 'XX0000000000'},
+    )
+
+
+def pages():
+    """ Decoded api pages of PAGE_SIZE tracks, each decoded on its own like real responses """
+    page = json.dumps([full_track_obj(track_id) for track_id in range(PAGE_SIZE)])
+    for _ in range(COUNT // PAGE_SIZE):
+        yield json.loads(page)
+
+
+def build(api, decoded):
+    """ Build a track from every decoded object """
+    return [Track(obj=obj, client=api) for page in decoded for obj in page]
+
+
+def measure(compact):
+    """ Tracks built per second and bytes kept alive per track """
+    api = SoundcloudAPI(client_id='bench', compact=compact)
+    decoded = list(pages())
+    gc.disable()  # like timeit, keep collections of the decoded pages out of the timing
+    started = time.perf_counter()
+    build(api, decoded)
+    rate = COUNT / (time.perf_counter() - started)
+    gc.enable()
+
+    gc.collect()
+    tracemalloc.start()
+    decoded = list(pages())
+    tracks = build(api, decoded)
+    del decoded  # only what the tracks reference stays alive
+    gc.collect()
+    kept = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    assert len(tracks) == COUNT
+    return rate, kept / COUNT
+
+
+def main():
+    """ Print construction rate and retained memory per mode """
+    print(f'{COUNT} tracks')
+    for name, compact in MODES:
+        rate, kept = measure(compact)
+        print(f'{name:>15}: {rate:10.0f} tracks/s  {kept:8.0f} bytes/track')
+
+
+if __name__ == '__main__':
+    main()
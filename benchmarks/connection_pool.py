@@ -0,0 +1,64 @@
+""" Per-request latency of pooled keep-alive connections against urlopen over local https
+
+Run with `python -m benchmarks.connection_pool` (needs the openssl command line tool)
+"""
+import os
+import ssl
+import subprocess
+import tempfile
+import time
+from urllib.request import urlopen
+
+from sclib.pool import ConnectionPool
+from tests.stub import StubServer
+
+REQUESTS = 200
+
+
+def make_certificate(directory):
+    """ Create a self-signed certificate for 127.0.0.1 """
+    cert, key = os.path.join(directory, 'cert.pem'), os.path.join(directory, 'key.pem')
+    subprocess.run([
+        'openssl', 'req', '-x509', '-newkey', 'rsa:2048', '-nodes', '-days', '1',
+        '-subj', '/CN=127.0.0.1', '-addext', 'subjectAltName=IP:127.0.0.1',
+        '-keyout', key, '-out', cert,
+    ], check=True, capture_output=True)
+    return cert, key
+
+
+def timed(fetch, url):
+    """ Mean seconds per request """
+    start = time.perf_counter()
+    for _ in range(REQUESTS):
+        fetch(url)
+    return (time.perf_counter() - start) / REQUESTS
+
+
+def main():
+    """ Print mean latency per request for both approaches """
+    with tempfile.TemporaryDirectory() as directory:
+        cert, key = make_certificate(directory)
+        server_context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+        server_context.load_cert_chain(cert, key)
+
+        def fetch_urlopen(url):
+            # like get_url: a new connection and ssl context for every request
+            with urlopen(url, context=ssl.create_default_context(cafile=cert)) as client:
+                return client.read()
+
+        pool = ConnectionPool(ssl_context=ssl.create_default_context(cafile=cert))
+
+        def fetch_pooled(url):
+            with pool.request(url) as response:
+                return response.read()
+
+        with StubServer(ssl_context=server_context) as stub:
+            stub.routes['/tracks'] = {'collection': [{'id': i} for i in range(50)]}
+            url = f'{stub.url}/tracks'
+            for name, fetch in (('urlopen', fetch_urlopen), ('pooled', fetch_pooled)):
+                fetch(url)
+                print(f'{name:>8}: {timed(fetch, url) * 1000:7.3f} ms/request')
+
+
+if __name__ == '__main__':
+    main()
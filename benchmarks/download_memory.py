@@ -0,0 +1,38 @@
+""" Peak memory of Track.write_mp3_to for tracks of increasing length
+
+Run with `python -m benchmarks.download_memory`
+"""
+import tempfile
+import tracemalloc
+
+from sclib.sync import SoundcloudAPI, Track
+from tests.stub import StubServer, make_mp3, make_track_obj
+
+SIZES_MB = [4, 16, 64, 128]
+
+
+def measure(stub, size_mb):
+    """ Peak traced memory while downloading a `size_mb` MB track """
+    stub.routes['/transcodings/1/progressive'] = {'url': f'{stub.url}/audio.mp3'}
+    stub.routes['/audio.mp3'] = make_mp3(size_mb * 1024 * 1024)
+    track = Track(obj=make_track_obj(1, stub.url), client=SoundcloudAPI(client_id='bench'))
+    with tempfile.TemporaryFile() as file:
+        tracemalloc.start()
+        try:
+            track.write_mp3_to(file)
+            return tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+
+def main():
+    """ Print peak memory per track size """
+    with StubServer() as stub:
+        measure(stub, 1)  # warm up imports and connection machinery
+        for size_mb in SIZES_MB:
+            peak = measure(stub, size_mb)
+            print(f'{size_mb:>5} MB track: peak {peak / 1024:8.1f} KiB')
+
+
+if __name__ == '__main__':
+    main()
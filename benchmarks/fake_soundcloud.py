@@ -0,0 +1,214 @@
+""" Local aiohttp stand-in for the soundcloud endpoints the clients use
+
+Serves a page with script bundles (one holds a client_id), `resolve`, `tracks?ids=`,
+progressive transcodings, ranged mp3 streams and artwork.  Every response can be
+delayed by `latency` seconds, bodies of audio, artwork and scripts are sent at
+`bandwidth` bytes per second, and api requests fail with `error_status` at
+`error_rate`.  The server runs its own event loop on a thread, so sync clients,
+async clients and benchmarks in any loop can use it.
+"""
+import asyncio
+import collections
+import json
+import random
+import re
+import threading
+
+from aiohttp import web
+
+from tests.stub import make_mp3, make_track_obj
+
+CLIENT_ID = 'FakeClientId0123456789abcdefABCD'
+CHUNK_SIZE = 64 * 1024
+FULL_PLAYLIST_TRACKS = 5
+API_ROUTES = ('resolve', 'tracks', 'transcoding')
+RANGE_REGEX = re.compile(r'bytes=(\d+)-(\d*)')
+
+
+class FakeSoundcloud:  # pylint: disable=too-many-instance-attributes
+    """ Fake soundcloud server, use it as a context manager
+
+    Resolvable urls are `https://soundcloud.com/fake-artist/track-<id>` and
+    `https://soundcloud.com/fake-artist/sets/playlist-<id>-<tracks>`, see `track_url` and
+    `playlist_url`; only their `resolve` goes to the server.  `client` builds a client class pointed at the server.
+    `requests` counts the requests per route.
+    """
+
+    def __init__(self, *, latency=0.0, bandwidth=None, error_rate=0.0, error_status=503,  # pylint: disable=too-many-arguments
+                 track_size=1024 * 1024, artwork_size=64 * 1024, scripts=8, script_size=256 * 1024, seed=0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.scripts = scripts
+        self.requests = collections.Counter()
+        self._random = random.Random(seed)
+        self._mp3 = make_mp3(track_size)
+        self._artwork = b'\xff\xd8\xff\xe0' + b'\x00' * max(0, artwork_size - 4)
+        self._script = b'var a=1;' * (script_size // 8)
+        self._loop = asyncio.new_event_loop()
+        self._runner = None
+        self._thread = None
+        self._port = None
+
+    @property
+    def url(self):
+        """ Base url of the server """
+        return f'http://127.0.0.1:{self._port}'
+
+    @property
+    def config(self) -> dict:
+        """ Settings of the server, for reports """
+        return {
+            'latency': self.latency,
+            'bandwidth': self.bandwidth,
+            'error_rate': self.error_rate,
+            'error_status': self.error_status,
+            'track_size': len(self._mp3),
+            'artwork_size': len(self._artwork),
+            'scripts': self.scripts,
+            'script_size': len(self._script),
+        }
+
+    def track_url(self, track_id):
+        """ Soundcloud-like url of a track """
+        return f'https://soundcloud.com/fake-artist/track-{track_id}'
+
+    def playlist_url(self, playlist_id, tracks):
+        """ Soundcloud-like url of a playlist of `tracks` tracks """
+        return f'https://soundcloud.com/fake-artist/sets/playlist-{playlist_id}-{tracks}'
+
+    def client(self, api_class):
+        """ Subclass of a SoundcloudAPI whose api urls point at this server """
+        return type(api_class.__name__, (api_class,), {
+            '__slots__': (),
+            'RESOLVE_URL': self.url + '/resolve?url={url}&client_id={client_id}',
+            'TRACKS_URL': self.url + '/tracks?ids={track_ids}&client_id={client_id}',
+        })
+
+    def scrape_urls(self):
+        """ Value for `sclib.util.SCRAPE_URLS` to scrape the client_id from this server """
+        return [f'{self.url}/page']
+
+    def __enter__(self):
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, args=(started,), daemon=True)
+        self._thread.start()
+        started.wait()
+        return self
+
+    def __exit__(self, *exc_info):
+        asyncio.run_coroutine_threadsafe(self._runner.cleanup(), self._loop).result()
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._loop.close()
+
+    def _serve(self, started):
+        asyncio.set_event_loop(self._loop)
+        app = web.Application(middlewares=[self._inject])
+        app.router.add_get('/page', self._page, name='page')
+        app.router.add_get('/assets/{number}.js', self._script_bundle, name='script')
+        app.router.add_get('/resolve', self._resolve, name='resolve')
+        app.router.add_get('/tracks', self._tracks, name='tracks')
+        app.router.add_get('/transcodings/{id}/progressive', self._transcoding, name='transcoding')
+        app.router.add_get('/audio/{id}.mp3', self._audio, name='audio')
+        app.router.add_get('/artwork/{name}', self._artwork_image, name='artwork')
+        self._runner = web.AppRunner(app, access_log=None)
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, '127.0.0.1', 0)
+        self._loop.run_until_complete(site.start())
+        self._port = self._runner.addresses[0][1]
+        started.set()
+        self._loop.run_forever()
+
+    @web.middleware
+    async def _inject(self, request, handler):
+        name = request.match_info.route.name
+        self.requests[name] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if name in API_ROUTES and self.error_rate and self._random.random() < self.error_rate:
+            headers = {'Retry-After': '0'} if self.error_status == 429 else {}
+            return web.Response(status=self.error_status, headers=headers)
+        return await handler(request)
+
+    def track_obj(self, track_id):
+        """ Api object of a track """
+        return make_track_obj(track_id, self.url, artwork_url=f'{self.url}/artwork/{track_id}-large.jpg')
+
+    async def _send(self, request, body, status=200, headers=None):
+        """ Send a body at `bandwidth` bytes per second """
+        if not self.bandwidth:
+            return web.Response(status=status, body=body, headers=headers)
+        response = web.StreamResponse(status=status, headers=headers)
+        response.content_length = len(body)
+        await response.prepare(request)
+        for start in range(0, len(body), CHUNK_SIZE):
+            chunk = body[start:start + CHUNK_SIZE]
+            await response.write(chunk)
+            await asyncio.sleep(len(chunk) / self.bandwidth)
+        await response.write_eof()
+        return response
+
+    async def _page(self, _):
+        scripts = ''.join(f'<script crossorigin src="{self.url}/assets/{n}.js"></script>' for n in range(self.scripts))
+        return web.Response(text=f'<html><head>{scripts}</head></html>', content_type='text/html')
+
+    async def _script_bundle(self, request):
+        body = self._script
+        if int(request.match_info['number']) == self.scripts - 1:
+            body += f'fetch("/search?client_id={CLIENT_ID}")'.encode()
+        return await self._send(request, body, headers={'Content-Type': 'application/javascript'})
+
+    async def _resolve(self, request):
+        url = request.query['url']
+        match = re.search(r'/sets/playlist-(\d+)-(\d+)$', url)
+        if match:
+            playlist_id, count = int(match.group(1)), int(match.group(2))
+            first = playlist_id * 100_000
+            tracks = [self.track_obj(first + n) for n in range(min(count, FULL_PLAYLIST_TRACKS))]
+            tracks += [{'id': first + n, 'kind': 'track'} for n in range(len(tracks), count)]
+            return web.json_response({
+                'id': playlist_id, 'kind': 'playlist', 'title': f'playlist {playlist_id}',
+                'track_count': count, 'tracks': tracks,
+            })
+        match = re.search(r'/track-(\d+)$', url)
+        if match:
+            return web.json_response(self.track_obj(int(match.group(1))))
+        return web.Response(status=404)
+
+    async def _tracks(self, request):
+        ids = [int(track_id) for track_id in request.query['ids'].split(',')]
+        return web.Response(body=json.dumps([self.track_obj(track_id) for track_id in ids]), content_type='application/json')
+
+    async def _transcoding(self, request):
+        return web.json_response({'url': f'{self.url}/audio/{request.match_info["id"]}.mp3'})
+
+    async def _audio(self, request):
+        headers = {'Content-Type': 'audio/mpeg', 'Accept-Ranges': 'bytes', 'ETag': f'"{request.match_info["id"]}"'}
+        match = RANGE_REGEX.fullmatch(request.headers.get('Range', ''))
+        if not match:
+            return await self._send(request, self._mp3, headers=headers)
+        start = int(match.group(1))
+        end = min(int(match.group(2) or len(self._mp3) - 1), len(self._mp3) - 1)
+        if start >= len(self._mp3):
+            return web.Response(status=416, headers={'Content-Range': f'bytes */{len(self._mp3)}'})
+        headers['Content-Range'] = f'bytes {start}-{end}/{len(self._mp3)}'
+        return await self._send(request, self._mp3[start:end + 1], 206, headers)
+
+    async def _artwork_image(self, request):
+        return await self._send(request, self._artwork, headers={'Content-Type': 'image/jpeg'})
+
+
+def main():
+    """ Serve until interrupted, run with `python -m benchmarks.fake_soundcloud` """
+    with FakeSoundcloud() as server:
+        print(f'serving on {server.url}, try {server.track_url(1)} and {server.playlist_url(1, 500)}')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+""" Bulk get_tracks against a local stub, and the cost of re-ordering the results
+
+Run with `python -m benchmarks.get_tracks`
+"""
+import random
+import time
+
+from sclib.sync import SoundcloudAPI
+from tests.stub import StubServer, make_track_obj, tracks_route
+
+SIZES = [1000, 10000, 20000]
+
+
+def sort_by_index(track_ids, tracks):
+    """ The previous ordering, one list.index per track """
+    return sorted(tracks, key=lambda x: track_ids.index(x['id']))
+
+
+def order_by_position(track_ids, tracks):
+    """ The current ordering, one dict lookup per track """
+    return SoundcloudAPI._collect_tracks(track_ids, [tracks]).tracks  # pylint: disable=protected-access
+
+
+def timed(func, *args):
+    """ Seconds taken by one call """
+    start = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - start
+
+
+def main():
+    """ Print fetch and re-ordering times per number of ids """
+    with StubServer() as stub:
+        stub.routes['/tracks'] = tracks_route(stub.url)
+        SoundcloudAPI.TRACKS_URL = stub.url + '/tracks?ids={track_ids}&client_id={client_id}'
+        api = SoundcloudAPI(client_id='bench')
+        for size in SIZES:
+            track_ids = random.sample(range(10 * size), size)
+            tracks = [make_track_obj(i) for i in reversed(track_ids)]
+            fetch = timed(api.get_tracks, *track_ids)
+            old_order = timed(sort_by_index, track_ids, tracks)
+            new_order = timed(order_by_position, track_ids, tracks)
+            print(
+                f'{size:>6} ids: get_tracks {fetch:7.3f}s'
+                f' | re-order: list.index {old_order:8.4f}s, position index {new_order:8.4f}s'
+            )
+
+
+if __name__ == '__main__':
+    main()
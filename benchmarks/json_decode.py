@@ -0,0 +1,93 @@
+""" Decoding api responses with each installed json backend
+
+Payloads are shaped like api-v2 responses: a `tracks?ids=` batch, a large playlist of
+track stubs and a page of a big collection.  `json (str)` is the old path that decoded
+the body to a str before parsing it.  The last table shows the longest event loop
+stall while the asyncio client decodes the large payload inline or on an executor.
+Run with `python -m benchmarks.json_decode`
+"""
+import asyncio
+import json
+import time
+import timeit
+from concurrent import futures
+
+from benchmarks.compact_tracks import full_track_obj
+from sclib import json_backend
+from sclib.asyncio import SoundcloudAPI
+
+REPEAT = 5
+INTERVAL = 0.001
+
+
+def payloads():
+    """ Encoded responses by name """
+    playlist = {
+        'id': 1, 'kind': 'playlist', 'title': 'a large playlist', 'track_count': 5000,
+        'tracks': [full_track_obj(n) for n in range(5)] + [
+            {'id': n, 'kind': 'track', 'monetization_model': 'NOT_APPLICABLE', 'policy': 'ALLOW'}
+            for n in range(5, 5000)
+        ],
+    }
+    return {
+        'tracks?ids= (50 tracks)': json.dumps([full_track_obj(n) for n in range(50)]).encode(),
+        'playlist (5000 stubs)': json.dumps(playlist).encode(),
+        'collection (5000 tracks)': json.dumps({'collection': [full_track_obj(n) for n in range(5000)]}).encode(),
+    }
+
+
+def decoders():
+    """ Decode functions by name """
+    found = {name: backend.loads for name, backend in json_backend.BACKENDS.items()}
+    found['json (str)'] = lambda data: json.loads(data.decode('utf-8'))
+    return found
+
+
+def throughput(loads, data):
+    """ MB decoded per second, best of REPEAT """
+    number = max(1, 20_000_000 // len(data))
+    seconds = min(timeit.repeat(lambda: loads(data), number=number, repeat=REPEAT)) / number
+    return len(data) / seconds / 2 ** 20
+
+
+async def longest_stall(data, executor):
+    """ Longest wait of a 1ms timer while the client decodes `data` four times """
+    lags, stop = [], asyncio.Event()
+
+    async def monitor():
+        while not stop.is_set():
+            started = time.perf_counter()
+            await asyncio.sleep(INTERVAL)
+            lags.append(time.perf_counter() - started - INTERVAL)
+
+    api = SoundcloudAPI(client_id='bench', json_executor=executor)
+    watcher = asyncio.ensure_future(monitor())
+    await asyncio.sleep(0.01)
+    for _ in range(4):
+        await api.decode_json(data)
+        await asyncio.sleep(0.01)  # like other requests in between
+    stop.set()
+    await watcher
+    return max(lags)
+
+
+def main():
+    """ Print decode throughput per payload and backend, then loop stalls """
+    encoded = payloads()
+    names = list(decoders())
+    print(f'{"payload":>26} {"size":>9}  ' + ''.join(f'{name:>12}' for name in names) + '   (MB/s)')
+    for payload, data in encoded.items():
+        rates = [throughput(loads, data) for loads in decoders().values()]
+        print(f'{payload:>26} {len(data) / 2 ** 20:7.2f}MB  ' + ''.join(f'{rate:12.1f}' for rate in rates))
+
+    data = encoded['collection (5000 tracks)']
+    print(f'\nlongest loop stall decoding {len(data) / 2 ** 20:.1f} MB with {json_backend.DEFAULT_BACKEND.name}')
+    with futures.ThreadPoolExecutor(1) as threads, futures.ProcessPoolExecutor(1) as processes:
+        processes.submit(int).result()  # start the worker outside the measurement
+        for name, executor in [('inline', None), ('thread pool', threads), ('process pool', processes)]:
+            stall = asyncio.run(longest_stall(data, executor))
+            print(f'{name:>13}: {stall * 1000:7.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
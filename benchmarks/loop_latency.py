@@ -0,0 +1,87 @@
+""" Event loop stalls while the asyncio client downloads and tags tracks concurrently
+
+A monitor coroutine asks to wake up every millisecond and records how late it was.
+`inline` tags each file with mutagen on the event loop, as write_mp3_to used to;
+the other strategies render tags on a thread or process pool.
+Run with `python -m benchmarks.loop_latency`
+"""
+import asyncio
+import tempfile
+import time
+from concurrent import futures
+
+from sclib import sync
+from sclib.asyncio import SoundcloudAPI, Track
+from tests.stub import StubServer, make_mp3, make_track_obj
+
+TRACKS = 8
+SIZE = 32 * 1024 * 1024
+ARTWORK = b'\xff\xd8\xff\xe0' + b'\x00' * 1024 * 1024
+INTERVAL = 0.001
+
+
+async def monitor(lags, stop):
+    """ Record how late each wake-up of the loop is """
+    while not stop.is_set():
+        started = time.perf_counter()
+        await asyncio.sleep(INTERVAL)
+        lags.append(time.perf_counter() - started - INTERVAL)
+
+
+async def download_inline(track, file):
+    """ Download, then tag on the event loop """
+    await track.write_mp3_to(file, tag=False)
+    sync.add_id3_tags(file, track.id3_frames(await track.get_album_artwork()))
+
+
+async def download_offloaded(track, file):
+    """ Download with tags rendered on the client's tag executor """
+    await track.write_mp3_to(file)
+
+
+async def run(stub, strategy, executor=None):
+    """ Download TRACKS tracks concurrently while monitoring the loop """
+    lags, stop = [], asyncio.Event()
+    async with SoundcloudAPI(client_id='bench', tag_executor=executor) as api:
+        files = [tempfile.TemporaryFile() for _ in range(TRACKS)]
+        watcher = asyncio.ensure_future(monitor(lags, stop))
+        started = time.perf_counter()
+        try:
+            await asyncio.gather(*[
+                strategy(Track(obj=make_track_obj(n, stub.url, artwork_url=f'{stub.url}/art-large.jpg'), client=api), file)
+                for n, file in enumerate(files)
+            ])
+        finally:
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await watcher
+            for file in files:
+                file.close()
+    lags.sort()
+    return elapsed, lags[len(lags) // 2], lags[int(len(lags) * 0.99)], lags[-1]
+
+
+def main():
+    """ Print loop lag percentiles per tagging strategy """
+    with StubServer() as stub:
+        stub.routes['/art-t500x500.jpg'] = ARTWORK
+        for number in range(TRACKS):
+            stub.routes[f'/transcodings/{number}/progressive'] = {'url': f'{stub.url}/audio.mp3'}
+        stub.routes['/audio.mp3'] = make_mp3(SIZE)
+        print(f'{TRACKS} concurrent {SIZE // 2 ** 20} MB tracks with {len(ARTWORK) // 2 ** 10} KiB artwork')
+        with futures.ThreadPoolExecutor(4) as threads, futures.ProcessPoolExecutor(4) as processes:
+            strategies = [
+                ('inline', download_inline, None),
+                ('threads', download_offloaded, threads),
+                ('processes', download_offloaded, processes),
+            ]
+            for name, strategy, executor in strategies:
+                elapsed, median, p99, worst = asyncio.run(run(stub, strategy, executor))
+                print(
+                    f'{name:<10} {elapsed:6.2f}s  loop lag median {median * 1000:6.2f} ms'
+                    f'  p99 {p99 * 1000:7.2f} ms  max {worst * 1000:7.2f} ms'
+                )
+
+
+if __name__ == '__main__':
+    main()
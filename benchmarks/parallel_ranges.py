@@ -0,0 +1,54 @@
+""" Track.write_mp3_to over one connection vs concurrent byte ranges from a throttled server
+
+Every connection to the local server is limited to RATE bytes per second, like a CDN
+throttling each client connection.  Run with `python -m benchmarks.parallel_ranges`
+"""
+import asyncio
+import tempfile
+import time
+
+from sclib import asyncio as sclib_asyncio
+from sclib.sync import SoundcloudAPI, Track
+from tests.stub import StubServer, make_mp3, make_track_obj, ranged_route
+
+SIZE = 16 * 1024 * 1024
+RATE = 8 * 1024 * 1024
+CONNECTIONS = [1, 2, 4, 8]
+
+
+def measure_sync(stub, connections):
+    """ Seconds to download the track with the sync client """
+    track = Track(obj=make_track_obj(1, stub.url), client=SoundcloudAPI(client_id='bench'))
+    with tempfile.TemporaryFile() as file:
+        started = time.perf_counter()
+        track.write_mp3_to(file, connections=connections)
+        return time.perf_counter() - started
+
+
+async def measure_async(stub, connections):
+    """ Seconds to download the track with the asyncio client """
+    async with sclib_asyncio.SoundcloudAPI(client_id='bench') as api:
+        track = sclib_asyncio.Track(obj=make_track_obj(1, stub.url), client=api)
+        with tempfile.TemporaryFile() as file:
+            started = time.perf_counter()
+            await track.write_mp3_to(file, connections=connections)
+            return time.perf_counter() - started
+
+
+def main():
+    """ Print download time and throughput per connection count """
+    with StubServer() as stub:
+        stub.routes['/transcodings/1/progressive'] = {'url': f'{stub.url}/audio.mp3'}
+        stub.routes['/audio.mp3'] = ranged_route(make_mp3(SIZE), rate=RATE)
+        print(f'{SIZE // 2 ** 20} MB track, {RATE // 2 ** 20} MB/s per connection')
+        for connections in CONNECTIONS:
+            sync_seconds = measure_sync(stub, connections)
+            async_seconds = asyncio.run(measure_async(stub, connections))
+            print(
+                f'{connections:>2} connections: sync {sync_seconds:6.2f}s ({SIZE / sync_seconds / 2 ** 20:6.1f} MB/s)'
+                f'  asyncio {async_seconds:6.2f}s ({SIZE / async_seconds / 2 ** 20:6.1f} MB/s)'
+            )
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,342 @@
+""" Offline benchmark suite for the sync and asyncio clients
+
+Runs resolve, get_tracks, playlist hydration, downloads and client_id scraping
+against the local fake server and reports throughput, latency percentiles and peak
+traced memory per scenario and client.  Timings come from an untraced run, peak
+memory from a second run under tracemalloc.  Pass `--json results.json` to keep the
+results for comparing runs.  Run with `python -m benchmarks.suite --help`
+"""
+import argparse
+import asyncio
+import contextlib
+import itertools
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent import futures
+from datetime import datetime, timezone
+
+from benchmarks.fake_soundcloud import FakeSoundcloud
+from sclib import asyncio as sclib_asyncio
+from sclib import sync, util
+from sclib.cache import CredentialCache
+from sclib.json_backend import DEFAULT_BACKEND
+from sclib.retry import RetryPolicy
+
+PERCENTILES = (50, 90, 99)
+SCENARIOS = ('resolve', 'get_tracks', 'playlist', 'download', 'credentials')
+CLIENTS = ('sync', 'asyncio')
+
+
+def percentile(sorted_values, percent):
+    """ Nearest-rank percentile of sorted values """
+    if not sorted_values:
+        return None
+    rank = max(0, min(len(sorted_values) - 1, round(percent / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+
+def client_options():
+    """ Options that keep backoffs and the credential file out of the measurement """
+    return {
+        'retry_policy': RetryPolicy(backoff=0.01, max_backoff=0.1),
+        'credential_cache': CredentialCache(),
+    }
+
+
+class Scenario:
+    """ One benchmark: `ops` operations of `units` work each, run `concurrency` at a time
+
+    Subclasses implement `sync_op(api, number)` and `async_op(api, number)` for
+    operation `number` and return the units of work done, e.g. tracks or bytes.
+    """
+    unit = 'ops'
+
+    def __init__(self, server, args):
+        self.server = server
+        self.args = args
+        self.ops = args.ops
+        self.concurrency = args.concurrency
+        self.numbers = itertools.count(1)  # distinct ids per run, so no cache hides work
+
+    def sync_client(self):
+        """ Sync client pointed at the fake server """
+        return self.server.client(sync.SoundcloudAPI)(client_id='bench', **client_options())
+
+    def async_client(self):
+        """ Asyncio client pointed at the fake server """
+        return self.server.client(sclib_asyncio.SoundcloudAPI)(client_id='bench', **client_options())
+
+    def run_sync(self):
+        """ Run the operations on threads, returns (seconds, latencies, units, errors) """
+        api = self.sync_client()
+        numbers = [next(self.numbers) for _ in range(self.ops)]
+
+        def timed(number):
+            started = time.perf_counter()
+            units = self.sync_op(api, number)
+            return time.perf_counter() - started, units
+
+        return self._collect(lambda: list(self._map_threads(timed, numbers)))
+
+    def _map_threads(self, func, numbers):
+        with futures.ThreadPoolExecutor(self.concurrency) as executor:
+            for call in [executor.submit(func, number) for number in numbers]:
+                try:
+                    yield call.result()
+                except Exception as exc:  # pylint: disable=broad-except
+                    yield exc
+
+    def run_async(self):
+        """ Run the operations as tasks, returns (seconds, latencies, units, errors) """
+        numbers = [next(self.numbers) for _ in range(self.ops)]
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(self.concurrency)
+            async with self.async_client() as api:
+
+                async def timed(number):
+                    async with semaphore:
+                        started = time.perf_counter()
+                        units = await self.async_op(api, number)
+                        return time.perf_counter() - started, units
+
+                return await asyncio.gather(*map(timed, numbers), return_exceptions=True)
+
+        return self._collect(lambda: asyncio.run(run_all()))
+
+    @staticmethod
+    def _collect(run):
+        started = time.perf_counter()
+        outcomes = run()
+        seconds = time.perf_counter() - started
+        done = [outcome for outcome in outcomes if not isinstance(outcome, BaseException)]
+        latencies = sorted(latency for latency, _ in done)
+        return seconds, latencies, sum(units for _, units in done), len(outcomes) - len(done)
+
+    def sync_op(self, api, number):
+        """ One operation with the sync client """
+        raise NotImplementedError
+
+    async def async_op(self, api, number):
+        """ One operation with the asyncio client """
+        raise NotImplementedError
+
+
+class Resolve(Scenario):
+    """ Resolve track urls """
+    unit = 'tracks'
+
+    def sync_op(self, api, number):
+        api.resolve(self.server.track_url(number))
+        return 1
+
+    async def async_op(self, api, number):
+        await api.resolve(self.server.track_url(number))
+        return 1
+
+
+class GetTracks(Scenario):
+    """ Fetch tracks by id, `--batch` ids per call """
+    unit = 'tracks'
+
+    def ids(self, number):
+        """ Distinct track ids for an operation """
+        return range(number * self.args.batch, (number + 1) * self.args.batch)
+
+    def sync_op(self, api, number):
+        return len(api.get_tracks(*self.ids(number)))
+
+    async def async_op(self, api, number):
+        return len(await api.get_tracks(*self.ids(number)))
+
+
+class PlaylistHydration(Scenario):
+    """ Resolve playlists of `--playlist-size` tracks and hydrate their stubs """
+    unit = 'tracks'
+
+    def sync_op(self, api, number):
+        return len(api.resolve(self.server.playlist_url(number, self.args.playlist_size)).tracks)
+
+    async def async_op(self, api, number):
+        return len((await api.resolve(self.server.playlist_url(number, self.args.playlist_size))).tracks)
+
+
+class Download(Scenario):
+    """ Download and tag tracks to temporary files """
+    unit = 'MB'
+
+    def sync_op(self, api, number):
+        track = sync.Track(obj=self.server.track_obj(number), client=api)
+        with tempfile.TemporaryFile() as file:
+            track.write_mp3_to(file)
+            return file.seek(0, os.SEEK_END) / 2 ** 20
+
+    async def async_op(self, api, number):
+        track = sclib_asyncio.Track(obj=self.server.track_obj(number), client=api)
+        with tempfile.TemporaryFile() as file:
+            await track.write_mp3_to(file)
+            return file.seek(0, os.SEEK_END) / 2 ** 20
+
+
+class Credentials(Scenario):
+    """ Scrape a client_id from the page's script bundles with an empty cache, one at a time """
+    unit = 'scrapes'
+
+    def __init__(self, server, args):
+        super().__init__(server, args)
+        self.concurrency = 1  # every scrape replaces the client's id
+
+    def sync_client(self):
+        return self.server.client(sync.SoundcloudAPI)(**client_options())
+
+    def async_client(self):
+        return self.server.client(sclib_asyncio.SoundcloudAPI)(**client_options())
+
+    def run_sync(self):
+        with scrape_urls(self.server):
+            return super().run_sync()
+
+    def run_async(self):
+        with scrape_urls(self.server):
+            return super().run_async()
+
+    def sync_op(self, api, number):
+        api.client_id = None
+        api.credential_cache.clear()
+        api.get_credentials()
+        return 1
+
+    async def async_op(self, api, number):
+        api.client_id = None
+        api.credential_cache.clear()
+        await api.get_credentials()
+        return 1
+
+
+@contextlib.contextmanager
+def scrape_urls(server):
+    """ Point `sclib.util.SCRAPE_URLS` at the fake server for a block """
+    saved, util.SCRAPE_URLS = util.SCRAPE_URLS, server.scrape_urls()
+    try:
+        yield
+    finally:
+        util.SCRAPE_URLS = saved
+
+
+SCENARIO_CLASSES = {
+    'resolve': Resolve,
+    'get_tracks': GetTracks,
+    'playlist': PlaylistHydration,
+    'download': Download,
+    'credentials': Credentials,
+}
+
+
+def measure(scenario, client):
+    """ Result of one scenario for one client """
+    run = scenario.run_sync if client == 'sync' else scenario.run_async
+    seconds, latencies, units, errors = run()
+    tracemalloc.start()
+    try:
+        run()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {
+        'scenario': type(scenario).__name__,
+        'client': client,
+        'ops': scenario.ops,
+        'concurrency': scenario.concurrency,
+        'errors': errors,
+        'seconds': seconds,
+        'ops_per_second': (scenario.ops - errors) / seconds,
+        'throughput': units / seconds,
+        'unit': f'{scenario.unit}/s',
+        'latency_ms': {
+            **{f'p{percent}': _ms(percentile(latencies, percent)) for percent in PERCENTILES},
+            'max': _ms(latencies[-1] if latencies else None),
+        },
+        'peak_memory_bytes': peak,
+    }
+
+
+def _ms(seconds):
+    return None if seconds is None else seconds * 1000
+
+
+def metadata(server, args) -> dict:
+    """ Where and how the suite ran """
+    return {
+        'timestamp': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'platform': platform.platform(),
+        'cpus': os.cpu_count(),
+        'json_backend': DEFAULT_BACKEND.name,
+        'server': server.config,
+        'settings': {
+            'ops': args.ops, 'concurrency': args.concurrency, 'batch': args.batch,
+            'playlist_size': args.playlist_size,
+        },
+    }
+
+
+def print_result(result):
+    """ One line of the report """
+    latency = result['latency_ms']
+    print(
+        f'{result["scenario"]:>18} {result["client"]:>8}  {result["throughput"]:10.1f} {result["unit"]:<10}'
+        f' p50 {latency["p50"] or 0:8.1f}ms  p90 {latency["p90"] or 0:8.1f}ms  p99 {latency["p99"] or 0:8.1f}ms'
+        f'  peak {result["peak_memory_bytes"] / 2 ** 20:7.1f}MB  errors {result["errors"]}'
+    )
+
+
+def parse_args(argv=None):
+    """ Command line options """
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scenarios', nargs='+', choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument('--clients', nargs='+', choices=CLIENTS, default=list(CLIENTS))
+    parser.add_argument('--ops', type=int, default=40, help='operations per scenario')
+    parser.add_argument('--concurrency', type=int, default=8, help='operations in flight at once')
+    parser.add_argument('--batch', type=int, default=200, help='track ids per get_tracks call')
+    parser.add_argument('--playlist-size', type=int, default=500, help='tracks per playlist')
+    parser.add_argument('--latency', type=float, default=0.005, help='seconds before each response')
+    parser.add_argument('--bandwidth', type=float, default=None, help='bytes per second of each body')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of api requests that fail')
+    parser.add_argument('--error-status', type=int, default=503)
+    parser.add_argument('--track-size', type=int, default=2 * 1024 * 1024, help='bytes per track')
+    parser.add_argument('--json', metavar='PATH', help='write the results as json, - for stdout')
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """ Run the selected scenarios for the selected clients """
+    args = parse_args(argv)
+    server = FakeSoundcloud(
+        latency=args.latency, bandwidth=args.bandwidth, error_rate=args.error_rate,
+        error_status=args.error_status, track_size=args.track_size,
+    )
+    results = []
+    with server:
+        for name in args.scenarios:
+            scenario = SCENARIO_CLASSES[name](server, args)
+            for client in args.clients:
+                result = measure(scenario, client)
+                results.append(result)
+                if args.json != '-':
+                    print_result(result)
+        report = {'meta': metadata(server, args), 'requests': dict(server.requests), 'results': results}
+    if args.json == '-':
+        json.dump(report, sys.stdout, indent=2)
+    elif args.json:
+        with open(args.json, 'w', encoding='utf-8') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,75 @@
+""" Bytes written and read per track when tagging after the download vs before it
+
+The old path streams the audio and then lets mutagen insert the tag, which moves
+the whole file.  Run with `python -m benchmarks.tag_io`
+"""
+import io
+
+from sclib import util
+from sclib.sync import SoundcloudAPI, Track
+from tests.stub import StubServer, make_mp3, make_track_obj
+
+SIZES_MB = [4, 16, 64]
+ARTWORK = b'\xff\xd8\xff\xe0' + b'\x00' * 100 * 1024
+
+
+class CountingFile(io.BytesIO):
+    """ In-memory file counting the bytes passing through it
+
+    It has no file descriptor, so mutagen moves data with plain reads and writes
+    instead of mmap and every byte it touches is counted.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.written = 0
+        self.read_bytes = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return super().write(data)
+
+    def read(self, size=-1):
+        data = super().read(size)
+        self.read_bytes += len(data)
+        return data
+
+    def readinto(self, buffer):
+        size = super().readinto(buffer)
+        self.read_bytes += size
+        return size
+
+
+def tag_after(track, file):
+    """ Stream the audio, then insert the tag """
+    with track.client.open_url(track.get_stream_url()) as response:
+        util.copy_stream(response, file, track.DOWNLOAD_CHUNK_SIZE)
+    file.seek(0)
+    track.write_track_id3(file, track.get_album_artwork())
+
+
+def tag_before(track, file):
+    """ Write the tag, then stream the audio after it """
+    track.write_mp3_to(file)
+
+
+def main():
+    """ Print bytes written and read per strategy and track size """
+    with StubServer() as stub:
+        stub.routes['/transcodings/1/progressive'] = {'url': f'{stub.url}/audio.mp3'}
+        stub.routes['/artwork-t500x500.jpg'] = ARTWORK
+        for size_mb in SIZES_MB:
+            stub.routes['/audio.mp3'] = make_mp3(size_mb * 1024 * 1024)
+            obj = make_track_obj(1, stub.url, artwork_url=f'{stub.url}/artwork-large.jpg')
+            for strategy in (tag_after, tag_before):
+                track = Track(obj=obj, client=SoundcloudAPI(client_id='bench'))
+                file = CountingFile()
+                strategy(track, file)
+                print(
+                    f'{size_mb:>3} MB track, {strategy.__name__:<10}: '
+                    f'written {file.written / 2 ** 20:7.2f} MiB, read {file.read_bytes / 2 ** 20:7.2f} MiB'
+                )
+
+
+if __name__ == '__main__':
+    main()
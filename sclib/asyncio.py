@@ -1,53 +1,170 @@
 """ Asyncio """
 
+import os
 import sys
+import collections
+import itertools
 import random
-import json
 import re
-import itertools
+import warnings
 import asyncio
 import aiohttp
 import mutagen
 
 from . import sync, util
+from .json_backend import get_backend as get_json_backend
+from .resume import EXPIRED_URL_CODES, RANGE_NOT_SATISFIABLE, PartialDownload
+from .retry import TOO_MANY_REQUESTS, parse_retry_after
 
-async def get_resource(url) -> bytes:
+async def get_resource(url, session=None) -> bytes:
     """ Get a resource based on url """
-    async with aiohttp.ClientSession() as session:
-        async with session as conn:
-            async with conn.request('GET', url) as request:
-                return await request.content.read()
-
-
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await get_resource(url, session)
+    async with session.get(url) as response:
+        return await response.read()
+
+
+async def write_resource_to(url, file, chunk_size, session=None):
+    """ Stream a resource into a file object
+
+    Chunks are written in the default executor and the next chunk is only read once
+    the previous write has finished, so a slow disk throttles the download instead of
+    stalling the event loop or buffering the track in memory.
+    """
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await write_resource_to(url, file, chunk_size, session)
+    async with session.get(url) as response:
+        response.raise_for_status()
+        await write_response_to(response, file, chunk_size)
+    return None
+
+
+async def write_response_to(response, file, chunk_size):
+    """ Stream the body of an open response into a file object, see `write_resource_to` """
+    loop = asyncio.get_running_loop()
+    async for chunk in response.content.iter_chunked(chunk_size):
+        await loop.run_in_executor(None, file.write, chunk)
+
+
+async def scan_script_for_client_id(url, session, chunk_size=sync.SoundcloudAPI.SCRIPT_CHUNK_SIZE):
+    """ Search a script for a client_id while it downloads, stopping at the first match """
+    scanner = util.ClientIdScanner()
+    async with session.get(url) as response:
+        response.raise_for_status()
+        async for chunk in response.content.iter_chunked(chunk_size):
+            client_id = scanner.feed(chunk)
+            if client_id:
+                return client_id
+    return scanner.close()
+
+
+async def discover_client_id(session, hint=None):
+    """ Find a client_id in the scripts of a soundcloud page
+
+    The script that held the id last time (`hint`) is searched first, then the rest are
+    fetched concurrently.  The first match cancels the other downloads.
+    Returns (client_id, script_url) or (None, None).
+    """
+    url = random.choice(util.SCRAPE_URLS)
+    page_text = await get_resource(url, session)
+    script_urls = util.order_script_urls(util.find_script_urls(page_text.decode()), hint)
 
-async def fetch_soundcloud_client_id():
+    if hint in script_urls:
+        script_urls.remove(hint)
+        try:
+            client_id = await scan_script_for_client_id(hint, session)
+        except aiohttp.ClientError:
+            client_id = None
+        if client_id:
+            return client_id, hint
+
+    scans = {asyncio.ensure_future(scan_script_for_client_id(u, session)): u for u in script_urls}
+    pending = set(scans)
+    try:
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for scan in done:
+                if scan.exception() is None and scan.result():
+                    return scan.result(), scans[scan]
+    finally:
+        for scan in pending:
+            scan.cancel()
+    return None, None
+
+
+async def fetch_soundcloud_client_id(session=None):
     """ Get soundlcoud client id """
-    url = random.choice(util.SCRAPE_URLS)
-    page_text = await get_resource(url)
-    script_urls = util.find_script_urls(page_text.decode())
-    results = await asyncio.gather(*[get_resource(u) for u in script_urls])
-    script_text = "".join([r.decode() for r in results])
-    return util.find_client_id(script_text)
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await fetch_soundcloud_client_id(session)
+    client_id, _ = await discover_client_id(session)
+    return client_id
 
 __all__ = [
     "Track",
     "Playlist",
-    "SoundcloudAPI"
+    "SoundcloudAPI",
+    "tag_files",
 ]
 
+INTERNAL_ATTRIBUTES = ('client', 'ready', '_obj')
+
 def eprint(*values, **kwargs):
     """ Stderr print """
     print(*values, file=sys.stderr, **kwargs)
 
-async def get_obj_from(url):
-    """ Get a json object from a url """
+async def get_obj_from(url, session=None):
+    """ Get a json object from a url
+
+    Raises `sclib.sync.APIError` when the request fails or the response is not json.
+    """
+    if session is None:
+        async with aiohttp.ClientSession() as session:
+            return await get_obj_from(url, session)
     try:
-        return json.loads(await get_resource(url))
-    except Exception as exc:  # pylint: disable=broad-except
-        eprint(type(exc), str(exc))
-        return False
+        async with session.get(url) as response:
+            response.raise_for_status()
+            return get_json_backend().loads(await response.read())
+    except aiohttp.ClientResponseError as exc:
+        raise sync.APIError.for_status(url, exc.status, exc.message) from exc
+    except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+        raise sync.APIError(url, None, str(exc)) from exc
+
+
 
 
+async def tag_files(tracks_and_paths, executor=None):
+    """ Tag finished downloads, given as (track, path) pairs, in one batch
+
+    Artwork is fetched concurrently and the files are tagged on `executor`, e.g. a
+    `ProcessPoolExecutor` kept apart from the pool serving downloads.
+    """
+    async def tag(track, path):
+        await track.tag_file(path, await track.get_album_artwork(), executor)
+    await asyncio.gather(*[tag(track, path) for track, path in tracks_and_paths])
+
+
+class SingleFlight:  # pylint: disable=too-few-public-methods
+    """ Coalesce concurrent coroutines with the same key
+
+    While a call for a key is running, other tasks asking for the same key await it
+    and get its result (or exception) instead of making their own call.  A waiter
+    that is cancelled does not cancel the shared call.
+    """
+
+    def __init__(self):
+        self._calls = {}  # key -> task of the running call
+
+    async def do(self, key, func, *args):
+        """ Await func(*args) unless a call for `key` is already running """
+        call = self._calls.get(key)
+        if call is None or call.get_loop() is not asyncio.get_running_loop():
+            call = asyncio.ensure_future(func(*args))
+            self._calls[key] = call
+            call.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(call)
 
 
 async def embed_artwork(audio:mutagen.File, artwork_url):
@@ -66,142 +183,757 @@ async def embed_artwork(audio:mutagen.File, artwork_url):
 
 
 
-class SoundcloudAPI(sync.SoundcloudAPI):
-    """ Asynchronous Soundcloud API Client """
+class SoundcloudAPI(sync.SoundcloudAPI):  # pylint: disable=too-many-instance-attributes,too-many-public-methods
+    """ Asynchronous Soundcloud API Client
+
+    The client owns one pooled `aiohttp.ClientSession` that is shared by every request
+    it makes and by the tracks and playlists it resolves, so connections, TLS sessions
+    and DNS lookups are reused.  Close it with `await api.close()` or use the client as
+    an async context manager.  Pass `session` to share an externally managed session
+    instead; it is not closed by the client.
+
+    Responses of at least JSON_OFFLOAD_SIZE bytes are decoded on `json_executor` when
+    one is given.  The decoders hold the GIL, so use a `ProcessPoolExecutor`: the loop
+    then only unpickles the result, which takes about half as long as decoding it.
+    """
+    __slots__ = [
+        'connector_options',
+        '_session',
+        '_session_loop',
+        '_owns_session',
+        'tag_executor',
+        'json_executor',
+    ]
+    JSON_OFFLOAD_SIZE = 1024 * 1024
+
+    def __init__(self, client_id=None, *, session=None, limit=100, limit_per_host=0,  # pylint: disable=too-many-arguments,too-many-locals
+                 keepalive_timeout=30, ttl_dns_cache=300, credential_cache=None, resolve_cache=None,
+                 artwork_cache=None, tag_executor=None, rate_limiter=None, retry_policy=None, redirect_cache=None,
+                 compact=False, json_backend=None, json_executor=None):
+        super().__init__(
+            client_id, credential_cache=credential_cache, resolve_cache=resolve_cache, artwork_cache=artwork_cache,
+            rate_limiter=rate_limiter, retry_policy=retry_policy, redirect_cache=redirect_cache, compact=compact,
+            json_backend=json_backend
+        )
+        self.tag_executor = tag_executor  # None is the loop's default thread pool
+        self.json_executor = json_executor  # None decodes on the loop
+        self.connector_options = {
+            'limit': limit,
+            'limit_per_host': limit_per_host,
+            'keepalive_timeout': keepalive_timeout,
+            'ttl_dns_cache': ttl_dns_cache,
+        }
+        self._session = session
+        self._session_loop = None
+        self._owns_session = session is None
+        self.inflight = SingleFlight()
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """ The shared http session, created on first use
+
+        A session the client creates is bound to the running event loop.  Release it
+        with `await api.close()` or by using the client in `async with` before the loop
+        ends.  A client used from a new event loop (e.g. by another `asyncio.run`)
+        gets a new session, with a ResourceWarning if the old one was left open.
+        """
+        loop = asyncio.get_running_loop()
+        if self._session is None or self._owns_session and self._session_loop is not loop:
+            if self._session is not None and not self._session.closed:
+                warnings.warn(
+                    'SoundcloudAPI used from a new event loop while its session of another loop is open, '
+                    'call "await api.close()" before the loop ends',
+                    ResourceWarning, stacklevel=2,
+                )
+            connector = aiohttp.TCPConnector(use_dns_cache=True, **self.connector_options)
+            self._session = aiohttp.ClientSession(connector=connector)
+            self._session_loop = loop
+        return self._session
+
+    def make_pool(self):
+        """ No sync connection pool, requests go through the aiohttp session """
+        return None
+
+    async def close(self):  # pylint: disable=invalid-overridden-method
+        """ Close the http session if this client created it """
+        if self._owns_session and self._session is not None:
+            if self._session_loop is asyncio.get_running_loop():
+                await self._session.close()
+            elif not self._session.closed:
+                warnings.warn(
+                    'SoundcloudAPI.close() called from another event loop than its session\'s, '
+                    'the session can only be closed on its own loop',
+                    ResourceWarning, stacklevel=2,
+                )
+            self._session = None
+
+    def __enter__(self):
+        raise TypeError('use "async with" with the asyncio SoundcloudAPI')
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def get_resource(self, url) -> bytes:
+        """ Get a resource using the shared session
+
+        Requests rejected with 401 or 403 are retried once with a new client_id, other
+        error responses raise `aiohttp.ClientResponseError`.
+        """
+        client_id = self.client_id
+        try:
+            return await self.request_with_retries(url)
+        except aiohttp.ClientResponseError as exc:
+            if exc.status not in sync.AUTH_ERROR_CODES or not self.uses_client_id(url, client_id):
+                raise
+        await self.refresh_credentials(client_id)
+        url = url.replace(f'client_id={client_id}', f'client_id={self.client_id}')
+        return await self.request_with_retries(url)
+
+    async def request_with_retries(self, url) -> bytes:  # pylint: disable=invalid-overridden-method,arguments-differ
+        """ Get a resource, retrying 429, 5xx and connection errors following retry_policy
+
+        Requests carrying a client_id first wait for the rate limiter.
+        """
+        async with await self.open_with_retries(url) as response:
+            return await response.read()
+
+    async def open_with_retries(self, url, headers=None) -> aiohttp.ClientResponse:
+        """ Send a GET request like `request_with_retries` and return the response before reading its body
+
+        Use the response as an async context manager to release its connection.  Error
+        responses that are not retried raise `aiohttp.ClientResponseError`.
+        """
+        limited = 'client_id=' in url
+        for attempt in itertools.count():
+            if limited:
+                await asyncio.sleep(self.rate_limiter.reserve())
+            try:
+                response = await self.session.get(url, headers=headers)
+            except (aiohttp.ClientError, asyncio.TimeoutError):
+                retry_after = None
+                if not self.retry_policy.should_retry(attempt):
+                    raise
+            else:
+                if response.status < 400:
+                    if limited:
+                        self.rate_limiter.succeeded()
+                    return response
+                retry_after = parse_retry_after(response.headers.get('Retry-After'))
+                response.release()
+                if not self.retry_policy.should_retry(attempt, response.status, retry_after):
+                    response.raise_for_status()
+                if limited and response.status == TOO_MANY_REQUESTS:
+                    self.rate_limiter.throttled(retry_after)
+            await asyncio.sleep(self.retry_policy.delay(attempt, retry_after))
+        return None
+
+    async def get_artwork(self, url):  # pylint: disable=invalid-overridden-method
+        """ Get an artwork image through the artwork cache, sharing concurrent downloads
+
+        A cache with a directory is read and written on the default executor.
+        """
+        data = await self._run_cache_io(self.artwork_cache.get, url)
+        if data is None:
+            data = await self.inflight.do(('artwork', url), self._fetch_artwork, url)
+        return data
+
+    async def _fetch_artwork(self, url):  # pylint: disable=invalid-overridden-method
+        data = await self.request_with_retries(url)
+        await self._run_cache_io(self.artwork_cache.set, url, data)
+        return data
+
+    async def _run_cache_io(self, func, *args):
+        if getattr(self.artwork_cache, 'directory', None):
+            return await asyncio.get_running_loop().run_in_executor(None, func, *args)
+        return func(*args)
+
+    async def get_obj_from(self, url):  # pylint: disable=invalid-overridden-method
+        """ Get a json object using the shared session
+
+        Concurrent requests for the same url share one api call.  Raises
+        `sclib.sync.APIError` when the request fails or the response is not json.
+        """
+        return await self.inflight.do(('obj', url), self._get_obj_from, url)
+
+    async def _get_obj_from(self, url):  # pylint: disable=invalid-overridden-method
+        try:
+            return await self.decode_json(await self.get_resource(url))
+        except aiohttp.ClientResponseError as exc:
+            raise sync.APIError.for_status(url, exc.status, exc.message) from exc
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as exc:
+            raise sync.APIError(url, None, str(exc)) from exc
+
+    async def decode_json(self, data):
+        """ Decode an api response, on `json_executor` if it is larger than JSON_OFFLOAD_SIZE """
+        if self.json_executor is not None and len(data) >= self.JSON_OFFLOAD_SIZE:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self.json_executor, self.json_backend.loads, data)
+        return self.json_backend.loads(data)
+
+    async def refresh_credentials(self, stale_client_id=None):  # pylint: disable=invalid-overridden-method
+        """ Drop a rejected client_id from the cache and find a new one """
+        stale_client_id = stale_client_id or self.client_id
+        await self.inflight.do(('refresh', stale_client_id), self._refresh_credentials, stale_client_id)
+
+    async def _refresh_credentials(self, stale_client_id):  # pylint: disable=invalid-overridden-method
+        if self.client_id and self.client_id != stale_client_id:
+            return  # another task already replaced it
+        self.credential_cache.invalidate(stale_client_id)
+        self.client_id = None
+        await self.get_credentials()
 
     async def get_credentials(self):  # pylint: disable=invalid-overridden-method)
         """ Find api credentials  """
-        self.client_id = await fetch_soundcloud_client_id()
-        if self.client_id is None:
+        await self.inflight.do('credentials', self._get_credentials)
+
+    async def _get_credentials(self):  # pylint: disable=invalid-overridden-method
+        cached = self.credential_cache.get()
+        if cached:
+            self.client_id = cached['client_id']
+            return
+        script_url = await self.scrape_credentials()
+        self.credential_cache.set(self.client_id, script_url=script_url)
+
+    async def scrape_credentials(self):  # pylint: disable=invalid-overridden-method
+        """ Find a client_id in the scripts of a soundcloud page """
+        hint = (self.credential_cache.read() or {}).get('script_url')
+        self.client_id, script_url = await discover_client_id(self.session, hint)
+        if not self.client_id:
             raise RuntimeError(
                 'ScLib could not automatically find a public client id. '
                 'This means Soundcloud has changed where the public client id is located. '
                 'Please report this to the package author.'
             )
+        return script_url
+
+    async def resolve(self, url, hydrate=True):  # pylint: disable=invalid-overridden-method
+        """ Resolve an api url to a soundcloud object
+
+        Playlists are fully hydrated unless `hydrate` is False, in which case their
+        tracks are fetched while iterating over the playlist.
+        """
+        if not self.client_id:
+            await self.get_credentials()
 
-    async def resolve(self, url):  # pylint: disable=invalid-overridden-method
-        """ Resolve an api url to a soundcloud object """
+        obj = self.resolve_cache.get(url) if self.resolve_cache else None
+        if obj is None:
+            obj = await self.resolve_obj(url)
+        return await self.from_obj(obj, hydrate)
+
+    async def resolve_obj(self, url):  # pylint: disable=invalid-overridden-method
+        """ Get the raw api object for a url, storing it in the resolve cache """
+        resolved_url = await self.resolve_redirect(url)
+        obj = self.resolve_cache.get(resolved_url) if self.resolve_cache and resolved_url != url else None
+        if obj is None:
+            full_url = self.RESOLVE_URL.format(url=resolved_url, client_id=self.client_id) + "&app_version=1499347238"
+            obj = await self.get_obj_from(full_url)
+        if obj and self.resolve_cache:
+            self.resolve_cache.set(url, obj)
+            if resolved_url != url:
+                self.resolve_cache.set(resolved_url, obj)
+        return obj
+
+    async def resolve_redirect(self, url):  # pylint: disable=invalid-overridden-method
+        """ Get the soundcloud url a short or share link redirects to, following HEAD redirects """
+        if re.match(util.SC_TRACK_RESOLVE_REGEX, url):
+            return url
+        target = self.redirect_cache.get(url)
+        if target is None:
+            target = await self.inflight.do(('redirect', url), self._follow_redirects, url)
+            self.redirect_cache.set(url, target)
+        return target
+
+    async def _follow_redirects(self, url):  # pylint: disable=invalid-overridden-method
+        async with self.session.head(url, allow_redirects=True) as response:
+            if response.status not in sync.HEAD_NOT_ALLOWED_CODES:
+                response.raise_for_status()
+                return str(response.url)
+        async with self.session.get(url) as response:  # only the headers are read
+            response.raise_for_status()
+            return str(response.url)
+
+    async def resolve_many(self, urls, concurrency=None, hydrate=True):  # pylint: disable=invalid-overridden-method
+        """ Resolve many urls with up to `concurrency` at once
+
+        Returns a ResolveResult per url in the order of `urls`; a url that could not be
+        resolved has its exception as `error`.  Repeated urls are resolved once.
+        """
         if not self.client_id:
             await self.get_credentials()
+        unique_urls = list(dict.fromkeys(urls))
+        semaphore = asyncio.Semaphore(concurrency or self.RESOLVE_CONCURRENCY)
+
+        async def resolve(url):
+            async with semaphore:
+                try:
+                    return sync.ResolveResult(url, await self.resolve(url, hydrate), None)
+                except Exception as exc:  # pylint: disable=broad-except
+                    return sync.ResolveResult(url, None, exc)
 
-        if not re.match(util.SC_TRACK_RESOLVE_REGEX, url):
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    url = str(response.real_url)
+        results = dict(zip(unique_urls, await asyncio.gather(*map(resolve, unique_urls))))
+        return [results[url] for url in urls]
 
-        full_url = f"https://api-v2.soundcloud.com/resolve?url={url}&client_id={self.client_id}&app_version=1499347238"
-        obj = await get_obj_from(full_url)
+    async def from_obj(self, obj, hydrate=True):  # pylint: disable=invalid-overridden-method
+        """ Build a Track or Playlist from a raw api object """
         if obj['kind'] == 'track':
             return Track(obj=obj, client=self)
 
         if obj['kind'] in ('playlist', 'system-playlist'):
             playlist = Playlist(obj=obj, client=self)
-            await playlist.clean_attributes()
+            if hydrate:
+                await playlist.clean_attributes()
             return playlist
-
-    async def get_tracks(self, *track_ids):  # pylint: disable=invalid-overridden-method
-        """ Get a list of tracks from a list of ids """
+        return None
+
+    async def iter_pages(self, url, read_ahead=None, last_page=None):  # pylint: disable=invalid-overridden-method
+        """ Yield the collections of a cursor paginated api url, fetching up to `read_ahead` pages ahead """
+        slots = asyncio.Semaphore(1 + (read_ahead or self.PAGE_READ_AHEAD))
+        pages = asyncio.Queue()
+
+        async def fetch_pages():
+            next_url = url
+            try:
+                while next_url:
+                    await slots.acquire()
+                    obj = await self.get_obj_from(next_url)
+                    next_url, collection = self._next_page(obj, last_page, self.client_id)
+                    pages.put_nowait(collection)
+            except Exception as exc:  # pylint: disable=broad-except
+                pages.put_nowait(exc)
+            finally:
+                pages.put_nowait(None)
+
+        producer = asyncio.ensure_future(fetch_pages())
+        try:
+            while True:
+                page = await pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+                slots.release()
+        finally:
+            producer.cancel()
+
+    async def search(self, query, limit=None, page_size=None):  # pylint: disable=invalid-overridden-method
+        """ Search for tracks and playlists, prefetching the next page while the current one is consumed """
         if not self.client_id:
             await self.get_credentials()
+        url = self.SEARCH_URL.format(
+            query=util.quote_query(query),
+            client_id=self.client_id,
+            limit=page_size or self.SEARCH_PAGE_SIZE,
+            offset=0
+        )
+        count = 0
+        pages = self.iter_pages(url, 1, util.page_limit(limit))
+        try:
+            async for collection in pages:
+                async for resource in self._build_resources(collection):
+                    yield resource
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+        finally:
+            await pages.aclose()
+
+    async def _build_resources(self, collection):  # pylint: disable=invalid-overridden-method
+        for obj in collection:
+            resource = await self.from_obj(obj, hydrate=False)
+            if resource is not None:
+                yield resource
+
+    async def _iter_user_collection(self, url_template, user_id, since, read_ahead):  # pylint: disable=invalid-overridden-method
+        if not self.client_id:
+            await self.get_credentials()
+        url = url_template.format(user_id=user_id, client_id=self.client_id, limit=self.COLLECTION_PAGE_SIZE)
+        cutoff = util.parse_datetime(since) if since else None
+        pages = self.iter_pages(url, read_ahead, util.page_cutoff(cutoff))
+        try:
+            async for collection in pages:
+                entries = self._collection_entries(collection, cutoff)
+                objs = await self._hydrate_stubs(entries)
+                async for resource in self._build_resources(objs):
+                    yield resource
+                if len(entries) < len(collection):
+                    return  # reached the cutoff
+        finally:
+            await pages.aclose()
+
+    async def _hydrate_stubs(self, objs):  # pylint: disable=invalid-overridden-method
+        stub_ids = self._stub_ids(objs)
+        if not stub_ids:
+            return objs
+        tracks = (await self.fetch_tracks(*stub_ids)).tracks
+        return self._merge_hydrated(objs, tracks)
+
+    async def iter_track_batches(self, *track_ids, concurrency=None):  # pylint: disable=invalid-overridden-method
+        """ Fetch tracks by id, yielding a TracksResult per batch as soon as it arrives
+
+        All batches are planned up front and fetched by up to `concurrency` tasks.
+        Batches are yielded in order, a batch that arrives early waits for the ones
+        before it.  Duplicate ids are only fetched once.
+        """
+        if not track_ids:
+            return
+        if not self.client_id:
+            await self.get_credentials()
+
+        unique_ids = list(dict.fromkeys(track_ids))
+        batches = self._plan_track_batches(unique_ids)
+        semaphore = asyncio.Semaphore(concurrency or len(batches))
+
+        async def fetch(url):
+            async with semaphore:
+                return await self.get_obj_from(url)
+
+        pending = [asyncio.ensure_future(fetch(url)) for _, url in batches]
+        try:
+            for (batch_ids, _), response in zip(batches, pending):
+                yield self._collect_tracks(batch_ids, [await self._batch_result(response)])
+        finally:
+            for response in pending:
+                response.cancel()
+
+    @staticmethod
+    async def _batch_result(result):  # pylint: disable=invalid-overridden-method
+        try:
+            return await result
+        except sync.APIError as exc:
+            util.eprint(f'[get_tracks]: {exc}')
+            return None
+
+    async def fetch_tracks(self, *track_ids, concurrency=None):  # pylint: disable=invalid-overridden-method
+        """ Get tracks by id in the order of first appearance, skipping duplicates
+
+        Returns a TracksResult of the tracks found and the ids that were not.
+        """
+        result = sync.TracksResult([], [])
+        async for batch in self.iter_track_batches(*track_ids, concurrency=concurrency):
+            result.tracks.extend(batch.tracks)
+            result.missing.extend(batch.missing)
+        return result
 
-        loop = asyncio.get_event_loop()
-        tasks = []
-        for url in self._format_get_tracks_urls(track_ids):
-            task = loop.create_task(get_obj_from(url))
-            tasks.append(task)
+    async def get_tracks(self, *track_ids, concurrency=None):  # pylint: disable=invalid-overridden-method
+        """ Get a list of tracks from a list of ids """
+        result = await self.fetch_tracks(*track_ids, concurrency=concurrency)
+        if result.missing:
+            eprint(f'[get_tracks]: could not fetch {len(result.missing)} tracks: {result.missing}')
+        return result.tracks
+
+
+def to_dict(resource, local_attributes) -> dict:
+    """ Get the fields of a Track or Playlist, without reading the unused fields of a compact one
 
-        response = await asyncio.gather(*tasks)
-        tracks = list(itertools.chain.from_iterable(response))
-        tracks = sorted(tracks, key=lambda x: track_ids.index(x['id']))
-        return tracks
+    `local_attributes` are the attributes that may differ from the api object.
+    """
+    obj = resource._obj  # pylint: disable=protected-access
+    if obj is None:
+        return {attr: getattr(resource, attr) for attr in resource.__slots__ if attr not in INTERNAL_ATTRIBUTES}
+    return {**obj, **{attr: getattr(resource, attr) for attr in local_attributes}}
 
 
 class Track(sync.Track):
     """ Asynchronous track object """
 
-    async def write_mp3_to(self, file):  # pylint: disable=invalid-overridden-method)
-        """ Write the mp3 representation of this track to a file object """
+    async def write_mp3_to(self, file, chunk_size=None, connections=1, tag=True):  # pylint: disable=invalid-overridden-method)
+        """ Write the mp3 representation of this track to a file object
+
+        The stream is looked up first, so nothing is written for a track that cannot be
+        downloaded.  The ID3 tag is rendered on the client's `tag_executor`, written
+        first and the audio streamed after it.  Pass `tag=False` to write the bare audio,
+        e.g. to tag many files later with `tag_files`.  With `connections` > 1 a long
+        stream is fetched as concurrent byte ranges.
+        """
         try:
+            loop = asyncio.get_running_loop()
+            stream_url, segment_urls = None, None
+            if self.has_transcoding('progressive'):
+                stream_url = await self.get_stream_url()
+                if not stream_url:
+                    raise sync.APIError(self.get_prog_url(), message='no stream url')
+            else:
+                segment_urls = await self.get_hls_segment_urls()
+            header, trailer = b'', b''
+            if tag:
+                header, trailer = await self.build_id3_tags(await self.get_album_artwork())
             file.seek(0)
-            stream_url = await self.get_stream_url()
-            track_mp3_bytes = await get_resource(stream_url)
-            file.write(track_mp3_bytes)
+            await loop.run_in_executor(None, file.write, header)
+            if stream_url:
+                ranges = None
+                if connections > 1 and util.supports_positional_writes(file):
+                    ranges = await self.get_stream_ranges(stream_url, connections)
+                if ranges:
+                    await self.write_ranges_to(file, stream_url, ranges, chunk_size)
+                else:
+                    async with await self.client.open_with_retries(stream_url) as response:
+                        await write_response_to(response, file, chunk_size or self.DOWNLOAD_CHUNK_SIZE)
+            else:
+                await self.write_hls_to(file, segment_urls=segment_urls)
+            await loop.run_in_executor(None, file.write, trailer)
+            file.truncate()
             file.seek(0)
-
-            album_artwork = None
-            if self.artwork_url:
-                album_artwork = await get_resource(
-                    util.get_large_artwork_url(
-                        self.artwork_url
-                    )
-                )
-
-            self.write_track_id3(file, album_artwork)
+            self.ready = tag
         except (TypeError, ValueError) as exc:
             util.eprint('File object passed to "write_mp3_to" must be opened in read/write binary ("wb+") mode')
             util.eprint(exc)
             raise exc
 
+    async def build_id3_tags(self, album_artwork:bytes = None):  # pylint: disable=invalid-overridden-method
+        """ Render the ID3v2 header and ID3v1 trailer on the client's tag executor """
+        return await self._run_tagging(
+            None, sync.render_id3_tags, self.id3_frames(album_artwork), self.ID3_PADDING
+        )
+
+    async def tag_file(self, path, album_artwork:bytes = None, executor=None):
+        """ Tag an untagged mp3 file on `executor`, or the client's tag executor """
+        await self._run_tagging(executor, sync.add_id3_tags, os.fspath(path), self.id3_frames(album_artwork))
+        self.ready = True
+
+    async def _run_tagging(self, executor, func, *args):
+        # module level functions and plain frames so a ProcessPoolExecutor works too
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(executor or self.client.tag_executor, func, *args)
+
+    async def get_stream_ranges(self, stream_url, connections):  # pylint: disable=invalid-overridden-method
+        """ Split a stream into byte ranges, or None if the server does not support them """
+        async with await self.client.open_with_retries(stream_url, {'Range': 'bytes=0-0'}) as response:
+            content_range = util.parse_content_range(response.headers.get('Content-Range'))
+            if response.status != 206 or not content_range or not content_range[2]:
+                return None
+            await response.read()
+        return util.split_ranges(content_range[2], connections, self.MIN_RANGE_SIZE)
+
+    async def write_ranges_to(self, file, stream_url, ranges, chunk_size=None):  # pylint: disable=invalid-overridden-method
+        """ Fetch byte ranges of a stream concurrently, writing each at its offset from the file position """
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(None, file.flush)
+        base = file.tell()
+        end = base + ranges[-1][1] + 1
+        await loop.run_in_executor(None, file.truncate, end)
+        parts = [
+            asyncio.ensure_future(self._write_range(file.fileno(), stream_url, byte_range, base, chunk_size))
+            for byte_range in ranges
+        ]
+        try:
+            await asyncio.gather(*parts)
+        finally:
+            for part in parts:
+                part.cancel()
+        file.seek(end)
+
+    async def _write_range(self, fileno, stream_url, byte_range, base, chunk_size):  # pylint: disable=too-many-arguments,invalid-overridden-method
+        loop = asyncio.get_running_loop()
+        start, end = byte_range
+        offset = base + start
+        async with await self.client.open_with_retries(stream_url, {'Range': f'bytes={start}-{end}'}) as response:
+            if response.status != 206:
+                raise aiohttp.ClientResponseError(
+                    response.request_info, (), status=response.status, message='Range request not honored'
+                )
+            async for chunk in response.content.iter_chunked(chunk_size or self.DOWNLOAD_CHUNK_SIZE):
+                await loop.run_in_executor(None, util.pwrite_all, fileno, chunk, offset)
+                offset += len(chunk)
+        if offset != base + end + 1:
+            raise aiohttp.ClientPayloadError(f'Incomplete range {start}-{end} of {stream_url}')
+
+    async def download_to(self, path, chunk_size=None):  # pylint: disable=invalid-overridden-method
+        """ Download the track to a path, resuming an interrupted download
+
+        The ID3 header is written before the stream and the trailer after it, like in
+        `write_mp3_to`, so the finished file is not rewritten to tag it.
+        """
+        loop = asyncio.get_running_loop()
+        partial = PartialDownload(path)
+        if not self.has_transcoding('progressive'):
+            with open(partial.part_path, 'wb+') as file:
+                await self.write_mp3_to(file)
+            partial.commit()
+            return path
+        stream_url, response = await self._open_resumable_stream(partial)
+        try:
+            async with response:
+                header, trailer = await self.build_id3_tags(await self.get_album_artwork())
+                await loop.run_in_executor(None, partial.start, response.status, response.headers, stream_url, header)
+                async for chunk in response.content.iter_chunked(chunk_size or self.DOWNLOAD_CHUNK_SIZE):
+                    await loop.run_in_executor(None, partial.write, chunk)
+        except BaseException:
+            partial.close()
+            raise
+        await loop.run_in_executor(None, partial.finish, trailer)
+        self.ready = True
+        partial.commit()
+        return path
+
+    async def _open_resumable_stream(self, partial):  # pylint: disable=invalid-overridden-method
+        stream_url = partial.stream_url or await self.get_stream_url()
+        try:
+            return stream_url, await self.client.open_with_retries(stream_url, partial.request_headers())
+        except aiohttp.ClientResponseError as exc:
+            if exc.status == RANGE_NOT_SATISFIABLE:
+                partial.reset()
+            elif exc.status in EXPIRED_URL_CODES and partial.stream_url:
+                stream_url = await self.get_stream_url()
+            else:
+                raise
+        return stream_url, await self.client.open_with_retries(stream_url, partial.request_headers())
+
+    async def get_album_artwork(self):  # pylint: disable=invalid-overridden-method
+        """ Get the large artwork image, if the track has one """
+        if not self.artwork_url:
+            return None
+        return await self.client.get_artwork(util.get_large_artwork_url(self.artwork_url))
+
     async def get_stream_url(self):  # pylint: disable=invalid-overridden-method
         """ get the stream url for this track """
         prog_url = self.get_prog_url()
-        stream_response = await get_obj_from(prog_url)
+        stream_response = await self.client.get_obj_from(prog_url)
         try:
             return stream_response['url']
         except Exception as exc:  # pylint: disable=broad-except)
             eprint(exc)
             return None
 
+    async def write_hls_to(self, file, window=None, segment_urls=None):  # pylint: disable=invalid-overridden-method
+        """ Assemble the HLS mp3 stream into a file, fetching up to `window` segments ahead """
+        segments = iter(await self.get_hls_segment_urls() if segment_urls is None else segment_urls)
+        window = window or self.HLS_WINDOW
+        loop = asyncio.get_running_loop()
+        pending = collections.deque(
+            asyncio.ensure_future(self.client.get_resource(url)) for url in itertools.islice(segments, window)
+        )
+        try:
+            while pending:
+                data = await pending.popleft()
+                for url in itertools.islice(segments, 1):
+                    pending.append(asyncio.ensure_future(self.client.get_resource(url)))
+                await loop.run_in_executor(None, file.write, data)
+        finally:
+            for segment in pending:
+                segment.cancel()
+
+    async def get_hls_segment_urls(self):  # pylint: disable=invalid-overridden-method
+        """ Get the segment urls of the HLS mp3 stream """
+        playlist_url = (await self.client.get_obj_from(self.get_hls_url()))['url']
+        playlist = (await self.client.get_resource(playlist_url)).decode('utf-8')
+        return self._parse_hls_playlist(playlist, playlist_url)
+
     def to_dict(self) -> dict:
-        """ Conver this track object to a dict """
-        ignore_attributes = ['client', 'ready']
-        track_dict = {}
-        for attr in set(self.__slots__):
-            if attr not in ignore_attributes:
-                track_dict[attr] = getattr(self, attr)
+        """ Conver this track object to a dict that `Track(obj=...)` turns back into this track
 
-        return track_dict
+        A compact track shares the api object's values instead of reading every attribute.
+        """
+        return to_dict(self, ('artist', 'title', 'album', 'track_no'))
 
 
 
 class Playlist(sync.Playlist):
     """ Playlist """
 
-    RESOLVE_THRESHOLD = 100
-
-    async def clean_attributes(self): # pylint: disable=invalid-overridden-method
+    async def clean_attributes(self, concurrency=None): # pylint: disable=invalid-overridden-method
         if self.ready:
             return
-        self.ready = True
-
-        track_objects = []  # type: [Track] # all completed track objects
-        incomplete_track_ids = []   # tracks that do not have metadata
+        async for _ in self.iter_tracks(concurrency):
+            pass
 
-        while self.tracks and 'title' in self.tracks[0]:       # remove completed track objects
-            track_objects.append(Track(obj=self.tracks.pop(0), client=self.client))
+    async def iter_tracks(self, concurrency=None):  # pylint: disable=invalid-overridden-method
+        """ Yield tracks in playlist order while the playlist is being hydrated
 
-        while self.tracks:   # while built tracks are less than all tracks
-            incomplete_track_ids.append(self.tracks.pop(0)['id'])
-            if len(incomplete_track_ids) == self.RESOLVE_THRESHOLD or not self.tracks:
-                new_tracks = await self.client.get_tracks(*incomplete_track_ids)
-                track_objects.extend([Track(obj=t, client=self.client) for t in new_tracks])
-                incomplete_track_ids.clear()
+        Tracks that already have metadata are yielded at once, the others as soon as
+        their batch arrives.  Stubs that could not be fetched are skipped.
+        """
+        async for _, _, track in self._iter_entries(concurrency):
+            if track:
+                yield track
 
-        for track in track_objects:
-            if track not in self.tracks:
-                self.tracks.append(track)
+    async def _iter_entries(self, concurrency=None):  # pylint: disable=invalid-overridden-method
+        """ Yield (track_no, stub, track) for every entry of the playlist, track is None if it could not be fetched """
+        if self.ready:
+            for track_no, track in enumerate(self.tracks, start=1):
+                yield track_no, track, track
+            return
+        batches = self.client.iter_track_batches(
+            *self._incomplete_track_ids(),
+            concurrency=concurrency or self.HYDRATE_CONCURRENCY
+        )
+        arrived = {}
+        hydrated = []
+        try:
+            for track_no, stub in enumerate(self.tracks, start=1):
+                while not self._has_arrived(stub, arrived):
+                    try:
+                        batch = await batches.__anext__()  # pylint: disable=unnecessary-dunder-call
+                    except StopAsyncIteration:
+                        break
+                    self._add_batch(arrived, batch)
+                track = self._build_track(stub, arrived, Track)
+                if track:
+                    hydrated.append(track)
+                yield track_no, stub, track
+        finally:
+            await batches.aclose()
+        self.tracks = hydrated
+        self.ready = True
 
-    async def __aiter__(self):
-        await self.clean_attributes()
-        for track in self.tracks:
-            yield track
+    def __aiter__(self):
+        return self.iter_tracks()
+
+    async def download_all(self, target, concurrency=None):  # pylint: disable=invalid-overridden-method
+        """ Download every track of the playlist with up to `concurrency` tasks
+
+        `target` is a directory to write `artist - title.mp3` files to, or a callable
+        that takes a track and returns a file object opened in "wb+" mode, which is
+        closed once the track is written.  Tracks of the playlist with the same file
+        name get `artist - title (2).mp3` and so on.  Tracks get the playlist title as
+        album and their position in the playlist as track number.  Downloads start
+        while the rest of the playlist is still being hydrated, and are cancelled if
+        hydrating fails.  Returns a DownloadResult per entry of the playlist in order;
+        a track that failed has its exception as `error`, and a stub that could not be
+        fetched is returned as its api object with an APIError.
+        """
+        semaphore = asyncio.Semaphore(concurrency or self.DOWNLOAD_CONCURRENCY)
+        taken = set()
+
+        async def download(track_no, track, filename):
+            async with semaphore:
+                return await self._download_track(target, track_no, track, filename)
+
+        downloads = []
+        try:
+            async for track_no, stub, track in self._iter_entries():
+                if track is None:
+                    downloads.append(self._unfetched_result(stub))
+                    continue
+                filename = self._unique_filename(track, taken)
+                downloads.append(asyncio.ensure_future(download(track_no, track, filename)))
+        except BaseException:
+            tasks = [download for download in downloads if isinstance(download, asyncio.Future)]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            raise
+        await asyncio.gather(*[download for download in downloads if isinstance(download, asyncio.Future)])
+        return [download.result() if isinstance(download, asyncio.Future) else download for download in downloads]
+
+    async def _download_track(self, target, track_no, track, filename):  # pylint: disable=invalid-overridden-method
+        track.album = self.title
+        track.track_no = track_no
+        path = None
+        try:
+            file, path = self._open_target(target, track, filename)
+            with file:
+                await track.write_mp3_to(file)
+            return sync.DownloadResult(track, path, None)
+        except Exception as exc:  # pylint: disable=broad-except
+            self._discard_target(target, path)
+            return sync.DownloadResult(track, path, exc)
 
     def to_dict(self):
-        """ convert this object to a dict """
-        ignore_attributes = ['client', 'ready']
-        playlist_dict = {}
-        for attr in set(self.__slots__):
-            if attr not in ignore_attributes:
-                playlist_dict[attr] = getattr(attr)
-
+        """ convert this object to a dict, with its hydrated tracks as dicts """
+        playlist_dict = to_dict(self, ('title',))
+        playlist_dict['tracks'] = [track.to_dict() if isinstance(track, Track) else track for track in self.tracks]
         return playlist_dict
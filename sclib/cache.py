@@ -0,0 +1,279 @@
+""" Caches shared between clients and processes """
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from . import util
+
+CREDENTIAL_TTL = 24 * 60 * 60
+RESOLVE_TTL = 60 * 60
+REDIRECT_TTL = 24 * 60 * 60
+ARTWORK_MAX_BYTES = 32 * 1024 * 1024
+
+
+def default_cache_dir():
+    """ Per-user cache directory for sclib """
+    base = os.environ.get('XDG_CACHE_HOME') or os.path.join(os.path.expanduser('~'), '.cache')
+    return os.path.join(base, 'sclib')
+
+
+class CredentialCache:
+    """ Keeps a scraped client_id in memory for `ttl` seconds
+
+    Subclass and override `read`, `write` and `clear` to keep it somewhere else.
+    """
+
+    def __init__(self, ttl=CREDENTIAL_TTL):
+        self.ttl = ttl
+        self._entry = None
+
+    def read(self):
+        """ Get the stored entry, fresh or not """
+        return self._entry
+
+    def write(self, entry):
+        """ Store an entry """
+        self._entry = entry
+
+    def clear(self):
+        """ Remove the stored entry """
+        self._entry = None
+
+    def get(self):
+        """ Get the cached entry if it is younger than ttl """
+        entry = self.read()
+        if entry and entry.get('client_id') and time.time() - entry.get('timestamp', 0) < self.ttl:
+            return entry
+        return None
+
+    def set(self, client_id, **extra):
+        """ Cache a client_id """
+        self.write({'client_id': client_id, 'timestamp': time.time(), **extra})
+
+    def invalidate(self, client_id=None):
+        """ Forget the cached client_id
+
+        When `client_id` is given the entry is only dropped if it still holds that id,
+        so a fresh id stored by another worker in the meantime is kept.  Hints about
+        where the id was found are kept for the next scrape.
+        """
+        entry = self.read()
+        if entry and (client_id is None or entry.get('client_id') == client_id):
+            entry.pop('client_id', None)
+            self.write(entry)
+
+
+class FileCredentialCache(CredentialCache):
+    """ Credential cache kept in a json file so every process on a host can share it """
+
+    def __init__(self, path=None, ttl=CREDENTIAL_TTL):
+        super().__init__(ttl)
+        self.path = path or os.path.join(default_cache_dir(), 'credentials.json')
+
+    def read(self):
+        try:
+            with open(self.path, encoding='utf-8') as file:
+                return json.load(file)
+        except (OSError, ValueError):
+            return None
+
+    def write(self, entry):
+        directory = os.path.dirname(self.path) or '.'
+        try:
+            os.makedirs(directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            with os.fdopen(handle, 'w', encoding='utf-8') as file:
+                json.dump(entry, file)
+            os.replace(temp_path, self.path)  # atomic, readers never see a partial file
+        except OSError:
+            pass  # an unwritable cache only costs a re-scrape
+
+    def clear(self):
+        try:
+            os.remove(self.path)
+        except OSError:
+            pass
+
+
+class CacheBackend:
+    """ Key/value store behind the url caches
+
+    Implement `get`, `set`, `delete` and `clear` over redis, memcached or similar to
+    share cached objects between processes.  Values are json serializable.
+    """
+
+    def get(self, key):
+        """ Get a value or None """
+        raise NotImplementedError
+
+    def set(self, key, value):
+        """ Store a value """
+        raise NotImplementedError
+
+    def delete(self, key):
+        """ Remove a value """
+        raise NotImplementedError
+
+    def clear(self):
+        """ Remove all values """
+        raise NotImplementedError
+
+
+class LRUCache(CacheBackend):
+    """ Thread-safe in-memory cache that keeps at most `maxsize` entries for `ttl` seconds """
+
+    def __init__(self, maxsize=1024, ttl=None):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # key -> (expires_at, value)
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            expires_at, value = item
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        expires_at = time.monotonic() + self.ttl if self.ttl is not None else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class ResolveCache:
+    """ Raw resolved api objects keyed by canonical soundcloud url
+
+    Tracks and playlists can be rebuilt from a hit without any network call.
+    """
+
+    def __init__(self, maxsize=1024, ttl=RESOLVE_TTL, backend=None):
+        self.backend = backend if backend is not None else LRUCache(maxsize, ttl)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, url):
+        """ Get the resolved object for a url """
+        obj = self.backend.get(util.canonical_url(url))
+        if obj is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return obj
+
+    def set(self, url, obj):
+        """ Store the resolved object for a url """
+        self.backend.set(util.canonical_url(url), obj)
+
+
+class RedirectCache:
+    """ Final soundcloud urls of short and share links, keyed by the link
+
+    Redirect targets rarely change, so they are kept longer than resolved objects.
+    """
+
+    def __init__(self, maxsize=4096, ttl=REDIRECT_TTL, backend=None):
+        self.backend = backend if backend is not None else LRUCache(maxsize, ttl)
+
+    def get(self, url):
+        """ Get the url a link redirects to """
+        return self.backend.get(url.strip())
+
+    def set(self, url, target):
+        """ Store the url a link redirects to """
+        self.backend.set(url.strip(), target)
+
+
+class ArtworkCache:
+    """ Artwork images keyed by url, kept in memory and optionally in a directory
+
+    The in-memory copies are evicted least recently used first once they add up to more
+    than `max_bytes`.  With a `directory` each image is also stored in a file named
+    after the sha256 of its url, so other processes and later runs can reuse it.
+    """
+
+    def __init__(self, max_bytes=ARTWORK_MAX_BYTES, directory=None):
+        self.max_bytes = max_bytes
+        self.directory = directory
+        self.size = 0
+        self._lock = threading.Lock()
+        self._data = OrderedDict()  # url -> bytes
+
+    def __len__(self):
+        return len(self._data)
+
+    def _path(self, url):
+        return os.path.join(self.directory, hashlib.sha256(url.encode()).hexdigest())
+
+    def get(self, url):
+        """ Get the image for a url or None """
+        with self._lock:
+            data = self._data.get(url)
+            if data is not None:
+                self._data.move_to_end(url)
+                return data
+        if not self.directory:
+            return None
+        try:
+            with open(self._path(url), 'rb') as file:
+                data = file.read()
+        except OSError:
+            return None
+        self._remember(url, data)
+        return data
+
+    def set(self, url, data):
+        """ Store the image for a url """
+        self._remember(url, data)
+        if self.directory:
+            self._store(url, data)
+
+    def _remember(self, url, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            previous = self._data.pop(url, None)
+            self.size += len(data) - len(previous or b'')
+            self._data[url] = data
+            while self.size > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.size -= len(evicted)
+
+    def _store(self, url, data):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            handle, temp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(handle, 'wb') as file:
+                file.write(data)
+            os.replace(temp_path, self._path(url))
+        except OSError:
+            pass  # an unwritable directory only costs a download
+
+    def clear(self):
+        """ Drop the in-memory images """
+        with self._lock:
+            self._data.clear()
+            self.size = 0
@@ -0,0 +1,60 @@
+""" Json decoders for api responses, the fastest installed one is used by default
+
+Every backend takes the raw response bytes and raises ValueError for invalid json.
+orjson and msgspec parse the bytes directly, the json module decodes them to a str first.
+"""
+import json
+from collections import namedtuple
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+JsonBackend = namedtuple('JsonBackend', ['name', 'loads'])
+
+
+def _msgspec_loads(data):
+    try:
+        return msgspec.json.decode(data)
+    except msgspec.DecodeError as exc:
+        raise ValueError(str(exc)) from exc
+
+
+def _available_backends():
+    backends = []
+    if orjson is not None:
+        backends.append(JsonBackend('orjson', orjson.loads))
+    if msgspec is not None:
+        backends.append(JsonBackend('msgspec', _msgspec_loads))
+    backends.append(JsonBackend('json', json.loads))
+    return {backend.name: backend for backend in backends}
+
+
+BACKENDS = _available_backends()
+DEFAULT_BACKEND = next(iter(BACKENDS.values()))
+
+
+def get_backend(backend=None) -> JsonBackend:
+    """ Get an installed backend by name ('orjson', 'msgspec' or 'json'), the default for None
+
+    A JsonBackend, e.g. wrapping another decoder, is returned as it is.
+    """
+    if backend is None:
+        return DEFAULT_BACKEND
+    if isinstance(backend, JsonBackend):
+        return backend
+    try:
+        return BACKENDS[backend]
+    except KeyError:
+        raise ValueError(f'json backend {backend!r} is not installed, available: {", ".join(BACKENDS)}') from None
+
+
+def loads(data):
+    """ Decode json bytes or str with the default backend """
+    return DEFAULT_BACKEND.loads(data)
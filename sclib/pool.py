@@ -0,0 +1,200 @@
+""" Persistent http connection pool used by the sync client """
+import http.client
+import ssl
+import sys
+import threading
+import time
+from io import BytesIO
+from urllib.error import HTTPError
+from urllib.parse import urljoin, urlsplit
+
+USER_AGENT = f'Python-urllib/{sys.version_info[0]}.{sys.version_info[1]}'
+REDIRECT_CODES = (301, 302, 303, 307, 308)
+MAX_REDIRECTS = 10
+
+
+class PooledResponse:
+    """ A response whose connection is handed back to the pool once the body is read """
+
+    def __init__(self, pool, key, conn, response, url):
+        self._pool = pool
+        self._key = key
+        self._conn = conn
+        self._response = response
+        self.url = url
+        self.status = response.status
+        self.headers = response.headers
+
+    @property
+    def reason(self) -> str:
+        """ Status reason phrase """
+        return self._response.reason
+
+    def read(self, amt=None) -> bytes:
+        """ Read the response body """
+        return self._response.read(amt)
+
+    def readinto(self, buffer) -> int:
+        """ Read the response body into a buffer
+
+        Unlike `http.client`, a connection closed before Content-Length bytes arrived
+        raises `IncompleteRead` instead of looking like the end of the body.
+        """
+        size = self._response.readinto(buffer)
+        if not size and len(buffer) and self._response.length:
+            raise http.client.IncompleteRead(b'', self._response.length)
+        return size
+
+    def geturl(self) -> str:
+        """ Url of the response after redirects """
+        return self.url
+
+    def getheader(self, name, default=None):
+        """ Get a response header """
+        return self._response.getheader(name, default)
+
+    def close(self):
+        """ Return the connection to the pool, or drop it if the body was not consumed """
+        if self._conn is None:
+            return
+        conn, self._conn = self._conn, None
+        if self._response.length == 0:  # bodiless or fully read, let http.client settle it
+            self._response.read()
+        reusable = self._response.isclosed() and not self._response.will_close
+        if not reusable:
+            self._response.close()
+        self._pool.release(self._key, conn, reusable)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ConnectionPool:
+    """ Thread-safe pool of keep-alive http(s) connections, keyed by scheme, host and port
+
+    At most `maxsize` connections per host are open at once; further requests to that
+    host block until one is released.  Connections that sat idle for longer than
+    `idle_timeout` seconds are closed whenever a connection to any host is released,
+    and are never reused.
+    """
+
+    def __init__(self, maxsize=10, idle_timeout=30, timeout=30, ssl_context=None):
+        self.maxsize = maxsize
+        self.idle_timeout = idle_timeout
+        self.timeout = timeout
+        self.ssl_context = ssl_context or ssl.create_default_context()
+        self._lock = threading.Lock()
+        self._idle = {}  # key -> [(connection, released_at)]
+        self._slots = {}  # key -> semaphore bounding open connections
+
+    def _new_connection(self, key):
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout, context=self.ssl_context)
+        return http.client.HTTPConnection(host, port, timeout=self.timeout)
+
+    def acquire(self, key):
+        """ Get an idle connection for `key` or open a new one; returns (connection, reused) """
+        with self._lock:
+            slots = self._slots.setdefault(key, threading.BoundedSemaphore(self.maxsize))
+        slots.acquire()  # pylint: disable=consider-using-with
+        now = time.monotonic()
+        stale = []
+        conn = None
+        with self._lock:
+            idle = self._idle.get(key, [])
+            while idle:
+                candidate, released_at = idle.pop()
+                if now - released_at <= self.idle_timeout:
+                    conn = candidate
+                    break
+                stale.append(candidate)
+        for candidate in stale:
+            candidate.close()
+        if conn is not None:
+            return conn, True
+        return self._new_connection(key), False
+
+    def release(self, key, conn, reusable=True):
+        """ Hand a connection back to the pool, closing connections idle for too long """
+        now = time.monotonic()
+        with self._lock:
+            if reusable:
+                self._idle.setdefault(key, []).append((conn, now))
+            stale = self._take_stale(now)
+        if not reusable:
+            conn.close()
+        for candidate in stale:
+            candidate.close()
+        self._slots[key].release()
+
+    def _take_stale(self, now):
+        """ Remove the connections of every host idle for longer than idle_timeout, with the lock held """
+        stale = []
+        for key, idle in list(self._idle.items()):
+            fresh = [(conn, released_at) for conn, released_at in idle if now - released_at <= self.idle_timeout]
+            stale.extend(conn for conn, released_at in idle if now - released_at > self.idle_timeout)
+            if fresh:
+                self._idle[key] = fresh
+            else:
+                del self._idle[key]
+        return stale
+
+    def clear(self):
+        """ Close all idle connections """
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for connections in idle.values():
+            for conn, _ in connections:
+                conn.close()
+
+    def _send(self, method, url, headers):
+        parts = urlsplit(url)
+        scheme = parts.scheme.lower()
+        port = parts.port or (443 if scheme == 'https' else 80)
+        key = (scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        request_headers = {'User-Agent': USER_AGENT}
+        request_headers.update(headers or {})
+
+        for attempt in range(2):
+            conn, reused = self.acquire(key)
+            try:
+                conn.request(method, path, headers=request_headers)
+                return PooledResponse(self, key, conn, conn.getresponse(), url)
+            except (http.client.RemoteDisconnected, ConnectionError):
+                self.release(key, conn, reusable=False)
+                # an idle keep-alive connection may have been dropped by the server,
+                # retry once on a fresh connection
+                if not reused or attempt:
+                    raise
+            except Exception:
+                self.release(key, conn, reusable=False)
+                raise
+        return None
+
+    def request(self, url, method='GET', headers=None) -> PooledResponse:
+        """ Send a request, following redirects
+
+        Raises `urllib.error.HTTPError` for 4xx and 5xx responses like `urlopen` does.
+        """
+        for _ in range(MAX_REDIRECTS + 1):
+            response = self._send(method, url, headers)
+            if response.status in REDIRECT_CODES and response.getheader('Location'):
+                response.read()
+                response.close()
+                url = urljoin(url, response.getheader('Location'))
+                if response.status == 303:
+                    method = 'GET'
+                continue
+            if response.status >= 400:
+                body = response.read()
+                response.close()
+                raise HTTPError(url, response.status, response.reason, response.headers, BytesIO(body))
+            return response
+        raise HTTPError(url, response.status, 'Too many redirects', response.headers, None)
@@ -0,0 +1,138 @@
+""" On-disk checkpoints for resumable downloads """
+import json
+import os
+import tempfile
+
+from . import util
+
+CHECKPOINT_INTERVAL = 4 * 1024 * 1024
+EXPIRED_URL_CODES = (403, 404, 410)
+RANGE_NOT_SATISFIABLE = 416
+
+
+class PartialDownload:  # pylint: disable=too-many-instance-attributes
+    """ A download written to `<path>.part` with its progress kept in `<path>.part.json`
+
+    The part file holds an ID3 header followed by the stream.  The sidecar records the
+    stream url, where the stream starts in the file, the number of stream bytes safely
+    on disk and the validators (ETag / Last-Modified) of the response, so a restarted
+    download can ask for the rest with a `Range` request.  `finish` appends the ID3v1
+    trailer and `commit` moves the finished file into place.
+    """
+
+    def __init__(self, path, checkpoint_interval=CHECKPOINT_INTERVAL):
+        self.path = os.fspath(path)
+        self.part_path = self.path + '.part'
+        self.state_path = self.part_path + '.json'
+        self.checkpoint_interval = checkpoint_interval
+        self.stream_url = None
+        self.offset = 0
+        self.audio_start = 0
+        self.etag = None
+        self.last_modified = None
+        self.file = None
+        self._checkpointed = 0
+        self.load()
+
+    def load(self):
+        """ Read the sidecar of an interrupted download, if there is a usable one """
+        try:
+            with open(self.state_path, encoding='utf-8') as file:
+                state = json.load(file)
+            part_size = os.path.getsize(self.part_path)
+        except (OSError, ValueError):
+            return
+        if state.get('audio_start', 0) + state.get('offset', 0) > part_size:
+            return
+        if not (state.get('etag') or state.get('last_modified')):
+            return
+        self.stream_url = state.get('stream_url')
+        self.offset = state.get('offset', 0)
+        self.audio_start = state.get('audio_start', 0)
+        self.etag = state.get('etag')
+        self.last_modified = state.get('last_modified')
+
+    def reset(self):
+        """ Forget progress so the download starts from the first byte """
+        self.offset = 0
+        self.etag = None
+        self.last_modified = None
+
+    def request_headers(self) -> dict:
+        """ Headers asking for the stream bytes that are not on disk yet """
+        if not self.offset:
+            return {}
+        return {'Range': f'bytes={self.offset}-', 'If-Range': self.etag or self.last_modified}
+
+    def start(self, status, headers, stream_url, header=b''):
+        """ Open the part file for a response, keeping the bytes on disk only if it is a matching 206
+
+        A new file starts with `header`.  The bytes on disk are only kept if they were
+        written after a header of the same size.
+        """
+        content_range = util.parse_content_range(headers.get('Content-Range'))
+        if status != 206 or not content_range or content_range[0] != self.offset or self.audio_start != len(header):
+            self.offset = 0
+        self.audio_start = len(header)
+        self.stream_url = stream_url
+        self.etag = headers.get('ETag')
+        self.last_modified = headers.get('Last-Modified')
+        self.file = open(self.part_path, 'r+b' if self.offset else 'w+b')  # pylint: disable=consider-using-with
+        if not self.offset:
+            self.file.write(header)
+        self.file.truncate(self.audio_start + self.offset)
+        self.file.seek(self.audio_start + self.offset)
+        self.checkpoint()
+        return self.file
+
+    def write(self, data):
+        """ Append data to the part file, checkpointing every `checkpoint_interval` bytes """
+        size = self.file.write(data)
+        self.offset += size
+        if self.offset - self._checkpointed >= self.checkpoint_interval:
+            self.checkpoint()
+        return size
+
+    def checkpoint(self):
+        """ Flush the part file and record how much of it is valid """
+        self.file.flush()
+        state = {
+            'stream_url': self.stream_url,
+            'offset': self.offset,
+            'audio_start': self.audio_start,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+        }
+        directory = os.path.dirname(self.state_path) or '.'
+        handle, temp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(handle, 'w', encoding='utf-8') as file:
+            json.dump(state, file)
+        os.replace(temp_path, self.state_path)
+        self._checkpointed = self.offset
+
+    def finish(self, trailer=b''):
+        """ Append `trailer` and drop the sidecar once every byte is on disk, returns the part file
+
+        The trailer changes the file, so its size no longer matches the stream and a
+        download interrupted from here on starts over.
+        """
+        self.file.write(trailer)
+        self.file.flush()
+        try:
+            os.remove(self.state_path)
+        except OSError:
+            pass
+        self.file.seek(0)
+        return self.file
+
+    def close(self):
+        """ Checkpoint and close the part file, keeping it for a later resume """
+        if self.file is not None and not self.file.closed:
+            self.checkpoint()
+            self.file.close()
+
+    def commit(self):
+        """ Move the finished file into place """
+        if self.file is not None:
+            self.file.close()
+        os.replace(self.part_path, self.path)
@@ -0,0 +1,111 @@
+""" Rate limiting and retries for api requests """
+import random
+import threading
+import time
+from email.utils import parsedate_to_datetime
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+TOO_MANY_REQUESTS = 429
+
+
+def parse_retry_after(value):
+    """ Get the seconds to wait from a Retry-After header, given in seconds or as a date """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RateLimiter:  # pylint: disable=too-many-instance-attributes
+    """ Thread-safe token bucket shared by every request made with client_id
+
+    Tokens refill at `rate` per second up to `burst`.  With `rate=None`, the default,
+    requests are not limited until the first 429, which starts the bucket at
+    `throttled_rate`.  The rate adapts to the api: a 429 multiplies it by `decrease`
+    (down to `min_rate`) and pauses everyone for the server's Retry-After, every
+    successful request adds `increase` back up to `max_rate` (no bound by default
+    when starting unlimited).  `reserve` only computes how long to wait, so threads
+    and coroutines can share one.
+    """
+
+    def __init__(self, rate=None, burst=50, *, throttled_rate=50.0, min_rate=1.0, max_rate=None,  # pylint: disable=too-many-arguments
+                 decrease=0.5, increase=0.5):
+        self.rate = rate
+        self.burst = burst
+        self.throttled_rate = throttled_rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate or rate
+        self.decrease = decrease
+        self.increase = increase
+        self._lock = threading.Lock()
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._paused_until = 0.0
+
+    def reserve(self) -> float:
+        """ Take a token, returns the seconds to wait before sending the request """
+        with self._lock:
+            now = time.monotonic()
+            if self.rate is None:
+                return max(0.0, self._paused_until - now)
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= 1
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            return max(wait, self._paused_until - now)
+
+    def throttled(self, retry_after=None):
+        """ Slow down after a 429 """
+        with self._lock:
+            now = time.monotonic()
+            if self.rate is None:
+                self.rate = self.throttled_rate
+                self._tokens = 0.0
+                self._updated = now
+            else:
+                self.rate = max(self.min_rate, self.rate * self.decrease)
+            if retry_after:
+                self._paused_until = max(self._paused_until, now + retry_after)
+
+    def succeeded(self):
+        """ Speed up again after a successful request """
+        with self._lock:
+            if self.rate is None:
+                return
+            self.rate = self.rate + self.increase
+            if self.max_rate is not None:
+                self.rate = min(self.max_rate, self.rate)
+
+
+class RetryPolicy:  # pylint: disable=too-few-public-methods
+    """ When and after how long to retry failed requests
+
+    429 and 5xx responses and connection errors (status None) are retried up to
+    `retries` times.  The wait honors Retry-After up to `max_retry_after` seconds and
+    is otherwise a random "full jitter" backoff below min(max_backoff, backoff * 2**attempt).
+    """
+
+    def __init__(self, retries=4, backoff=0.5, *, max_backoff=30.0, max_retry_after=120.0, statuses=RETRY_STATUSES):
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.max_retry_after = max_retry_after
+        self.statuses = statuses
+
+    def should_retry(self, attempt, status=None, retry_after=None) -> bool:
+        """ Check if attempt number `attempt` (from 0) that failed with `status` is retried """
+        if attempt >= self.retries or status is not None and status not in self.statuses:
+            return False
+        return retry_after is None or retry_after <= self.max_retry_after
+
+    def delay(self, attempt, retry_after=None) -> float:
+        """ Seconds to wait before the next attempt """
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
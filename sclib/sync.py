@@ -1,16 +1,33 @@
-""" Soundcloud api sync objects """
-import urllib.request
+""" Soundcloud api sync objects """  # pylint: disable=too-many-lines
+import os
+import http.client
 from urllib.request import urlopen
-import json
+from urllib.error import HTTPError
+import itertools
+from io import BytesIO
 import random
 import re
+import threading
+import time
+import contextlib
+import queue
+from collections import deque, namedtuple
 from ssl import SSLContext
 from concurrent import futures
 import mutagen
+import mutagen.id3
 from . import util
+from .json_backend import get_backend as get_json_backend
+from .cache import ArtworkCache, FileCredentialCache, RedirectCache
+from .pool import ConnectionPool
+from .resume import EXPIRED_URL_CODES, RANGE_NOT_SATISFIABLE, PartialDownload
+from .retry import TOO_MANY_REQUESTS, RateLimiter, RetryPolicy, parse_retry_after
 
 
 SSL_VERIFY=True
+AUTH_ERROR_CODES = (401, 403)
+HEAD_NOT_ALLOWED_CODES = (405, 501)
+ID3V1_SIZE = 128
 
 def get_ssl_setting():
     """ Get ssl context """
@@ -29,23 +46,144 @@ def get_page(url):
     return get_url(url).decode('utf-8')
 
 def get_obj_from(url):
-    """ Get object from url """
+    """ Get object from url
+
+    Raises `APIError` when the request fails or the response is not json.
+    """
     try:
-        return json.loads(get_page(url))
-    except Exception as exc:  # pylint: disable=broad-except
-        util.eprint(type(exc), str(exc))
-        return False
+        return get_json_backend().loads(get_url(url))
+    except HTTPError as exc:
+        raise APIError.for_status(url, exc.code, exc.reason) from exc
+    except (OSError, http.client.HTTPException, ValueError) as exc:
+        raise APIError(url, None, str(exc)) from exc
+
+
+def render_id3_tags(frames, padding):
+    """ Render ID3 frames to an ID3v2 header with `padding` bytes of padding and an ID3v1 trailer """
+    tags = mutagen.id3.ID3()
+    for frame in frames:
+        tags.add(frame)
+    rendered = BytesIO()
+    tags.save(rendered, v1=2, padding=lambda info: padding)
+    data = rendered.getvalue()
+    return data[:-ID3V1_SIZE], data[-ID3V1_SIZE:]
+
+def add_id3_tags(file, frames):
+    """ Add ID3 frames to an untagged mp3, given as a file object or a path """
+    if isinstance(file, (str, os.PathLike)):
+        with open(file, 'r+b') as track_fp:
+            add_id3_tags(track_fp, frames)
+        return
+    audio = mutagen.File(file, filename="x.mp3")
+    audio.add_tags()
+    for frame in frames:
+        audio.tags.add(frame)
+    audio.save(file, v1=2)
 
 
 class UnsupportedFormatError(Exception):
     """ unsupported format """
 
 
+class APIError(Exception):
+    """ An api request failed, after any retries
+
+    `status` is the http status code, or None when no response was received.
+    """
+
+    def __init__(self, url, status=None, message=''):
+        super().__init__(f'{status or "request"} error for {url}: {message}')
+        self.url = url
+        self.status = status
+        self.message = message
+
+    @classmethod
+    def for_status(cls, url, status, message=''):
+        """ Get the error class matching a status code """
+        error_class = RateLimitedError if status == TOO_MANY_REQUESTS else cls
+        return error_class(url, status, message)
+
+
+class RateLimitedError(APIError):
+    """ The api kept answering 429 Too Many Requests """
+
+
+TracksResult = namedtuple('TracksResult', ['tracks', 'missing'])
+DownloadResult = namedtuple('DownloadResult', ['track', 'path', 'error'])
+ResolveResult = namedtuple('ResolveResult', ['url', 'resource', 'error'])
+
+
+class SingleFlight:  # pylint: disable=too-few-public-methods
+    """ Coalesce concurrent calls with the same key
+
+    While a call for a key is running, other threads asking for the same key wait for
+    it and get its result (or exception) instead of making their own call.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}  # key -> Future of the running call
+
+    def do(self, key, func, *args):
+        """ Call func(*args) unless a call for `key` is already running """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = futures.Future()
+        if not leader:
+            return call.result()
+        try:
+            result = func(*args)
+        except BaseException as exc:
+            call.set_exception(exc)
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+        call.set_result(result)
+        return result
+
+
+
+class SoundcloudAPI:  # pylint: disable=too-many-instance-attributes,too-many-public-methods
+    """ Soundcloud api client
+
+    Scraped client ids are kept in `credential_cache` (a file shared by every process
+    of the user by default).  When an api call is rejected with 401 or 403 the cached
+    id is dropped, a new one is found and the call is retried once.
+
+    Pass a `sclib.cache.ResolveCache` as `resolve_cache` to keep resolved objects, so
+    resolving the same url again does not touch the network.  Where short and share
+    links redirect to is kept in `redirect_cache`.  Cover art is kept in
+    `artwork_cache` so the tracks of an album download their shared cover once.
 
-class SoundcloudAPI:
-    """ Soundcloud api client """
+    Api requests wait for `rate_limiter`, which by default lets them through until
+    Soundcloud answers 429 and then slows down, and 429 or 5xx responses are retried
+    following `retry_policy`.  Share one `sclib.retry.RateLimiter(rate=...)` between
+    clients to keep them under a common rate from the start.
+
+    Api responses are decoded with `json_backend`, by default orjson or msgspec when
+    installed and the json module otherwise (see `sclib.json_backend`).
+
+    With `compact` the tracks and playlists built by the client keep their api object,
+    or only the named fields of it, and fill in attributes when they are first read.
+
+    Requests share the keep-alive connections of `pool`.  Close them with `api.close()`
+    or use the client as a context manager.
+    """
     __slots__ = [
         'client_id',
+        'pool',
+        'credential_cache',
+        'resolve_cache',
+        'redirect_cache',
+        'artwork_cache',
+        'rate_limiter',
+        'retry_policy',
+        'inflight',
+        'compact',
+        'json_backend',
     ]
     RESOLVE_URL = "https://api-v2.soundcloud.com/resolve?url={url}&client_id={client_id}"
     SEARCH_URL  = "https://api-v2.soundcloud.com/search?q={query}&client_id={client_id}&limit={limit}&offset={offset}"
@@ -53,51 +191,442 @@ class SoundcloudAPI:
     TRACKS_URL  = "https://api-v2.soundcloud.com/tracks?ids={track_ids}&client_id={client_id}"
     PROGRESSIVE_URL = "https://api-v2.soundcloud.com/media/soundcloud:tracks:723290971/53dc4e74-0414-4ab8-8741-a07ac56c787f/stream/progressive?client_id={client_id}"
 
+    USER_TRACKS_URL = "https://api-v2.soundcloud.com/users/{user_id}/tracks?client_id={client_id}&limit={limit}"
+    USER_LIKES_URL = "https://api-v2.soundcloud.com/users/{user_id}/likes?client_id={client_id}&limit={limit}"
+    USER_PLAYLISTS_URL = "https://api-v2.soundcloud.com/users/{user_id}/playlists?client_id={client_id}&limit={limit}"
+
     TRACK_API_MAX_REQUEST_SIZE = 50
+    SEARCH_PAGE_SIZE = 50
+    COLLECTION_PAGE_SIZE = 50
+    PAGE_READ_AHEAD = 2
+    RESOLVE_CONCURRENCY = 8
+    SCRIPT_FETCH_CONCURRENCY = 8
+    SCRIPT_CHUNK_SIZE = 64 * 1024
 
-    def __init__(self, client_id=None):
+    def __init__(self, client_id=None, pool=None, credential_cache=None, resolve_cache=None, *,  # pylint: disable=too-many-arguments
+                 artwork_cache=None, rate_limiter=None, retry_policy=None, redirect_cache=None, compact=False,
+                 json_backend=None):
         if client_id:
             self.client_id = client_id
         else:
             self.client_id = None
+        self.pool = pool if pool is not None else self.make_pool()
+        self.credential_cache = credential_cache if credential_cache is not None else FileCredentialCache()
+        self.resolve_cache = resolve_cache
+        self.redirect_cache = redirect_cache if redirect_cache is not None else RedirectCache()
+        self.artwork_cache = artwork_cache if artwork_cache is not None else ArtworkCache()
+        self.rate_limiter = rate_limiter if rate_limiter is not None else RateLimiter()
+        self.retry_policy = retry_policy if retry_policy is not None else RetryPolicy()
+        self.inflight = SingleFlight()
+        self.compact = compact
+        self.json_backend = get_json_backend(json_backend)
+
+    def make_pool(self):
+        """ Connection pool used when none is passed """
+        return ConnectionPool(ssl_context=get_ssl_setting())
+
+    def close(self):
+        """ Close the pooled connections that are not in use """
+        self.pool.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    @staticmethod
+    def uses_client_id(url, client_id):
+        """ Check if a url is authenticated with a client_id """
+        return bool(client_id) and f'client_id={client_id}' in url
+
+    def open_url(self, url, method='GET', headers=None):
+        """ Open a url on a pooled keep-alive connection
+
+        Requests rejected with 401 or 403 are retried once with a new client_id.
+        """
+        client_id = self.client_id
+        try:
+            return self.request_with_retries(url, method, headers)
+        except HTTPError as exc:
+            if exc.code not in AUTH_ERROR_CODES or not self.uses_client_id(url, client_id):
+                raise
+        self.refresh_credentials(client_id)
+        url = url.replace(f'client_id={client_id}', f'client_id={self.client_id}')
+        return self.request_with_retries(url, method, headers)
+
+    def request_with_retries(self, url, method='GET', headers=None):
+        """ Send a request, retrying 429, 5xx and connection errors following retry_policy
+
+        Requests carrying a client_id first wait for the rate limiter.
+        """
+        limited = 'client_id=' in url
+        for attempt in itertools.count():
+            if limited:
+                time.sleep(self.rate_limiter.reserve())
+            try:
+                response = self.pool.request(url, method=method, headers=headers)
+            except HTTPError as exc:
+                retry_after = parse_retry_after(exc.headers.get('Retry-After') if exc.headers else None)
+                if not self.retry_policy.should_retry(attempt, exc.code, retry_after):
+                    raise
+                if limited and exc.code == TOO_MANY_REQUESTS:
+                    self.rate_limiter.throttled(retry_after)
+            except (OSError, http.client.HTTPException):
+                retry_after = None
+                if not self.retry_policy.should_retry(attempt):
+                    raise
+            else:
+                if limited:
+                    self.rate_limiter.succeeded()
+                return response
+            time.sleep(self.retry_policy.delay(attempt, retry_after))
+        return None
+
+    def get_url(self, url):
+        """ Get url """
+        with self.open_url(url) as response:
+            return response.read()
+
+    def get_page(self, url):
+        """ get text from url """
+        return self.get_url(url).decode('utf-8')
+
+    def get_artwork(self, url):
+        """ Get an artwork image through the artwork cache
+
+        Concurrent requests for the same image share one download.
+        """
+        data = self.artwork_cache.get(url)
+        if data is None:
+            data = self.inflight.do(('artwork', url), self._fetch_artwork, url)
+        return data
+
+    def _fetch_artwork(self, url):
+        data = self.get_url(url)
+        self.artwork_cache.set(url, data)
+        return data
 
+    def get_obj_from(self, url):
+        """ Get object from url
+
+        Concurrent requests for the same url share one api call.  Raises APIError
+        when the request fails or the response is not json.
+        """
+        return self.inflight.do(('obj', url), self._get_obj_from, url)
+
+    def _get_obj_from(self, url):
+        try:
+            return self.json_backend.loads(self.get_url(url))
+        except HTTPError as exc:
+            raise APIError.for_status(url, exc.code, exc.reason) from exc
+        except (OSError, http.client.HTTPException, ValueError) as exc:
+            raise APIError(url, None, str(exc)) from exc
+
+    def refresh_credentials(self, stale_client_id=None):
+        """ Drop a rejected client_id from the cache and find a new one """
+        stale_client_id = stale_client_id or self.client_id
+        self.inflight.do(('refresh', stale_client_id), self._refresh_credentials, stale_client_id)
+
+    def _refresh_credentials(self, stale_client_id):
+        if self.client_id and self.client_id != stale_client_id:
+            return  # another caller already replaced it
+        self.credential_cache.invalidate(stale_client_id)
+        self.client_id = None
+        self.get_credentials()
 
     def get_credentials(self):
         """ get creds """
+        self.inflight.do('credentials', self._get_credentials)
+
+    def _get_credentials(self):
+        cached = self.credential_cache.get()
+        if cached:
+            self.client_id = cached['client_id']
+            return
+        script_url = self.scrape_credentials()
+        if self.client_id:
+            self.credential_cache.set(self.client_id, script_url=script_url)
+
+    def scrape_credentials(self):
+        """ Find a client_id in the scripts of a soundcloud page
+
+        The script that held the id last time is searched first, then the rest are
+        fetched concurrently and searched as they stream in.  The first match stops the
+        other downloads.  Returns the url of the script the id was found in.
+        """
         url = random.choice(util.SCRAPE_URLS)
-        page_text = get_page(url)
-        script_urls = util.find_script_urls(page_text)
-        for script in script_urls:
-            if not self.client_id:
-                if type(script) is str and not "":  # pylint: disable=simplifiable-condition
-                    js_text = f'{get_page(script)}'
-                    self.client_id = util.find_client_id(js_text)
-
-    def resolve(self, url):
-        """ Resolve url """
+        hint = (self.credential_cache.read() or {}).get('script_url')
+        script_urls = util.order_script_urls(util.find_script_urls(self.get_page(url)), hint)
+        found = threading.Event()
+
+        def scan(script_url):
+            scanner = util.ClientIdScanner()
+            try:
+                with self.open_url(script_url) as response:
+                    while not found.is_set():
+                        chunk = response.read(self.SCRIPT_CHUNK_SIZE)
+                        if not chunk:
+                            return scanner.close()
+                        client_id = scanner.feed(chunk)
+                        if client_id:
+                            return client_id
+            except (OSError, ValueError) as exc:
+                util.eprint(type(exc), str(exc))
+            return None
+
+        if hint in script_urls:
+            self.client_id = scan(hint) or None
+            if self.client_id:
+                return hint
+            script_urls.remove(hint)
+
+        with futures.ThreadPoolExecutor(self.SCRIPT_FETCH_CONCURRENCY) as executor:
+            scans = {executor.submit(scan, script_url): script_url for script_url in script_urls}
+            for scanned in futures.as_completed(scans):
+                if scanned.result():
+                    found.set()
+                    for pending in scans:
+                        pending.cancel()
+                    self.client_id = scanned.result()
+                    return scans[scanned]
+        return None
+
+    def resolve(self, url, hydrate=True):
+        """ Resolve url
+
+        Playlists are fully hydrated unless `hydrate` is False, in which case their
+        tracks are fetched while iterating over the playlist.
+        """
         if not self.client_id:
             self.get_credentials()
 
-        if not re.match(util.SC_TRACK_RESOLVE_REGEX, url):
-            with urllib.request.urlopen(url, timeout=10) as response:
-                url = response.geturl()
+        obj = self.resolve_cache.get(url) if self.resolve_cache else None
+        if obj is None:
+            obj = self.resolve_obj(url)
+        return self.from_obj(obj, hydrate)
 
-        url = SoundcloudAPI.RESOLVE_URL.format(
-            url=url,
-            client_id=self.client_id
-        )
+    def resolve_obj(self, url):
+        """ Get the raw api object for a url, storing it in the resolve cache """
+        resolved_url = self.resolve_redirect(url)
+        obj = self.resolve_cache.get(resolved_url) if self.resolve_cache and resolved_url != url else None
+        if obj is None:
+            obj = self.get_obj_from(self.RESOLVE_URL.format(
+                url=resolved_url,
+                client_id=self.client_id
+            ))
+        if obj and self.resolve_cache:
+            self.resolve_cache.set(url, obj)
+            if resolved_url != url:
+                self.resolve_cache.set(resolved_url, obj)
+        return obj
+
+    def resolve_redirect(self, url):
+        """ Get the soundcloud url a short or share link redirects to
+
+        Redirects are followed with HEAD requests, so no page is downloaded, and the
+        targets are kept in `redirect_cache`.  Urls of tracks are returned as they are.
+        """
+        if re.match(util.SC_TRACK_RESOLVE_REGEX, url):
+            return url
+        target = self.redirect_cache.get(url)
+        if target is None:
+            target = self.inflight.do(('redirect', url), self._follow_redirects, url)
+            self.redirect_cache.set(url, target)
+        return target
+
+    def _follow_redirects(self, url):
+        try:
+            response = self.request_with_retries(url, 'HEAD')
+        except HTTPError as exc:
+            if exc.code not in HEAD_NOT_ALLOWED_CODES:
+                raise
+            response = self.request_with_retries(url)  # only the headers are read
+        with response:
+            return response.geturl()
+
+    def resolve_many(self, urls, concurrency=None, hydrate=True):
+        """ Resolve many urls with up to `concurrency` threads
 
-        obj = get_obj_from(url)
+        Returns a ResolveResult per url in the order of `urls`; a url that could not be
+        resolved has its exception as `error`.  Repeated urls are resolved once.
+        """
+        if not self.client_id:
+            self.get_credentials()
+        unique_urls = list(dict.fromkeys(urls))
+        with futures.ThreadPoolExecutor(concurrency or self.RESOLVE_CONCURRENCY) as executor:
+            results = dict(zip(unique_urls, executor.map(lambda url: self._resolve_result(url, hydrate), unique_urls)))
+        return [results[url] for url in urls]
+
+    def _resolve_result(self, url, hydrate):
+        try:
+            return ResolveResult(url, self.resolve(url, hydrate), None)
+        except Exception as exc:  # pylint: disable=broad-except
+            return ResolveResult(url, None, exc)
+
+    def from_obj(self, obj, hydrate=True):
+        """ Build a Track or Playlist from a raw api object """
         if obj['kind'] == 'track':
             return Track(obj=obj, client=self)
         if obj['kind'] in ('playlist', 'system-playlist'):
             playlist = Playlist(obj=obj, client=self)
-            playlist.clean_attributes()
+            if hydrate:
+                playlist.clean_attributes()
             return playlist
         return None
 
-    def _format_get_tracks_urls(self, track_ids):
-        urls = []
+    def iter_pages(self, url, read_ahead=None, last_page=None):
+        """ Yield the collections of a cursor paginated api url, page by page
+
+        A background thread follows the `next_href` cursors and fetches up to
+        `read_ahead` pages ahead of the one being consumed.  No page is fetched after
+        one for which `last_page(collection)` is true.
+        """
+        slots = threading.Semaphore(1 + (read_ahead or self.PAGE_READ_AHEAD))
+        pages = queue.Queue()
+        stop = threading.Event()
+
+        def fetch_pages():
+            next_url = url
+            try:
+                while next_url:
+                    slots.acquire()  # pylint: disable=consider-using-with
+                    if stop.is_set():
+                        return
+                    next_url, collection = self._fetch_page(next_url, last_page)
+                    pages.put(collection)
+            except Exception as exc:  # pylint: disable=broad-except
+                pages.put(exc)
+            finally:
+                pages.put(None)
+
+        threading.Thread(target=fetch_pages, daemon=True).start()
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield page
+                slots.release()
+        finally:
+            stop.set()
+            slots.release()
+
+    def _fetch_page(self, url, last_page):
+        """ Get a page's collection and the url of the next page, or None """
+        obj = self.get_obj_from(url)
+        return self._next_page(obj, last_page, self.client_id)
+
+    @staticmethod
+    def _next_page(obj, last_page, client_id):
+        collection = obj.get('collection') or []
+        next_href = obj.get('next_href')
+        if not next_href or not collection or last_page and last_page(collection):
+            return None, collection
+        return util.with_client_id(next_href, client_id), collection
+
+    def search(self, query, limit=None, page_size=None):
+        """ Search for tracks and playlists, yielding them page by page
+
+        The next page is fetched in the background while the current one is consumed.
+        Stops after `limit` results when given.  Playlists are not hydrated, iterate
+        over them to fetch their tracks.
+        """
+        if not self.client_id:
+            self.get_credentials()
+        url = self.SEARCH_URL.format(
+            query=util.quote_query(query),
+            client_id=self.client_id,
+            limit=page_size or self.SEARCH_PAGE_SIZE,
+            offset=0
+        )
+        count = 0
+        with contextlib.closing(self.iter_pages(url, 1, util.page_limit(limit))) as pages:
+            for collection in pages:
+                for resource in self._build_resources(collection):
+                    yield resource
+                    count += 1
+                    if limit is not None and count >= limit:
+                        return
+
+    def _build_resources(self, collection):
+        """ Build the tracks and playlists of a page, skipping users """
+        for obj in collection:
+            resource = self.from_obj(obj, hydrate=False)
+            if resource is not None:
+                yield resource
+
+    def iter_user_tracks(self, user_id, since=None, read_ahead=None):
+        """ Stream a user's uploads, newest first
+
+        Pages are read up to `read_ahead` pages ahead.  With `since` (a datetime or an
+        ISO 8601 string) the stream stops at the first track created before it, so
+        incremental crawls only fetch what is new.
+        """
+        return self._iter_user_collection(self.USER_TRACKS_URL, user_id, since, read_ahead)
+
+    def iter_user_likes(self, user_id, since=None, read_ahead=None):
+        """ Stream the tracks and playlists a user liked, most recent like first
+
+        `since` applies to the time of the like.
+        """
+        return self._iter_user_collection(self.USER_LIKES_URL, user_id, since, read_ahead)
+
+    def iter_user_playlists(self, user_id, since=None, read_ahead=None):
+        """ Stream a user's playlists and albums, newest first, without hydrating them """
+        return self._iter_user_collection(self.USER_PLAYLISTS_URL, user_id, since, read_ahead)
+
+    def _iter_user_collection(self, url_template, user_id, since, read_ahead):
+        if not self.client_id:
+            self.get_credentials()
+        url = url_template.format(user_id=user_id, client_id=self.client_id, limit=self.COLLECTION_PAGE_SIZE)
+        cutoff = util.parse_datetime(since) if since else None
+        with contextlib.closing(self.iter_pages(url, read_ahead, util.page_cutoff(cutoff))) as pages:
+            for collection in pages:
+                entries = self._collection_entries(collection, cutoff)
+                objs = self._hydrate_stubs(entries)
+                yield from self._build_resources(objs)
+                if len(entries) < len(collection):
+                    return  # reached the cutoff
+
+    @staticmethod
+    def _collection_entries(collection, cutoff):
+        """ Get the tracks and playlists of a page that were created after cutoff
+
+        Likes wrap the liked track or playlist, the time of the like is used.
+        """
+        entries = []
+        for item in collection:
+            created_at = util.parse_datetime(item.get('created_at'))
+            if cutoff and created_at and created_at < cutoff:
+                break
+            entries.append(item.get('track') or item.get('playlist') or item)
+        return entries
+
+    def _hydrate_stubs(self, objs):
+        """ Replace track stubs without media by full tracks, fetched in bulk """
+        stub_ids = self._stub_ids(objs)
+        if not stub_ids:
+            return objs
+        tracks = self.fetch_tracks(*stub_ids).tracks
+        return self._merge_hydrated(objs, tracks)
+
+    @staticmethod
+    def _stub_ids(objs):
+        """ Ids of the tracks that only carry a summary, without media """
+        return [obj['id'] for obj in objs if obj.get('kind') == 'track' and 'media' not in obj]
+
+    @staticmethod
+    def _merge_hydrated(objs, tracks):
+        """ Swap stubs for the hydrated tracks, keeping stubs that could not be fetched """
+        found = {track['id']: track for track in tracks}
+        return [found.get(obj['id'], obj) if obj.get('kind') == 'track' else obj for obj in objs]
+
+    def _plan_track_batches(self, track_ids):
+        """ Split ids into (ids, url) batches for the tracks endpoint """
+        batches = []
         for start_offset in range(0, len(track_ids), self.TRACK_API_MAX_REQUEST_SIZE):
             end_offset = start_offset + self.TRACK_API_MAX_REQUEST_SIZE
             track_ids_slice = track_ids[start_offset:end_offset]
@@ -105,24 +634,100 @@ class SoundcloudAPI:
                 track_ids=','.join([str(i) for i in track_ids_slice]),
                 client_id=self.client_id
             )
-            urls.append(url)
-        return urls
+            batches.append((track_ids_slice, url))
+        return batches
+
+    def _format_get_tracks_urls(self, track_ids):
+        return [url for _, url in self._plan_track_batches(track_ids)]
+
+    @staticmethod
+    def _collect_tracks(unique_ids, batches):
+        """ Order fetched tracks like `unique_ids` and find the ids that are missing """
+        found = {}
+        for batch in batches:
+            if isinstance(batch, list):  # failed batches are None
+                for track in batch:
+                    found[str(track['id'])] = track
+        tracks = [found[str(i)] for i in unique_ids if str(i) in found]
+        missing = [i for i in unique_ids if str(i) not in found]
+        return TracksResult(tracks, missing)
+
+    def iter_track_batches(self, *track_ids, concurrency=None):
+        """ Fetch tracks by id, yielding a TracksResult per batch as soon as it arrives
+
+        All batches are planned up front and fetched by up to `concurrency` threads.
+        Batches are yielded in order, a batch that arrives early waits for the ones
+        before it.  Duplicate ids are only fetched once.
+        """
+        if not track_ids:
+            return
+        if not self.client_id:
+            self.get_credentials()
+
+        unique_ids = list(dict.fromkeys(track_ids))
+        batches = self._plan_track_batches(unique_ids)
+        with futures.ThreadPoolExecutor(concurrency) as executor:
+            pending = [executor.submit(self.get_obj_from, url) for _, url in batches]
+            try:
+                for (batch_ids, _), response in zip(batches, pending):
+                    yield self._collect_tracks(batch_ids, [self._batch_result(response.result)])
+            finally:
+                for response in pending:
+                    response.cancel()
+
+    @staticmethod
+    def _batch_result(result):
+        """ Get the tracks of a batch, or None if it failed """
+        try:
+            return result()
+        except APIError as exc:
+            util.eprint(f'[get_tracks]: {exc}')
+            return None
 
-    def get_tracks(self, *track_ids):
+    def fetch_tracks(self, *track_ids, concurrency=None):
+        """ Get tracks by id in the order of first appearance, skipping duplicates
+
+        Returns a TracksResult of the tracks found and the ids that were not, either
+        because their batch failed or because the api left them out.
+        """
+        result = TracksResult([], [])
+        for batch in self.iter_track_batches(*track_ids, concurrency=concurrency):
+            result.tracks.extend(batch.tracks)
+            result.missing.extend(batch.missing)
+        return result
+
+    def get_tracks(self, *track_ids, concurrency=None):
         """ Get a list of track ids """
-        threads = []
-        with futures.ThreadPoolExecutor() as executor:
-            for url in self._format_get_tracks_urls(track_ids):
-                thread = executor.submit(get_obj_from, url)
-                threads.append(thread)
+        result = self.fetch_tracks(*track_ids, concurrency=concurrency)
+        if result.missing:
+            util.eprint(f'[get_tracks]: could not fetch {len(result.missing)} tracks: {result.missing}')
+        return result.tracks
+
 
-        tracks = []
-        for thread in futures.as_completed(threads):
-            result = thread.result()
-            tracks.extend(result)
+def init_attributes(resource, obj, compact):
+    """ Set the attributes of a Track or Playlist from its api object
 
-        tracks = sorted(tracks, key=lambda x: track_ids.index(x['id']))
-        return tracks
+    Compact resources only keep the api object, or with a collection of field names
+    only those fields and the class' COMPACT_FIELDS, and read an attribute from it the
+    first time it is used.  Others copy every field into their slots at once.
+    """
+    if not compact:
+        for key in resource.__slots__:
+            setattr(resource, key, obj.get(key))
+        return
+    if compact is not True:
+        fields = itertools.chain(resource.COMPACT_FIELDS, compact)
+        obj = {key: obj[key] for key in fields if key in obj}
+    resource._obj = obj  # pylint: disable=protected-access
+
+
+def lazy_attribute(resource, name):
+    """ Read an unset attribute of a compact Track or Playlist from its api object """
+    if name == '_obj' or name not in resource.__slots__:
+        raise AttributeError(f"'{type(resource).__name__}' object has no attribute '{name}'")
+    value = (resource._obj or {}).get(name)  # pylint: disable=protected-access
+    setattr(resource, name, value)
+    return value
 
 
 class Track:
@@ -181,24 +786,34 @@ class Track:
 
         # Internal Attributes
         "client",
-        "ready"
+        "ready",
+        "_obj"
     ]
     STREAM_URL = "https://api.soundcloud.com/i1/tracks/{track_id}/streams?client_id={client_id}"
-    def __init__(self, *, obj=None, client=None):
+    DOWNLOAD_CHUNK_SIZE = 64 * 1024
+    HLS_WINDOW = 8
+    MIN_RANGE_SIZE = 1024 * 1024
+    ID3_PADDING = 1024
+    COMPACT_FIELDS = ("id", "kind", "title", "user", "media", "artwork_url")
+
+    def __init__(self, *, obj=None, client=None, compact=None):
         if not obj:
             raise ValueError("[Track]: obj must not be None")
         if not isinstance(client, SoundcloudAPI):
             raise ValueError(f"[Track]: client must be an instance of SoundcloudAPI not {type(client)}")
 
-        for key in self.__slots__:
-            self.__setattr__(key, obj[key] if key in obj else None)
-
+        init_attributes(self, obj, client.compact if compact is None else compact)
         self.client = client
         self.ready = False
         self.clean_attributes()
 
+    def __getattr__(self, name):
+        return lazy_attribute(self, name)
+
     def clean_attributes(self):
         """ clean attrs """
+        if self.artist:
+            return  # built from to_dict
         username = self.user['username']
         title = self.title
         if " - " in title:
@@ -207,82 +822,248 @@ class Track:
             self.title = "-".join(parts[1:]).strip()
         else:
             self.artist = username
-#
-#   Uses urllib
-#
-    def write_mp3_to(self, file):
-        """ Write mp3 data to file """
+    def write_mp3_to(self, file, chunk_size=None, connections=1):
+        """ Write mp3 data to file
+
+        The stream is looked up first, so nothing is written for a track that cannot be
+        downloaded.  Then the ID3 tag is rendered and the progressive stream is copied
+        after it in chunks of `chunk_size` bytes, so memory use does not grow with the
+        length of the track and no byte is written twice.  Tracks without a progressive
+        stream are assembled from their HLS mp3 segments.
+
+        With `connections` > 1 a long stream is split into byte ranges that are fetched
+        concurrently and written in place, for CDNs that throttle each connection.
+        """
         try:
+            stream_url, segment_urls = None, None
+            if self.has_transcoding('progressive'):
+                stream_url = self.get_stream_url()
+            else:
+                segment_urls = self.get_hls_segment_urls()
+            header, trailer = self.build_id3_tags(self.get_album_artwork())
             file.seek(0)
-            stream_url = self.get_stream_url()
-            with urlopen(stream_url,context=get_ssl_setting()) as client:
-                data = client.read()
-            file.write(data)
+            file.write(header)
+            if stream_url:
+                ranges = None
+                if connections > 1 and util.supports_positional_writes(file):
+                    ranges = self.get_stream_ranges(stream_url, connections)
+                if ranges:
+                    self.write_ranges_to(file, stream_url, ranges, chunk_size)
+                else:
+                    with self.client.open_url(stream_url) as response:
+                        util.copy_stream(response, file, chunk_size or self.DOWNLOAD_CHUNK_SIZE)
+            else:
+                self.write_hls_to(file, segment_urls=segment_urls)
+            file.write(trailer)
+            file.truncate()
             file.seek(0)
-
-            album_artwork = None
-            if self.artwork_url:
-                with urlopen(util.get_large_artwork_url(self.artwork_url),context=get_ssl_setting()) as client:
-                    album_artwork = client.read()
-
-            self.write_track_id3(file, album_artwork)
+            self.ready = True
         except (TypeError, ValueError) as exc:
             util.eprint('File object passed to "write_mp3_to" must be opened in read/write binary ("wb+") mode')
             util.eprint(exc)
             raise exc
 
+    def get_stream_ranges(self, stream_url, connections):
+        """ Split a stream into byte ranges of at least MIN_RANGE_SIZE bytes
+
+        Returns None when the server does not answer a one byte Range probe with its size.
+        """
+        with self.client.open_url(stream_url, headers={'Range': 'bytes=0-0'}) as response:
+            content_range = util.parse_content_range(response.getheader('Content-Range'))
+            if response.status == 206:
+                response.read()  # one byte, keeps the connection reusable
+        if response.status != 206 or not content_range or not content_range[2]:
+            return None
+        return util.split_ranges(content_range[2], connections, self.MIN_RANGE_SIZE)
+
+    def write_ranges_to(self, file, stream_url, ranges, chunk_size=None):
+        """ Fetch byte ranges of a stream concurrently, writing each at its offset from the file position
+
+        The file position is left after the last byte of the stream.
+        """
+        file.flush()
+        base = file.tell()
+        end = base + ranges[-1][1] + 1
+        file.truncate(end)
+        fileno = file.fileno()
+        with futures.ThreadPoolExecutor(len(ranges)) as executor:
+            parts = [
+                executor.submit(self._write_range, fileno, stream_url, byte_range, base, chunk_size)
+                for byte_range in ranges
+            ]
+            for part in parts:
+                part.result()
+        file.seek(end)
+
+    def _write_range(self, fileno, stream_url, byte_range, base, chunk_size):  # pylint: disable=too-many-arguments
+        start, end = byte_range
+        with self.client.open_url(stream_url, headers={'Range': f'bytes={start}-{end}'}) as response:
+            if response.status != 206:
+                raise HTTPError(stream_url, response.status, 'Range request not honored', response.headers, None)
+            written = util.copy_stream_at(response, fileno, base + start, chunk_size or self.DOWNLOAD_CHUNK_SIZE)
+        if written != base + end + 1:
+            raise HTTPError(stream_url, response.status, 'Incomplete range', response.headers, None)
+
+    def download_to(self, path, chunk_size=None):
+        """ Download the track to a path, resuming an interrupted download
+
+        The ID3 header and the stream are written to `<path>.part` next to a small json
+        sidecar, and an interrupted download continues with a `Range` request from the
+        last checkpoint.  Expired stream urls are replaced by a fresh one.  The ID3v1
+        trailer is appended and the file moved to `path` once complete, so no byte is
+        written twice.  HLS-only tracks are downloaded without resuming.
+        """
+        partial = PartialDownload(path)
+        if not self.has_transcoding('progressive'):
+            with open(partial.part_path, 'wb+') as file:
+                self.write_mp3_to(file)
+            partial.commit()
+            return path
+        stream_url, response = self._open_resumable_stream(partial)
+        try:
+            with response:
+                header, trailer = self.build_id3_tags(self.get_album_artwork())
+                partial.start(response.status, response.headers, stream_url, header)
+                util.copy_stream(response, partial, chunk_size or self.DOWNLOAD_CHUNK_SIZE)
+        except BaseException:
+            partial.close()
+            raise
+        partial.finish(trailer)
+        self.ready = True
+        partial.commit()
+        return path
+
+    def _open_resumable_stream(self, partial):
+        stream_url = partial.stream_url or self.get_stream_url()
+        try:
+            return stream_url, self.client.open_url(stream_url, headers=partial.request_headers())
+        except HTTPError as exc:
+            if exc.code == RANGE_NOT_SATISFIABLE:
+                partial.reset()
+            elif exc.code in EXPIRED_URL_CODES and partial.stream_url:
+                stream_url = self.get_stream_url()
+            else:
+                raise
+        return stream_url, self.client.open_url(stream_url, headers=partial.request_headers())
+
+    def get_album_artwork(self):
+        """ Get the large artwork image, if the track has one """
+        if not self.artwork_url:
+            return None
+        return self.client.get_artwork(util.get_large_artwork_url(self.artwork_url))
+
+    def write_hls_to(self, file, window=None, segment_urls=None):
+        """ Assemble the HLS mp3 stream into a file
+
+        Up to `window` segments are fetched concurrently ahead of the one being written,
+        and segments are written in playlist order as soon as they are available.
+        `segment_urls` that were already looked up are used instead of fetching the playlist.
+        """
+        segments = iter(self.get_hls_segment_urls() if segment_urls is None else segment_urls)
+        window = window or self.HLS_WINDOW
+        with futures.ThreadPoolExecutor(window) as executor:
+            pending = deque(executor.submit(self.client.get_url, url) for url in itertools.islice(segments, window))
+            try:
+                while pending:
+                    data = pending.popleft().result()
+                    for url in itertools.islice(segments, 1):
+                        pending.append(executor.submit(self.client.get_url, url))
+                    file.write(data)
+            finally:
+                for segment in pending:
+                    segment.cancel()
+
+    def has_transcoding(self, protocol, mime_type='audio/mpeg'):
+        """ Check if the track has a transcoding for a protocol """
+        return self._find_transcoding(protocol, mime_type) is not None
+
+    def _find_transcoding(self, protocol, mime_type=None):
+        for transcode in (self.media or {}).get('transcodings', []):
+            if transcode['format']['protocol'] != protocol:
+                continue
+            if mime_type is None or transcode['format'].get('mime_type', '').startswith(mime_type):
+                return transcode
+        return None
+
     def get_prog_url(self):
         """ Get url """
-        for transcode in self.media['transcodings']:
-            if transcode['format']['protocol'] == 'progressive':
-                return transcode['url'] + "?client_id=" + self.client.client_id
-        raise UnsupportedFormatError("As of soundcloud-lib 0.5.0, tracks that are not marked as 'Downloadable' cannot be downloaded because this library does not yet assemble HLS streams.")
-#
-#   Uses urllib
-#
+        transcode = self._find_transcoding('progressive')
+        if transcode:
+            return transcode['url'] + "?client_id=" + self.client.client_id
+        raise UnsupportedFormatError("This track does not have a progressive mp3 stream.")
+
+    def get_hls_url(self):
+        """ Get the url of the HLS mp3 transcoding """
+        transcode = self._find_transcoding('hls', 'audio/mpeg')
+        if transcode:
+            return transcode['url'] + "?client_id=" + self.client.client_id
+        raise UnsupportedFormatError("This track has neither a progressive nor an HLS mp3 stream.")
+
     def get_stream_url(self):
         """ Get stream url """
         prog_url = self.get_prog_url()
-        url_response = get_obj_from(prog_url)
+        url_response = self.client.get_obj_from(prog_url)
         return url_response['url']
 
+    def get_hls_segment_urls(self):
+        """ Get the segment urls of the HLS mp3 stream """
+        playlist_url = self.client.get_obj_from(self.get_hls_url())['url']
+        playlist = self.client.get_page(playlist_url)
+        return self._parse_hls_playlist(playlist, playlist_url)
+
+    @staticmethod
+    def _parse_hls_playlist(playlist, playlist_url):
+        if util.is_encrypted_m3u8(playlist):
+            raise UnsupportedFormatError("Encrypted HLS streams are not supported.")
+        return util.parse_m3u8(playlist, playlist_url)
+
+    def id3_frames(self, album_artwork:bytes = None):
+        """ Get the ID3 frames describing this track """
+        frames = []
+    # SET TITLE
+        frame = mutagen.id3.TIT2(encoding=3)
+        frame.append(self.title)
+        frames.append(frame)
+    # SET ARTIST
+        frame = mutagen.id3.TPE1(encoding=3)
+        frame.append(self.artist)
+        frames.append(frame)
+
+    # SET ALBUM
+        if self.album:
+            frame = mutagen.id3.TALB(encoding=3)
+            frame.append(self.album)
+            frames.append(frame)
+    # SET TRACK NO
+        if self.track_no:
+            frame = mutagen.id3.TRCK(encoding=3)
+            frame.append(str(self.track_no))
+            frames.append(frame)
+    # SET ARTWORK
+        if album_artwork:
+            frames.append(
+                mutagen.id3.APIC(
+                    encoding=3,
+                    mime='image/jpeg',
+                    type=3,
+                    desc='Cover',
+                    data=album_artwork
+                )
+            )
+        return frames
+
+    def build_id3_tags(self, album_artwork:bytes = None):
+        """ Render the tags in memory, returns the ID3v2 header and the ID3v1 trailer
+
+        The header carries ID3_PADDING bytes of padding so the tag can later be edited
+        in place.  Writing header, audio and trailer in that order writes every byte once.
+        """
+        return render_id3_tags(self.id3_frames(album_artwork), self.ID3_PADDING)
+
     def write_track_id3(self, track_fp, album_artwork:bytes = None):
         """ Write track meta """
         try:
-            audio = mutagen.File(track_fp, filename="x.mp3")
-            audio.add_tags()
-
-        # SET TITLE
-            frame = mutagen.id3.TIT2(encoding=3)
-            frame.append(self.title)
-            audio.tags.add(frame)
-        # SET ARTIST
-            frame = mutagen.id3.TPE1(encoding=3)
-            frame.append(self.artist)
-            audio.tags.add(frame)
-
-        # SET ALBUM
-            if self.album:
-                frame = mutagen.id3.TALB(encoding=3)
-                frame.append(self.album)
-                audio.tags.add(frame)
-        # SET TRACK NO
-            if self.track_no:
-                frame = mutagen.id3.TRCK(encoding=3)
-                frame.append(str(self.track_no))
-                audio.tags.add(frame)
-        # SET ARTWORK
-            if album_artwork:
-                audio.tags.add(
-                    mutagen.id3.APIC(
-                        encoding=3,
-                        mime='image/jpeg',
-                        type=3,
-                        desc='Cover',
-                        data=album_artwork
-                    )
-                )
-            audio.save(track_fp, v1=2)
+            add_id3_tags(track_fp, self.id3_frames(album_artwork))
             self.ready = True
             track_fp.seek(0)
             return track_fp
@@ -330,41 +1111,168 @@ class Playlist:
         "track_count",
 
         "client",
-        "ready"
+        "ready",
+        "_obj"
     ]
+    HYDRATE_CONCURRENCY = 8
+    DOWNLOAD_CONCURRENCY = 4
+    # deprecated and unused: track stubs are fetched in batches of
+    # SoundcloudAPI.TRACK_API_MAX_REQUEST_SIZE, HYDRATE_CONCURRENCY batches at once
     RESOLVE_THRESHOLD = 100
+    COMPACT_FIELDS = ("id", "kind", "title", "tracks")
 
-    def __init__(self, *, obj=None, client=None):
+    def __init__(self, *, obj=None, client=None, compact=None):
         assert obj
         assert "id" in obj
-        self.tracks = []
-        for key in self.__slots__:
-            self.__setattr__(key, obj[key] if key in obj else None)
+        if compact is None:
+            compact = client.compact if client is not None else False
+        init_attributes(self, obj, compact)
+        self.tracks = list(self.tracks or [])  # hydrating must not change a cached object
         self.client = client
         self.ready = False
 
-    def clean_attributes(self):
-        """ Clean attributes """
+    def __getattr__(self, name):
+        return lazy_attribute(self, name)
+
+    def clean_attributes(self, concurrency=None):
+        """ Clean attributes
+
+        Track stubs without metadata are fetched in batches of
+        `SoundcloudAPI.TRACK_API_MAX_REQUEST_SIZE`, up to `concurrency` batches at once.
+        """
         if self.ready:
             return
+        for _ in self.iter_tracks(concurrency):
+            pass
+
+    def iter_tracks(self, concurrency=None):
+        """ Yield tracks in playlist order while the playlist is being hydrated
+
+        Tracks that already have metadata are yielded at once, the others as soon as
+        their batch arrives.  Stubs that could not be fetched are skipped.
+        """
+        for _, _, track in self._iter_entries(concurrency):
+            if track:
+                yield track
+
+    def _iter_entries(self, concurrency=None):
+        """ Yield (track_no, stub, track) for every entry of the playlist while it is hydrated
+
+        `track` is None for a stub that could not be fetched.  Once every entry was
+        yielded the playlist keeps only its tracks and is ready.
+        """
+        if self.ready:
+            for track_no, track in enumerate(self.tracks, start=1):
+                yield track_no, track, track
+            return
+        batches = self.client.iter_track_batches(
+            *self._incomplete_track_ids(),
+            concurrency=concurrency or self.HYDRATE_CONCURRENCY
+        )
+        arrived = {}
+        hydrated = []
+        try:
+            for track_no, stub in enumerate(self.tracks, start=1):
+                while not self._has_arrived(stub, arrived):
+                    batch = next(batches, None)
+                    if batch is None:
+                        break
+                    self._add_batch(arrived, batch)
+                track = self._build_track(stub, arrived, Track)
+                if track:
+                    hydrated.append(track)
+                yield track_no, stub, track
+        finally:
+            batches.close()
+        self.tracks = hydrated
         self.ready = True
-        track_objects = []  # type: [Track] # all completed track objects
-        incomplete_track_ids = []  # tracks that do not have metadata
 
-        while self.tracks and 'title' in self.tracks[0]:  # remove completed track objects
-            track_objects.append(Track(obj=self.tracks.pop(0), client=self.client))
+    def download_all(self, target, concurrency=None):
+        """ Download every track of the playlist with up to `concurrency` threads
+
+        `target` is a directory to write `artist - title.mp3` files to, or a callable
+        that takes a track and returns a file object opened in "wb+" mode, which is
+        closed once the track is written.  Tracks of the playlist with the same file
+        name get `artist - title (2).mp3` and so on.  Tracks get the playlist title as
+        album and their position in the playlist as track number.  Returns a
+        DownloadResult per entry of the playlist in order; a track that failed has its
+        exception as `error`, and a stub that could not be fetched is returned as its
+        api object with an APIError.
+        """
+        taken = set()
+        downloads = []
+        with futures.ThreadPoolExecutor(concurrency or self.DOWNLOAD_CONCURRENCY) as executor:
+            for track_no, stub, track in self._iter_entries():
+                if track is None:
+                    downloads.append(self._unfetched_result(stub))
+                    continue
+                filename = self._unique_filename(track, taken)
+                downloads.append(executor.submit(self._download_track, target, track_no, track, filename))
+        return [download.result() if isinstance(download, futures.Future) else download for download in downloads]
 
-        while self.tracks:  # while built tracks are less than all tracks
-            incomplete_track_ids.append(self.tracks.pop(0)['id'])
-            if len(incomplete_track_ids) == self.RESOLVE_THRESHOLD or not self.tracks:
-                new_tracks = self.client.get_tracks(*incomplete_track_ids)
-                track_objects.extend([Track(obj=t, client=self.client) for t in new_tracks])
-                incomplete_track_ids.clear()
-        self.tracks = track_objects
+    def _unfetched_result(self, stub):
+        """ Result of a stub whose metadata could not be fetched """
+        url = self.client.TRACKS_URL.format(track_ids=stub['id'], client_id=self.client.client_id)
+        return DownloadResult(stub, None, APIError(url, message='track could not be fetched'))
+
+    def _download_track(self, target, track_no, track, filename):
+        track.album = self.title
+        track.track_no = track_no
+        path = None
+        try:
+            file, path = self._open_target(target, track, filename)
+            with file:
+                track.write_mp3_to(file)
+            return DownloadResult(track, path, None)
+        except Exception as exc:  # pylint: disable=broad-except
+            self._discard_target(target, path)
+            return DownloadResult(track, path, exc)
+
+    @staticmethod
+    def _unique_filename(track, taken):
+        """ File name of a track that no other track of the playlist uses, names in `taken` are case-insensitive """
+        stem = util.track_filename(track)[:-len('.mp3')]
+        filename, copy = f'{stem}.mp3', 1
+        while filename.lower() in taken:
+            copy += 1
+            filename = f'{stem} ({copy}).mp3'
+        taken.add(filename.lower())
+        return filename
+
+    @staticmethod
+    def _open_target(target, track, filename):
+        """ Open the file a track is written to, returns (file, path) """
+        if callable(target):
+            file = target(track)
+            return file, getattr(file, 'name', None)
+        path = os.path.join(target, filename)
+        return open(path, 'wb+'), path  # pylint: disable=consider-using-with
+
+    @staticmethod
+    def _discard_target(target, path):
+        """ Remove a partially written file that this playlist created """
+        if path and not callable(target) and os.path.exists(path):
+            os.remove(path)
+
+    def _incomplete_track_ids(self):
+        """ Ids of the track stubs that do not have metadata """
+        return [track['id'] for track in self.tracks if 'title' not in track]
+
+    @staticmethod
+    def _has_arrived(stub, arrived):
+        return 'title' in stub or str(stub['id']) in arrived
+
+    @staticmethod
+    def _add_batch(arrived, batch):
+        arrived.update((str(track_id), None) for track_id in batch.missing)
+        arrived.update((str(track['id']), track) for track in batch.tracks)
+
+    def _build_track(self, stub, arrived, track_class):
+        obj = stub if 'title' in stub else arrived.get(str(stub['id']))
+        return track_class(obj=obj, client=self.client) if obj else None
 
     def __len__(self):
         return len(self.tracks)
 
     def __iter__(self):
-        self.clean_attributes()
-        yield from self.tracks
+        return self.iter_tracks()
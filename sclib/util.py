@@ -1,7 +1,9 @@
 """ Common utils """
+import os
 import sys
 import re
-from bs4 import BeautifulSoup
+from datetime import datetime, timezone
+from urllib.parse import quote, urljoin, urlsplit
 
 SC_TRACK_RESOLVE_REGEX = r"^(?:https?:\/\/)soundcloud\.com\/[a-z0-9](?!.*?(-|_){2})[\w-]{1,23}[a-z0-9]\/[^\s]+$"
 
@@ -14,26 +16,198 @@ SCRAPE_URLS = [
     'https://soundcloud.com/mt-marcy/cold-nights'
 ]
 
+# a whole script element, so markup inside inline script bodies is skipped
+SCRIPT_TAG_REGEX = re.compile(r'<script\b([^>]*)>(?:.*?</script\s*>)?', re.IGNORECASE | re.DOTALL)
+SCRIPT_SRC_REGEX = re.compile(r"""\ssrc\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""", re.IGNORECASE)
+CLIENT_ID_REGEX = re.compile(r'client_id=([a-zA-Z0-9]+)')
+CLIENT_ID_BYTES_REGEX = re.compile(CLIENT_ID_REGEX.pattern.encode())
+
 def find_script_urls(html_text):
     """ Get script url that has client_id in it """
-    dom = BeautifulSoup(html_text, 'html.parser')
-    scripts = dom.findAll('script', attrs={'src': True})
-    scripts_list = []
-    for script in scripts:
-        src = script['src']
-        if 'cookielaw.org' not in src:  # filter out cookielaw.org
-            scripts_list.append(src)
-    return scripts_list
+    attributes = (match.group(1) for match in SCRIPT_TAG_REGEX.finditer(html_text))
+    sources = (''.join(match.groups('')) for match in map(SCRIPT_SRC_REGEX.search, attributes) if match)
+    return [
+        src for src in sources
+        if src and 'cookielaw.org' not in src  # filter out cookielaw.org
+    ]
+
+
+def order_script_urls(script_urls, hint=None):
+    """ Put the script that held the client_id last time first """
+    if hint in script_urls:
+        return [hint] + [url for url in script_urls if url != hint]
+    return list(script_urls)
 
 
 def find_client_id(script_text):
     """ Extract client_id from script """
-    client_id = re.findall(r'client_id=([a-zA-Z0-9]+)', script_text)
-    if len(client_id) > 0:
-        return client_id[0]
+    match = CLIENT_ID_REGEX.search(script_text)
+    if match:
+        return match.group(1)
 
     return False
 
+
+class ClientIdScanner:
+    """ Search a script for a client_id chunk by chunk as it is downloaded """
+    TAIL_SIZE = 64
+
+    def __init__(self):
+        self._tail = b''
+
+    def feed(self, chunk: bytes):
+        """ Scan the next chunk, returns the client_id once it is found """
+        data = self._tail + chunk
+        match = CLIENT_ID_BYTES_REGEX.search(data)
+        if match and match.end() < len(data):
+            return match.group(1).decode()
+        # keep a partial match, or enough bytes to catch one split across chunks
+        self._tail = data[match.start():] if match else data[-self.TAIL_SIZE:]
+        return None
+
+    def close(self):
+        """ Scan what is left once the script has ended """
+        match = CLIENT_ID_BYTES_REGEX.search(self._tail)
+        return match.group(1).decode() if match else None
+
+def copy_stream(source, target, chunk_size):
+    """ Copy a readable binary stream into a file object one chunk at a time """
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    total = 0
+    while True:
+        size = source.readinto(buffer)
+        if not size:
+            return total
+        target.write(view[:size])
+        total += size
+
+def copy_stream_at(source, fd, offset, chunk_size):
+    """ Copy a readable binary stream into a file descriptor at `offset` with positional writes """
+    buffer = bytearray(chunk_size)
+    view = memoryview(buffer)
+    while True:
+        size = source.readinto(buffer)
+        if not size:
+            return offset
+        pwrite_all(fd, view[:size], offset)
+        offset += size
+
+def pwrite_all(fd, data, offset):
+    """ Write all of data at `offset` without moving the file position """
+    view = memoryview(data)
+    while view:
+        written = os.pwrite(fd, view, offset)
+        view = view[written:]
+        offset += written
+
+def supports_positional_writes(file):
+    """ Check if byte ranges can be written into a file in place, which needs os.pwrite and a real file """
+    return hasattr(os, 'pwrite') and get_fileno(file) is not None
+
+def get_fileno(file):
+    """ Get the file descriptor behind a file object, or None for in-memory files """
+    try:
+        return file.fileno()
+    except (AttributeError, OSError):
+        return None
+
+CONTENT_RANGE_REGEX = re.compile(r'bytes\s+(\d+)-(\d+)/(\d+|\*)')
+
+def parse_content_range(content_range):
+    """ Get (start, end, total) from a Content-Range header, total is None when unknown """
+    match = CONTENT_RANGE_REGEX.match(content_range or '')
+    if not match:
+        return None
+    start, end, total = match.groups()
+    return int(start), int(end), None if total == '*' else int(total)
+
+def split_ranges(size, parts, min_part_size=1):
+    """ Split `size` bytes into at most `parts` inclusive (start, end) byte ranges """
+    if size <= 0:
+        return []
+    parts = max(1, min(parts, size // max(min_part_size, 1)))
+    step = -(-size // parts)
+    return [(start, min(start + step, size) - 1) for start in range(0, size, step)]
+
+def with_client_id(url, client_id):
+    """ Add a client_id to an api url that does not carry one, like a `next_href` cursor """
+    if 'client_id=' in url:
+        return url
+    return url + ('&' if '?' in url else '?') + f'client_id={client_id}'
+
+def quote_query(query):
+    """ Quote a search query for a url """
+    return quote(query, safe='')
+
+def parse_datetime(value):
+    """ Get an aware datetime from an api timestamp, an ISO 8601 string or a datetime, naive ones are UTC """
+    if not value:
+        return None
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        except ValueError:
+            return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value
+
+def page_limit(limit):
+    """ `last_page` predicate for iter_pages that stops once `limit` items were fetched """
+    if limit is None:
+        return None
+    fetched = []
+
+    def last_page(collection):
+        fetched.append(len(collection))
+        return sum(fetched) >= limit
+    return last_page
+
+def page_cutoff(cutoff):
+    """ `last_page` predicate for iter_pages over newest-first pages that stops at items created before cutoff """
+    if cutoff is None:
+        return None
+
+    def last_page(collection):
+        created_at = parse_datetime(collection[-1].get('created_at'))
+        return created_at is not None and created_at < cutoff
+    return last_page
+
+def canonical_url(url):
+    """ Normalize a soundcloud url so equivalent links compare equal
+
+    Drops the query string, fragment, trailing slash and www/m subdomains.
+    """
+    parts = urlsplit(url.strip())
+    host = (parts.hostname or '').lower()
+    if host in ('www.soundcloud.com', 'm.soundcloud.com'):
+        host = 'soundcloud.com'
+    path = parts.path.rstrip('/') or '/'
+    return f'https://{host}{path}'
+
+def parse_m3u8(playlist_text, playlist_url):
+    """ Get the absolute segment urls of a media playlist, in order """
+    return [
+        urljoin(playlist_url, line.strip())
+        for line in playlist_text.splitlines()
+        if line.strip() and not line.startswith('#')
+    ]
+
+def is_encrypted_m3u8(playlist_text):
+    """ Check if a media playlist has encrypted segments """
+    return any(
+        line.startswith('#EXT-X-KEY') and 'METHOD=NONE' not in line
+        for line in playlist_text.splitlines()
+    )
+
+UNSAFE_FILENAME_REGEX = re.compile(r'[\\/:*?"<>|\x00-\x1f]')
+
+def track_filename(track):
+    """ Get a safe `artist - title.mp3` file name for a track """
+    name = UNSAFE_FILENAME_REGEX.sub('_', f'{track.artist} - {track.title}').strip(' .')
+    return f'{name or track.id}.mp3'
+
 def get_large_artwork_url(artwork_url):
     """ Get 500x500 arwork url """
     return artwork_url.replace('large', 't500x500') if artwork_url else None
@@ -8,7 +8,6 @@ except:
 
 requirements = [
     'mutagen',
-    'bs4',
     'aiohttp'
 ]
 
@@ -25,6 +24,7 @@ setup(
     packages=['sclib'],
     python_requires='>=3.6',
     install_requires=requirements,
+    extras_require={'orjson': ['orjson'], 'msgspec': ['msgspec']},
     test_suite='pytest',
     tests_require=['pytest', 'pytest-asyncio'],
 )
\ No newline at end of file
@@ -0,0 +1,28 @@
+""" Test converting async tracks and playlists to dicts and back """
+from sclib.asyncio import Playlist, SoundcloudAPI, Track
+from tests.stub import make_track_obj
+
+
+def test_track_to_dict_round_trips():
+    """ Test that to_dict builds an equal track in both modes and shares the api values """
+    for compact in (False, True):
+        api = SoundcloudAPI(client_id='test', compact=compact)
+        obj = make_track_obj(1, title='Artist - Song - Remix', genre='house')
+        track = Track(obj=obj, client=api)
+        track.album, track.track_no = 'Album', 3
+        track_dict = track.to_dict()
+        assert track_dict['media'] is obj['media']
+        copy = Track(obj=track_dict, client=api)
+        assert (copy.artist, copy.title, copy.album, copy.track_no, copy.genre) == (
+            'Artist', 'Song - Remix', 'Album', 3, 'house'
+        )
+
+
+def test_playlist_to_dict():
+    """ Test that playlists convert their tracks too """
+    api = SoundcloudAPI(client_id='test')
+    playlist = Playlist(obj={'id': 7, 'kind': 'playlist', 'title': 'mix', 'tracks': [make_track_obj(1)]}, client=api)
+    playlist.tracks = [Track(obj=make_track_obj(1), client=api)]
+    playlist_dict = playlist.to_dict()
+    assert playlist_dict['title'] == 'mix' and playlist_dict['id'] == 7
+    assert playlist_dict['tracks'][0]['id'] == 1 and 'client' not in playlist_dict['tracks'][0]
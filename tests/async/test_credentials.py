@@ -0,0 +1,65 @@
+""" Test async client_id caching and refresh """
+import pytest
+
+from sclib import util
+from sclib.asyncio import SoundcloudAPI
+from sclib.cache import CredentialCache
+from tests.stub import StubServer
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server with a page whose script holds client_id `fresh` """
+    with StubServer() as server:
+        server.routes['/page'] = f'<html><script src="{server.url}/app.js"></script></html>'.encode()
+        server.routes['/app.js'] = b'fetch("/x?client_id=fresh")'
+        monkeypatch.setattr(util, 'SCRAPE_URLS', [f'{server.url}/page'])
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_cached_id_skips_scraping(stub):
+    """ Test that a cached client_id is used without scraping """
+    cache = CredentialCache()
+    cache.set('cached')
+    async with SoundcloudAPI(credential_cache=cache) as api:
+        await api.get_credentials()
+    assert api.client_id == 'cached'
+    assert not stub.requests
+
+
+@pytest.mark.asyncio
+async def test_auth_failure_refreshes_and_retries(stub):
+    """ Test that a 403 invalidates the cached id and the call is retried once """
+    def endpoint(handler):
+        if 'client_id=fresh' in handler.path:
+            return 200, {}, b'{"ok": true}'
+        return 403, {}, b''
+
+    stub.routes['/api'] = endpoint
+    cache = CredentialCache()
+    cache.set('expired')
+    async with SoundcloudAPI(credential_cache=cache) as api:
+        await api.get_credentials()
+        assert await api.get_obj_from(f'{stub.url}/api?client_id=expired') == {'ok': True}
+    assert api.client_id == 'fresh'
+    assert cache.get()['client_id'] == 'fresh'
+
+
+@pytest.mark.asyncio
+async def test_scrape_stops_at_first_match(stub):
+    """ Test that the id is found among several scripts and remembered for next time """
+    stub.routes['/page'] = ''.join(
+        f'<script src="{stub.url}/{name}.js"></script>' for name in ('a', 'app', 'b')
+    ).encode()
+    stub.routes['/a.js'] = stub.routes['/b.js'] = b'no id here'
+    cache = CredentialCache()
+    async with SoundcloudAPI(credential_cache=cache) as api:
+        await api.get_credentials()
+        assert api.client_id == 'fresh'
+        assert cache.get()['script_url'] == f'{stub.url}/app.js'
+
+        stub.requests.clear()
+        await api.refresh_credentials()
+    paths = [path for _, path in stub.requests]
+    assert paths[paths.index('/page'):] == ['/page', '/app.js']  # ignore requests of the first scrape
@@ -0,0 +1,279 @@
+""" Test async track downloads against a local server """
+import asyncio
+from concurrent import futures
+import gc
+import tempfile
+import tracemalloc
+import warnings
+
+import mutagen
+import pytest
+import pytest_asyncio
+
+from sclib.asyncio import Playlist, SoundcloudAPI, Track, tag_files
+from sclib.retry import RetryPolicy
+from sclib.sync import APIError, UnsupportedFormatError
+from tests.stub import StubServer, add_hls_stream, make_mp3, make_track_obj, ranged_route, tracks_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture():
+    """ Local server """
+    with StubServer() as server:
+        yield server
+
+
+@pytest_asyncio.fixture(name='api')
+async def api_fixture():
+    """ Client with a fake client id """
+    async with SoundcloudAPI(client_id='test') as api:
+        yield api
+
+
+def make_track(stub, api, mp3, track_id=1):
+    """ Track whose progressive stream is served by the stub """
+    stub.routes[f'/transcodings/{track_id}/progressive'] = {'url': f'{stub.url}/audio/{track_id}.mp3'}
+    stub.routes[f'/audio/{track_id}.mp3'] = mp3
+    obj = make_track_obj(track_id, stub.url, title='Artist - Title')
+    return Track(obj=obj, client=api)
+
+
+@pytest.mark.asyncio
+async def test_write_mp3_to_streams_chunks(stub, api):
+    """ Test that the whole stream is written and tagged """
+    mp3 = make_mp3(1024 * 1024)
+    track = make_track(stub, api, mp3)
+    with tempfile.TemporaryFile() as file:
+        await track.write_mp3_to(file, chunk_size=4096)
+        audio = mutagen.File(file, filename='x.mp3')
+        file.seek(0, 2)
+        assert file.tell() > len(mp3)
+    assert audio.tags['TIT2'] == 'Title'
+    assert audio.tags['TPE1'] == 'Artist'
+
+
+@pytest.mark.asyncio
+async def test_concurrent_downloads_memory_is_bounded(stub, api):
+    """ Test that memory depends on concurrency and chunk size rather than track length """
+    tracks = [make_track(stub, api, make_mp3(8 * 1024 * 1024), track_id) for track_id in range(4)]
+    files = [tempfile.TemporaryFile() for _ in tracks]
+    tracemalloc.start()
+    try:
+        await asyncio.gather(*[t.write_mp3_to(f) for t, f in zip(tracks, files)])
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        for file in files:
+            file.close()
+    assert peak < 8 * 1024 * 1024
+
+
+@pytest.mark.asyncio
+async def test_downloads_reuse_connections(stub, api):
+    """ Test that sequential downloads share the client's pooled connections """
+    for track_id in range(3):
+        track = make_track(stub, api, make_mp3(64 * 1024), track_id)
+        with tempfile.TemporaryFile() as file:
+            await track.write_mp3_to(file)
+    assert len(stub.requests) == 6
+    assert len(stub.peers) == 1
+
+
+@pytest.mark.asyncio
+async def test_client_closes_its_session():
+    """ Test that the context manager closes the session it created """
+    async with SoundcloudAPI(client_id='test', limit=4, limit_per_host=2) as api:
+        session = api.session
+        assert session.connector.limit == 4
+        assert session.connector.limit_per_host == 2
+    assert session.closed
+
+
+@pytest.mark.asyncio
+async def test_download_all_uses_file_factory_and_reports_errors(stub, api, tmp_path):
+    """ Test that a playlist is downloaded concurrently through a file factory """
+    tracks = []
+    for track_id in (1, 2, 3):
+        make_track(stub, api, make_mp3(64 * 1024), track_id)
+        tracks.append(make_track_obj(track_id, stub.url, title=f'Artist - Song {track_id}'))
+    tracks[0]['media']['transcodings'] = []
+    playlist = Playlist(obj={'id': 9, 'kind': 'playlist', 'title': 'Album', 'tracks': tracks}, client=api)
+
+    def open_file(track):
+        return open(tmp_path / f'{track.id}.mp3', 'wb+')  # pylint: disable=consider-using-with
+
+    results = await playlist.download_all(open_file, concurrency=2)
+
+    assert [result.track.id for result in results] == [1, 2, 3]
+    assert isinstance(results[0].error, UnsupportedFormatError)
+    assert (tmp_path / '1.mp3').stat().st_size == 0
+    assert [result.error for result in results[1:]] == [None, None]
+    tags = mutagen.File(results[1].path).tags
+    assert (tags['TALB'], tags['TRCK'], tags['TIT2']) == ('Album', '2', 'Song 2')
+
+
+@pytest.mark.asyncio
+async def test_download_all_reports_tracks_of_failed_batches(stub, tmp_path, monkeypatch):
+    """ Test that a stub whose batch failed gets a result and later tracks keep their position """
+    monkeypatch.setattr(SoundcloudAPI, 'TRACK_API_MAX_REQUEST_SIZE', 1)
+    monkeypatch.setattr(SoundcloudAPI, 'TRACKS_URL', stub.url + '/tracks?ids={track_ids}&client_id={client_id}')
+    stub.routes['/tracks'] = tracks_route(stub.url, failing={2})
+    async with SoundcloudAPI(client_id='test', retry_policy=RetryPolicy(retries=0)) as api:
+        for track_id in (1, 3):
+            make_track(stub, api, make_mp3(16 * 1024), track_id)
+        playlist = Playlist(obj={'id': 9, 'kind': 'playlist', 'title': 'Album', 'tracks': [{'id': i} for i in (1, 2, 3)]},
+                            client=api)
+        results = await playlist.download_all(str(tmp_path))
+
+    assert len(results) == 3
+    assert results[1].track == {'id': 2} and results[1].path is None
+    assert isinstance(results[1].error, APIError)
+    assert [(results[i].error, results[i].track.track_no) for i in (0, 2)] == [(None, 1), (None, 3)]
+    assert mutagen.File(results[2].path).tags['TRCK'] == '3'
+
+
+@pytest.mark.asyncio
+async def test_hls_segments_are_assembled_in_order(stub, api):
+    """ Test that a track without a progressive stream is assembled from HLS segments """
+    mp3 = make_mp3(256 * 1024)
+    obj = make_track_obj(1, stub.url, title='Artist - Title')
+    obj['media']['transcodings'] = add_hls_stream(stub, 1, mp3, segments=6, delays=(0.2, 0, 0.1, 0, 0.05))
+    track = Track(obj=obj, client=api)
+    with tempfile.TemporaryFile() as file:
+        await track.write_hls_to(file, window=3)
+        file.seek(0)
+        assert file.read() == mp3
+        await track.write_mp3_to(file)
+        audio = mutagen.File(file, filename='x.mp3')
+    assert audio.tags['TIT2'] == 'Title'
+
+
+@pytest.mark.asyncio
+async def test_download_to_resumes_with_a_fresh_stream_url(stub, api, tmp_path):
+    """ Test that an interrupted download continues with a Range request on a new stream url """
+    mp3 = make_mp3(512 * 1024)
+    track = make_track(stub, api, mp3)
+    stub.routes['/audio/1.mp3'] = ranged_route(mp3, cut_at=200 * 1000)
+    path = tmp_path / 'track.mp3'
+    header, trailer = await track.build_id3_tags()
+    with pytest.raises(Exception):
+        await track.download_to(path)
+    assert not path.exists()
+    stub.routes['/transcodings/1/progressive'] = {'url': f'{stub.url}/audio/fresh.mp3'}
+    stub.routes['/audio/fresh.mp3'] = ranged_route(mp3)
+    del stub.routes['/audio/1.mp3']
+
+    await track.download_to(path)
+
+    ranges = [(route, headers.get('Range')) for _, route, headers in stub.received if route.startswith('/audio')]
+    assert ranges == [('/audio/1.mp3', None), ('/audio/1.mp3', 'bytes=200000-'), ('/audio/fresh.mp3', 'bytes=200000-')]
+    assert path.read_bytes() == header + mp3 + trailer
+    assert mutagen.File(path).tags['TIT2'] == 'Title'
+
+
+@pytest.mark.asyncio
+async def test_write_mp3_to_fetches_ranges_in_parallel(stub, api, monkeypatch):
+    """ Test that a stream is split into ranges written at their offsets """
+    monkeypatch.setattr(Track, 'MIN_RANGE_SIZE', 64 * 1024)
+    mp3 = make_mp3(512 * 1024 + 3)
+    track = make_track(stub, api, mp3)
+    stub.routes['/audio/1.mp3'] = ranged_route(mp3)
+    with tempfile.TemporaryFile() as file:
+        await track.write_mp3_to(file, connections=3)
+        assert mp3 in file.read()
+    ranges = [headers.get('Range') for _, route, headers in stub.received if route == '/audio/1.mp3']
+    assert len(ranges) == 4 and ranges[0] == 'bytes=0-0'
+
+
+@pytest.mark.asyncio
+async def test_tagging_runs_on_a_process_pool(stub):
+    """ Test that tags can be rendered on a process pool executor """
+    with futures.ProcessPoolExecutor(1) as executor:
+        async with SoundcloudAPI(client_id='test', tag_executor=executor) as api:
+            track = make_track(stub, api, make_mp3(64 * 1024))
+            track.album = 'Album'
+            with tempfile.TemporaryFile() as file:
+                await track.write_mp3_to(file)
+                tags = mutagen.File(file, filename='x.mp3').tags
+    assert (tags['TIT2'], tags['TALB']) == ('Title', 'Album')
+
+
+@pytest.mark.asyncio
+async def test_tag_files_tags_untagged_downloads_in_a_batch(stub, api, tmp_path):
+    """ Test that files downloaded with tag=False are tagged later on a separate pool """
+    downloads = []
+    for track_id in (1, 2, 3):
+        track = make_track(stub, api, make_mp3(64 * 1024), track_id)
+        track.track_no = track_id
+        path = tmp_path / f'{track_id}.mp3'
+        with open(path, 'wb+') as file:
+            await track.write_mp3_to(file, tag=False)
+        assert not path.read_bytes().startswith(b'ID3')
+        downloads.append((track, path))
+
+    with futures.ThreadPoolExecutor(2) as executor:
+        await tag_files(downloads, executor)
+
+    assert [mutagen.File(path).tags['TRCK'] for _, path in downloads] == ['1', '2', '3']
+    assert all(track.ready for track, _ in downloads)
+
+
+@pytest.mark.asyncio
+async def test_shared_cover_is_downloaded_once(stub, api):
+    """ Test that concurrent downloads of tracks sharing a cover make one artwork request """
+    stub.routes['/cover-t500x500.jpg'] = b'\xff\xd8\xff\xe0' + b'\x00' * 1024
+    tracks = []
+    for track_id in range(5):
+        track = make_track(stub, api, make_mp3(16 * 1024), track_id)
+        track.artwork_url = f'{stub.url}/cover-large.jpg'
+        tracks.append(track)
+    files = [tempfile.TemporaryFile() for _ in tracks]
+    try:
+        await asyncio.gather(*[track.write_mp3_to(file) for track, file in zip(tracks, files)])
+        assert all('APIC:Cover' in mutagen.File(file, filename='x.mp3').tags for file in files)
+    finally:
+        for file in files:
+            file.close()
+    assert [path for _, path in stub.requests].count('/cover-t500x500.jpg') == 1
+
+
+def test_client_can_be_reused_across_event_loops(stub):
+    """ Test that a client closed at the end of each loop gets a new session per loop without leaking """
+    api = SoundcloudAPI(client_id='test')
+    stub.routes['/data'] = {'ok': True}
+
+    async def fetch():
+        async with api:
+            return await api.get_obj_from(f'{stub.url}/data')
+
+    gc.collect()  # leftovers of earlier tests
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter('always', ResourceWarning)
+        for _ in range(2):
+            assert asyncio.run(fetch()) == {'ok': True}
+        gc.collect()
+    assert not [warning for warning in caught if issubclass(warning.category, ResourceWarning)]
+
+
+def test_session_left_open_on_another_loop_warns(stub):
+    """ Test that using a client on a new loop while its old session is open warns and opens a new one """
+    api = SoundcloudAPI(client_id='test')
+    stub.routes['/data'] = {'ok': True}
+
+    async def fetch():
+        assert await api.get_obj_from(f'{stub.url}/data') == {'ok': True}
+        return api.session
+
+    async def fetch_and_close():
+        async with api:
+            return await fetch()
+
+    loop = asyncio.new_event_loop()
+    try:
+        first = loop.run_until_complete(fetch())
+        with pytest.warns(ResourceWarning, match='new event loop'):
+            second = asyncio.run(fetch_and_close())
+        assert second is not first and second.closed
+        loop.run_until_complete(first.close())
+    finally:
+        loop.close()
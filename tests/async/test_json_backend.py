@@ -0,0 +1,28 @@
+""" Test decoding large responses off the event loop """
+import threading
+from concurrent import futures
+
+import pytest
+
+from sclib.asyncio import SoundcloudAPI
+
+
+@pytest.mark.asyncio
+async def test_large_responses_are_decoded_on_the_executor():
+    """ Test that only responses of at least JSON_OFFLOAD_SIZE bytes go to json_executor """
+    small = b'{"id": 1}'
+    large = b'{"ids": [' + b','.join(b'1' for _ in range(SoundcloudAPI.JSON_OFFLOAD_SIZE // 2)) + b']}'
+    with futures.ThreadPoolExecutor(1, thread_name_prefix='json') as executor:
+        api = SoundcloudAPI(client_id='test', json_executor=executor)
+        threads = []
+        loads = api.json_backend.loads
+
+        def recording_loads(data):
+            threads.append(threading.current_thread().name)
+            return loads(data)
+
+        api.json_backend = api.json_backend._replace(loads=recording_loads)
+        assert await api.decode_json(small) == {'id': 1}
+        assert len((await api.decode_json(large))['ids']) == SoundcloudAPI.JSON_OFFLOAD_SIZE // 2
+    assert threads[0] == threading.current_thread().name
+    assert threads[1].startswith('json')
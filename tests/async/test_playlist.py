@@ -1,9 +1,12 @@
 """
 Test async playlists
 """
+import time
+
 import pytest
 
-from sclib.asyncio import SoundcloudAPI
+from sclib.asyncio import Playlist, SoundcloudAPI, Track
+from tests.stub import StubServer, make_track_obj, tracks_route
 
 pytest_plugins = ('pytest_asyncio',)
 
@@ -33,3 +36,45 @@ async def test_playlist_type(sclib: SoundcloudAPI, playlist_url: str, expected_p
     """ Test async playlist type """
     test_playlist = await sclib.resolve(playlist_url)
     assert test_playlist.kind == expected_playlist_kind
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering tracks?ids= with a delay """
+    with StubServer() as server:
+        route = tracks_route(server.url, missing={13})
+
+        def slow_route(handler):
+            time.sleep(0.1)
+            return route(handler)
+
+        server.routes['/tracks'] = slow_route
+        monkeypatch.setattr(SoundcloudAPI, 'TRACKS_URL', server.url + '/tracks?ids={track_ids}&client_id={client_id}')
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_playlist_hydration_is_concurrent_and_ordered(stub):
+    """ Test that batches are fetched concurrently and tracks keep playlist order """
+    tracks = [make_track_obj(1000)] + [{'id': i} for i in range(500, 0, -1)]
+    async with SoundcloudAPI(client_id='test') as api:
+        playlist = Playlist(obj={'id': 1, 'kind': 'playlist', 'tracks': tracks}, client=api)
+        await playlist.clean_attributes(concurrency=10)
+    assert len(stub.requests) == 10
+    assert 1 < stub.max_in_flight <= 10
+    assert [track.id for track in playlist.tracks] == [1000] + [i for i in range(500, 0, -1) if i != 13]
+    assert all(isinstance(track, Track) for track in playlist.tracks)
+
+
+@pytest.mark.asyncio
+async def test_async_iteration_yields_tracks_as_batches_arrive(stub):
+    """ Test that hydrated tracks are yielded in order as soon as their batch arrives """
+    tracks = [make_track_obj(1000)] + [{'id': i} for i in range(1, 301)]
+    async with SoundcloudAPI(client_id='test') as api:
+        playlist = Playlist(obj={'id': 1, 'kind': 'playlist', 'tracks': tracks}, client=api)
+        arrivals = [(track.id, len(stub.requests)) async for track in playlist.iter_tracks(1)]
+    assert [track_id for track_id, _ in arrivals] == [1000] + [i for i in range(1, 301) if i != 13]
+    assert arrivals[1][1] <= 2  # after the first of six batches, the next may be on its way
+    assert arrivals[-1][1] == 6
+    assert stub.max_in_flight == 1
+    assert playlist.ready
@@ -0,0 +1,64 @@
+""" Test async resolving against a local server """
+import asyncio
+import json
+
+import pytest
+
+from sclib import util
+from sclib.asyncio import Playlist, SoundcloudAPI, Track
+from sclib.cache import CredentialCache, ResolveCache
+from tests.stub import StubServer, make_track_obj
+
+TRACK_URL = 'https://soundcloud.com/some-artist/some-track'
+PLAYLIST_URL = 'https://soundcloud.com/some-artist/sets/some-set'
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering resolve calls """
+    with StubServer() as server:
+        def resolve(handler):
+            if 'sets' in handler.path:
+                obj = {'id': 9, 'kind': 'playlist', 'tracks': [make_track_obj(1)]}
+            else:
+                obj = make_track_obj(1)
+            return 200, {}, json.dumps(obj).encode()
+
+        server.routes['/resolve'] = resolve
+        monkeypatch.setattr(SoundcloudAPI, 'RESOLVE_URL', server.url + '/resolve?url={url}&client_id={client_id}')
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_resolve_cache_hits_skip_network(stub):
+    """ Test that resolved objects are served from the cache """
+    cache = ResolveCache()
+    async with SoundcloudAPI(client_id='test', resolve_cache=cache) as api:
+        for url in (TRACK_URL, TRACK_URL + '/', PLAYLIST_URL, PLAYLIST_URL):
+            resolved = await api.resolve(url)
+            assert type(resolved) is (Track if url.startswith(TRACK_URL) else Playlist)
+    assert len(stub.requests) == 2
+    assert (cache.hits, cache.misses) == (2, 2)
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_calls_are_coalesced(stub):
+    """ Test that tasks resolving the same url at once share one request """
+    async with SoundcloudAPI(client_id='test') as api:
+        tracks = await asyncio.gather(*[api.resolve(TRACK_URL) for _ in range(8)])
+        assert len({id(track) for track in tracks}) == 8
+        assert len(stub.requests) == 1
+        await api.resolve(TRACK_URL)
+    assert len(stub.requests) == 2
+
+
+@pytest.mark.asyncio
+async def test_concurrent_credential_fetches_are_coalesced(stub, monkeypatch):
+    """ Test that tasks missing a client_id at the same time scrape once """
+    stub.routes['/page'] = f'<script src="{stub.url}/app.js"></script>'.encode()
+    stub.routes['/app.js'] = b'?client_id=scraped'
+    monkeypatch.setattr(util, 'SCRAPE_URLS', [f'{stub.url}/page'])
+    async with SoundcloudAPI(credential_cache=CredentialCache()) as api:
+        await asyncio.gather(*[api.resolve(TRACK_URL) for _ in range(8)])
+    assert api.client_id == 'scraped'
+    assert [path for _, path in stub.requests].count('/page') == 1
@@ -0,0 +1,48 @@
+""" Test resolving many share links with the async client """
+import aiohttp
+import pytest
+
+from sclib.asyncio import SoundcloudAPI, Track
+from sclib.sync import APIError
+from tests.stub import StubServer, redirect_route, resolve_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server with short links redirecting to track pages and a resolve endpoint """
+    with StubServer() as server:
+        for track_id in (1, 2):
+            server.routes[f'/s/{track_id}'] = redirect_route(f'{server.url}/artist/track-{track_id}')
+            server.routes[f'/artist/track-{track_id}'] = b'<html>a large page</html>'
+        server.routes['/s/no-head'] = redirect_route(f'{server.url}/artist/track-2', head_allowed=False)
+        server.routes['/s/deleted'] = redirect_route(f'{server.url}/artist/deleted')
+        server.routes['/artist/deleted'] = b''
+        server.routes['/resolve'] = resolve_route(server.url)
+        monkeypatch.setattr(SoundcloudAPI, 'RESOLVE_URL', server.url + '/resolve?url={url}&client_id={client_id}')
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_results_in_input_order_with_errors(stub):
+    """ Test that every url gets a result in order and failures are reported per url """
+    urls = [f'{stub.url}/s/2', f'{stub.url}/s/deleted', f'{stub.url}/s/1', f'{stub.url}/s/missing', f'{stub.url}/s/no-head']
+    async with SoundcloudAPI(client_id='test') as api:
+        results = await api.resolve_many(urls, concurrency=2)
+    assert [result.url for result in results] == urls
+    assert [result.resource.id for result in results if result.error is None] == [2, 1, 2]
+    assert isinstance(results[0].resource, Track)
+    assert isinstance(results[1].error, APIError)
+    assert isinstance(results[3].error, aiohttp.ClientResponseError) and results[3].error.status == 404
+
+
+@pytest.mark.asyncio
+async def test_redirects_use_head_and_are_cached(stub):
+    """ Test that share links are followed without downloading pages, once per link """
+    urls = [f'{stub.url}/s/1', f'{stub.url}/s/2', f'{stub.url}/s/1']
+    async with SoundcloudAPI(client_id='test') as api:
+        await api.resolve_many(urls)
+        await api.resolve_many(urls)
+    page_requests = [(method, path) for method, path in stub.requests if not path.startswith('/resolve')]
+    assert sorted(page_requests) == [
+        ('HEAD', '/artist/track-1'), ('HEAD', '/artist/track-2'), ('HEAD', '/s/1'), ('HEAD', '/s/2')
+    ]
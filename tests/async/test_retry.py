@@ -0,0 +1,83 @@
+""" Test async rate limiting and retries against a local server that throttles """
+import tempfile
+import time
+
+import pytest
+
+from sclib import asyncio as sclib_asyncio
+from sclib.asyncio import SoundcloudAPI, Track
+from sclib.retry import RateLimiter, RetryPolicy
+from sclib.sync import APIError, RateLimitedError
+from tests.stub import StubServer, flaky_route, make_mp3, make_track_obj
+
+
+@pytest.fixture(name='stub')
+def stub_fixture():
+    """ Local server """
+    with StubServer() as server:
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_retry_after_is_honored_and_slows_the_limiter(stub):
+    """ Test that 429s are retried after Retry-After and lower the rate """
+    stub.routes['/api'] = flaky_route(2, 429, {'Retry-After': '0.2'})
+    limiter = RateLimiter(rate=40)
+    async with SoundcloudAPI(client_id='test', rate_limiter=limiter) as api:
+        started = time.monotonic()
+        assert await api.get_obj_from(f'{stub.url}/api?client_id=test') == {'ok': True}
+        assert time.monotonic() - started >= 0.4
+    assert len(stub.requests) == 3
+    assert limiter.rate == 10.5
+
+
+@pytest.mark.asyncio
+async def test_failures_raise_structured_errors(stub):
+    """ Test that exhausted retries, client errors and bad json raise APIError """
+    stub.routes['/down'] = flaky_route(10, 503)
+    stub.routes['/busy'] = flaky_route(10, 429)
+    stub.routes['/html'] = b'<html>'
+    async with SoundcloudAPI(client_id='test', retry_policy=RetryPolicy(retries=2, backoff=0.01)) as api:
+        with pytest.raises(APIError) as info:
+            await api.get_obj_from(f'{stub.url}/down')
+        assert info.value.status == 503
+        with pytest.raises(RateLimitedError):
+            await api.get_obj_from(f'{stub.url}/busy')
+        with pytest.raises(APIError) as info:
+            await api.get_obj_from(f'{stub.url}/missing')
+        assert info.value.status == 404
+        with pytest.raises(APIError) as info:
+            await api.get_obj_from(f'{stub.url}/html')
+        assert info.value.status is None
+    assert len(stub.requests) == 3 + 3 + 1 + 1
+
+
+@pytest.mark.asyncio
+async def test_throttled_artwork_and_stream_are_retried(stub):
+    """ Test that a 429 on the cover or on the stream backs off instead of failing the download """
+    mp3, cover = make_mp3(64 * 1024), b'\xff\xd8\xff\xe0' + b'\x00' * 1024
+    stub.routes['/transcodings/1/progressive'] = {'url': f'{stub.url}/audio/1.mp3'}
+    stub.routes['/audio/1.mp3'] = flaky_route(1, 429, {'Retry-After': '0'}, mp3)
+    stub.routes['/cover-t500x500.jpg'] = flaky_route(1, 429, {'Retry-After': '0'}, cover)
+    async with SoundcloudAPI(client_id='test', retry_policy=RetryPolicy(retries=2, backoff=0.01)) as api:
+        track = Track(obj=make_track_obj(1, stub.url, title='Artist - Title'), client=api)
+        track.artwork_url = f'{stub.url}/cover-large.jpg'
+        with tempfile.TemporaryFile() as file:
+            await track.write_mp3_to(file)
+            data = file.read()
+    assert mp3 in data and cover in data
+    paths = [path for _, path in stub.requests]
+    assert paths.count('/audio/1.mp3') == 2
+    assert paths.count('/cover-t500x500.jpg') == 2
+
+
+@pytest.mark.asyncio
+async def test_module_get_obj_from_raises(stub):
+    """ Test that the module level get_obj_from raises APIError instead of returning False """
+    stub.routes['/html'] = b'<html>'
+    with pytest.raises(APIError) as info:
+        await sclib_asyncio.get_obj_from(f'{stub.url}/missing')
+    assert info.value.status == 404
+    with pytest.raises(APIError) as info:
+        await sclib_asyncio.get_obj_from(f'{stub.url}/html')
+    assert info.value.status is None
@@ -0,0 +1,46 @@
+""" Test async paginated search against a local server """
+import asyncio
+
+import pytest
+
+from sclib.asyncio import Playlist, SoundcloudAPI, Track
+from tests.stub import StubServer, search_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering search?q= """
+    with StubServer() as server:
+        server.routes['/search'] = search_route(server.url, total=23)
+        monkeypatch.setattr(
+            SoundcloudAPI, 'SEARCH_URL',
+            server.url + '/search?q={query}&client_id={client_id}&limit={limit}&offset={offset}'
+        )
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_search_follows_cursors_and_prefetches(stub):
+    """ Test that pages are followed, users skipped and the next page prefetched """
+    async with SoundcloudAPI(client_id='test') as api:
+        results = api.search('deep house', page_size=10)
+        first = await results.__anext__()  # pylint: disable=unnecessary-dunder-call
+        for _ in range(100):
+            if len(stub.requests) == 2:
+                break
+            await asyncio.sleep(0.01)
+        assert len(stub.requests) == 2
+        rest = [result async for result in results]
+    ids = [result.id for result in [first] + rest]
+    assert ids == [n for n in range(23) if n % 5 != 4]
+    assert isinstance(first, Track) and isinstance(rest[2], Playlist)
+    assert all('client_id=test' in path for _, path in stub.requests)
+
+
+@pytest.mark.asyncio
+async def test_limit_stops_paging(stub):
+    """ Test that no page beyond the limit is fetched """
+    async with SoundcloudAPI(client_id='test') as api:
+        results = [result async for result in api.search('query', limit=7, page_size=5)]
+    assert len(results) == 7
+    assert len(stub.requests) == 2
@@ -0,0 +1,26 @@
+""" Test async bulk track fetching against a local server """
+import pytest
+
+from sclib.asyncio import SoundcloudAPI
+from sclib.retry import RetryPolicy
+from tests.stub import StubServer, tracks_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering tracks?ids= """
+    with StubServer() as server:
+        server.routes['/tracks'] = tracks_route(server.url, missing={7}, failing={120})
+        monkeypatch.setattr(SoundcloudAPI, 'TRACKS_URL', server.url + '/tracks?ids={track_ids}&client_id={client_id}')
+        yield server
+
+
+@pytest.mark.asyncio
+async def test_fetch_tracks_orders_dedupes_and_reports_missing(stub):
+    """ Test ordering, de-duplication and partial results """
+    track_ids = [149, 3] + list(range(150)) + [3]
+    async with SoundcloudAPI(client_id='test', retry_policy=RetryPolicy(retries=0)) as api:
+        result = await api.fetch_tracks(*track_ids)
+    assert len(stub.requests) == 3
+    assert result.missing == [7] + list(range(99, 149))  # 99-148 share a batch with failing 120
+    assert [track['id'] for track in result.tracks] == [149, 3] + [i for i in range(99) if i not in (3, 7)]
@@ -0,0 +1,45 @@
+""" Test streaming a user's collections with the async client """
+import asyncio
+
+import pytest
+
+from sclib.asyncio import SoundcloudAPI, Track
+from tests.stub import StubServer, tracks_route, user_collection_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering a user's tracks and tracks?ids= """
+    with StubServer() as server:
+        server.routes['/users/7/tracks'] = user_collection_route(server.url, total=23)
+        server.routes['/tracks'] = tracks_route(server.url)
+        monkeypatch.setattr(SoundcloudAPI, 'TRACKS_URL', server.url + '/tracks?ids={track_ids}&client_id={client_id}')
+        monkeypatch.setattr(SoundcloudAPI, 'USER_TRACKS_URL', server.url + '/users/{user_id}/tracks?client_id={client_id}&limit={limit}')
+        monkeypatch.setattr(SoundcloudAPI, 'COLLECTION_PAGE_SIZE', 5)
+        yield server
+
+
+def page_requests(stub):
+    """ Paths of the requests for collection pages """
+    return [path for _, path in stub.requests if path.startswith('/users/')]
+
+
+@pytest.mark.asyncio
+async def test_stream_hydrates_stubs_and_stops_at_since(stub):
+    """ Test that stubs are hydrated and no page past the cutoff is fetched """
+    async with SoundcloudAPI(client_id='test') as api:
+        tracks = [track async for track in api.iter_user_tracks(7, since='2023-12-31T11:30:00Z')]
+    assert [track.id for track in tracks] == list(range(13))
+    assert all(isinstance(track, Track) and track.media for track in tracks)
+    assert len(page_requests(stub)) == 3
+
+
+@pytest.mark.asyncio
+async def test_read_ahead_is_bounded(stub):
+    """ Test that only `read_ahead` pages are fetched ahead of the consumer """
+    async with SoundcloudAPI(client_id='test') as api:
+        tracks = api.iter_user_tracks(7, read_ahead=2)
+        await tracks.__anext__()  # pylint: disable=unnecessary-dunder-call
+        await asyncio.sleep(0.2)
+        assert len(page_requests(stub)) == 3
+        await tracks.aclose()
@@ -0,0 +1,309 @@
+""" Local HTTP stand-in used by the offline tests """
+import json
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote, urlsplit
+
+MP3_FRAME = b'\xff\xfb\x90\x64' + b'\x00' * 413  # 128kbps 44.1kHz MPEG1 layer 3 frame
+
+
+def make_mp3(size):
+    """ Get at least `size` bytes of silent mp3 frames """
+    frames = -(-size // len(MP3_FRAME))
+    return MP3_FRAME * frames
+
+
+def make_track_obj(track_id, base_url='http://127.0.0.1', **extra):
+    """ Get a minimal api-v2 track object """
+    obj = {
+        'id': track_id,
+        'kind': 'track',
+        'title': f'track {track_id}',
+        'artwork_url': None,
+        'user': {'username': f'user {track_id}'},
+        'media': {'transcodings': [{
+            'url': f'{base_url}/transcodings/{track_id}/progressive',
+            'format': {'protocol': 'progressive', 'mime_type': 'audio/mpeg'},
+        }]},
+    }
+    obj.update(extra)
+    return obj
+
+
+def add_hls_stream(server, track_id, mp3, segments=8, delays=()):
+    """ Serve `mp3` as an HLS stream of `segments` parts and return the track's transcodings
+
+    Segment `n` is answered after `delays[n]` seconds so tests can make segments arrive out
+    of order.  The segment urls in the playlist are relative to the playlist url.
+    """
+    size = -(-len(mp3) // segments)
+    parts = [mp3[n * size:(n + 1) * size] for n in range(segments)]
+    playlist = ['#EXTM3U', '#EXT-X-VERSION:6', '#EXT-X-TARGETDURATION:10']
+    for number, part in enumerate(parts):
+        delay = delays[number] if number < len(delays) else 0
+
+        def route(_, part=part, delay=delay):
+            time.sleep(delay)
+            return 200, {}, part
+
+        server.routes[f'/hls/{track_id}/{number}.mp3'] = route
+        playlist += ['#EXTINF:10.0,', f'{number}.mp3']
+    playlist.append('#EXT-X-ENDLIST')
+    server.routes[f'/hls/{track_id}/playlist.m3u8'] = '\n'.join(playlist).encode()
+    server.routes[f'/transcodings/{track_id}/hls'] = {'url': f'{server.url}/hls/{track_id}/playlist.m3u8'}
+    return [{
+        'url': f'{server.url}/transcodings/{track_id}/hls',
+        'format': {'protocol': 'hls', 'mime_type': 'audio/mpeg'},
+    }]
+
+
+def ranged_route(data, etag='"v1"', cut_at=None, rate=None):
+    """ Route serving `data` with Range and If-Range support
+
+    When `cut_at` is given the first response is cut off after that many bytes of the
+    file, like a dropped connection.  `rate` limits each response to that many bytes
+    per second, like a CDN throttling every connection.
+    """
+    cuts = [cut_at] if cut_at is not None else []
+
+    def route(handler):
+        start, end = 0, len(data) - 1
+        requested = handler.headers.get('Range')
+        if_range = handler.headers.get('If-Range')
+        if requested and if_range in (None, etag):
+            first, last = requested.split('=')[1].split('-')
+            start, end = int(first), min(int(last or end), end)
+            if start >= len(data):
+                return 416, {'Content-Range': f'bytes */{len(data)}'}, b''
+        partial = start or end < len(data) - 1
+        headers = {'ETag': etag, 'Accept-Ranges': 'bytes', 'Content-Length': str(end + 1 - start)}
+        if partial:
+            headers['Content-Range'] = f'bytes {start}-{end}/{len(data)}'
+        status = 206 if partial else 200
+        if cuts:
+            handler.close_connection = True
+            return status, headers, _stalled(data[start:cuts.pop()])
+        if rate:
+            return status, headers, _throttled(data[start:end + 1], rate)
+        return status, headers, data[start:end + 1]
+    return route
+
+
+def _throttled(body, rate, chunk_size=16 * 1024):
+    started = time.monotonic()
+    for offset in range(0, len(body), chunk_size):
+        delay = started + offset / rate - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        yield body[offset:offset + chunk_size]
+
+
+def _stalled(body, delay=0.2):
+    yield body
+    time.sleep(delay)  # let the client consume the body before the connection drops
+
+
+def flaky_route(failures, status=429, headers=None, body=None):
+    """ Route failing with `status` and `headers` for the first `failures` requests, then answering `body`
+
+    Bytes bodies are served as they are, anything else as json.
+    """
+    calls = []
+
+    def route(_):
+        calls.append(None)
+        if len(calls) <= failures:
+            return status, headers or {}, b''
+        if isinstance(body, bytes):
+            return 200, {}, body
+        return 200, {'Content-Type': 'application/json'}, json.dumps(body or {'ok': True}).encode()
+    return route
+
+
+def search_route(base_url, total):
+    """ Route answering `search?q=` with `total` results, every fifth one a user
+
+    Like the api, `next_href` cursors do not carry the client_id.
+    """
+    def route(handler):
+        query = parse_qs(urlsplit(handler.path).query)
+        offset, limit = int(query.get('offset', ['0'])[0]), int(query['limit'][0])
+        collection = []
+        for number in range(offset, min(offset + limit, total)):
+            if number % 5 == 4:
+                collection.append({'id': number, 'kind': 'user', 'username': f'user {number}'})
+            elif number % 5 == 3:
+                collection.append({'id': number, 'kind': 'playlist', 'title': f'playlist {number}', 'tracks': []})
+            else:
+                collection.append(make_track_obj(number, base_url))
+        page = {'collection': collection, 'next_href': None, 'total_results': total}
+        if offset + limit < total:
+            page['next_href'] = f'{base_url}/search?q={quote(query["q"][0])}&limit={limit}&offset={offset + limit}'
+        return 200, {'Content-Type': 'application/json'}, json.dumps(page).encode()
+    return route
+
+
+def user_collection_route(base_url, total, likes=False):
+    """ Route answering a user's `tracks` or `likes` with `total` items, newest first
+
+    Item `n` was created `n` hours before 2024-01-01.  Odd ids are track stubs without
+    media, like the api returns for older items.  Likes wrap each track with the time
+    of the like.  `next_href` is an opaque cursor without the client_id.
+    """
+    def route(handler):
+        split = urlsplit(handler.path)
+        query = parse_qs(split.query)
+        offset, limit = int(query.get('offset', ['0'])[0]), int(query['limit'][0])
+        collection = []
+        for number in range(offset, min(offset + limit, total)):
+            created_at = (datetime(2024, 1, 1, tzinfo=timezone.utc) - timedelta(hours=number)).strftime('%Y-%m-%dT%H:%M:%SZ')
+            track = make_track_obj(number, base_url, created_at=created_at)
+            if number % 2:
+                del track['media']
+            collection.append({'created_at': created_at, 'kind': 'like', 'track': track} if likes else track)
+        page = {'collection': collection, 'next_href': None}
+        if offset + limit < total:
+            page['next_href'] = f'{base_url}{split.path}?limit={limit}&offset={offset + limit}'
+        return 200, {'Content-Type': 'application/json'}, json.dumps(page).encode()
+    return route
+
+
+def redirect_route(location, head_allowed=True):
+    """ Route redirecting to `location`, answering HEAD with a 405 unless `head_allowed` """
+    def route(handler):
+        if handler.command == 'HEAD' and not head_allowed:
+            return 405, {}, b''
+        return 302, {'Location': location}, b''
+    return route
+
+
+def resolve_route(base_url):
+    """ Route answering `resolve?url=` for urls ending in `track-<id>`, 404 for other urls """
+    def route(handler):
+        url = parse_qs(urlsplit(handler.path).query)['url'][0]
+        match = re.search(r'/track-(\d+)$', url)
+        if not match:
+            return 404, {}, b''
+        return 200, {'Content-Type': 'application/json'}, json.dumps(make_track_obj(int(match.group(1)), base_url)).encode()
+    return route
+
+
+def tracks_route(base_url='http://127.0.0.1', missing=(), failing=()):
+    """ Route answering `tracks?ids=` with made up tracks in reverse order
+
+    Ids in `missing` are left out of the response, batches containing an id in
+    `failing` are answered with a 500.
+    """
+    def route(handler):
+        query = parse_qs(urlsplit(handler.path).query)
+        ids = [int(i) for i in query['ids'][0].split(',')]
+        if any(i in failing for i in ids):
+            return 500, {}, b''
+        tracks = [make_track_obj(i, base_url) for i in reversed(ids) if i not in missing]
+        return 200, {'Content-Type': 'application/json'}, json.dumps(tracks).encode()
+    return route
+
+
+class StubServer:  # pylint: disable=too-many-instance-attributes
+    """ Threaded HTTP server that serves canned responses
+
+    Routes map a path (without query string) to either bytes, a json serializable
+    object or a callable taking the request handler and returning (status, headers, body),
+    where body may also be an iterable of chunks sent as they are produced.
+    Requests are logged in `requests` as (method, path) and in `received` as
+    (method, route, headers).  `max_in_flight` is the most requests that were being
+    answered at once.
+    """
+
+    def __init__(self, ssl_context=None):
+        self.routes = {}
+        self.requests = []
+        self.received = []
+        self.peers = set()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), _make_handler(self))
+        self._server.daemon_threads = True
+        self._scheme = 'http'
+        if ssl_context is not None:
+            self._server.socket = ssl_context.wrap_socket(self._server.socket, server_side=True)
+            self._scheme = 'https'
+        self._thread = threading.Thread(
+            target=self._server.serve_forever, kwargs={'poll_interval': 0.05}, daemon=True
+        )
+
+    @property
+    def url(self):
+        """ Base url of the server """
+        host, port = self._server.server_address[:2]
+        return f'{self._scheme}://{host}:{port}'
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+def _make_handler(stub):
+    class Handler(BaseHTTPRequestHandler):
+        """ Request handler bound to a stub server """
+        protocol_version = 'HTTP/1.1'
+        disable_nagle_algorithm = True
+
+        def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+            pass
+
+        def do_HEAD(self):  # pylint: disable=invalid-name
+            """ HEAD """
+            self._respond(send_body=False)
+
+        def do_GET(self):  # pylint: disable=invalid-name
+            """ GET """
+            self._respond(send_body=True)
+
+        def _respond(self, send_body):
+            with stub._lock:  # pylint: disable=protected-access
+                stub.in_flight += 1
+                stub.max_in_flight = max(stub.max_in_flight, stub.in_flight)
+            try:
+                self._send_route(send_body)
+            finally:
+                with stub._lock:  # pylint: disable=protected-access
+                    stub.in_flight -= 1
+
+        def _send_route(self, send_body):
+            stub.requests.append((self.command, self.path))
+            stub.received.append((self.command, self.path.split('?')[0], self.headers))
+            stub.peers.add(self.client_address)
+            route = stub.routes.get(self.path.split('?')[0])
+            status, headers = 200, {}
+            if route is None:
+                status, body = 404, b''
+            elif callable(route):
+                status, headers, body = route(self)
+            elif isinstance(route, bytes):
+                body = route
+            else:
+                body = json.dumps(route).encode()
+                headers = {'Content-Type': 'application/json'}
+
+            self.send_response(status)
+            for key, value in headers.items():
+                self.send_header(key, value)
+            if 'Content-Length' not in headers:
+                self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if not send_body:
+                return
+            for chunk in [body] if isinstance(body, bytes) else body:
+                self.wfile.write(chunk)
+                self.wfile.flush()
+
+    return Handler
@@ -0,0 +1,66 @@
+""" Test the artwork cache """
+from concurrent import futures
+
+from sclib import asyncio as sclib_asyncio
+from sclib.cache import ArtworkCache
+from sclib.sync import Playlist, SoundcloudAPI
+from tests.stub import StubServer, make_mp3, make_track_obj
+
+COVER = b'\xff\xd8\xff\xe0' + b'\x00' * 1024
+
+
+def test_images_are_evicted_by_size():
+    """ Test that the least recently used images go once max_bytes is exceeded """
+    cache = ArtworkCache(max_bytes=250)
+    for name in 'abc':
+        cache.set(name, name.encode() * 100)
+    assert cache.get('a') is None
+    assert cache.get('b') == b'b' * 100
+    cache.set('d', b'd' * 100)
+    assert cache.get('c') is None and cache.get('b') is not None
+    assert cache.size == 200
+    cache.set('huge', b'x' * 1000)
+    assert cache.get('huge') is None and len(cache) == 2
+
+
+def test_images_are_shared_through_a_directory(tmp_path):
+    """ Test that a second cache finds images stored by the first """
+    ArtworkCache(directory=tmp_path).set('http://cover', COVER)
+    cache = ArtworkCache(directory=tmp_path)
+    assert cache.get('http://cover') == COVER
+    assert len(cache) == 1
+    assert ArtworkCache(directory=tmp_path).get('http://other') is None
+
+
+def test_album_cover_is_downloaded_once(tmp_path):
+    """ Test that concurrent downloads of an album share one cover request """
+    with StubServer() as stub:
+        stub.routes['/cover-t500x500.jpg'] = lambda _: (200, {}, COVER)
+        tracks = []
+        for track_id in range(6):
+            stub.routes[f'/transcodings/{track_id}/progressive'] = {'url': f'{stub.url}/audio.mp3'}
+            tracks.append(make_track_obj(track_id, stub.url, artwork_url=f'{stub.url}/cover-large.jpg'))
+        stub.routes['/audio.mp3'] = make_mp3(16 * 1024)
+        api = SoundcloudAPI(client_id='test')
+        playlist = Playlist(obj={'id': 1, 'kind': 'playlist', 'title': 'EP', 'tracks': tracks}, client=api)
+
+        results = playlist.download_all(str(tmp_path), concurrency=6)
+
+        assert [result.error for result in results] == [None] * 6
+        assert [path for _, path in stub.requests].count('/cover-t500x500.jpg') == 1
+        with futures.ThreadPoolExecutor(4) as executor:
+            covers = list(executor.map(api.get_artwork, [f'{stub.url}/cover-t500x500.jpg'] * 4))
+        assert covers == [COVER] * 4
+        assert [path for _, path in stub.requests].count('/cover-t500x500.jpg') == 1
+
+
+def test_client_keeps_the_given_cache(tmp_path):
+    """ Test that an empty cache passed to a client is used and writes covers to its directory """
+    cache = ArtworkCache(directory=tmp_path)
+    with StubServer() as stub:
+        stub.routes['/cover-t500x500.jpg'] = COVER
+        api = SoundcloudAPI(client_id='test', artwork_cache=cache)
+        assert api.artwork_cache is cache
+        assert api.get_artwork(f'{stub.url}/cover-t500x500.jpg') == COVER
+    assert ArtworkCache(directory=tmp_path).get(f'{stub.url}/cover-t500x500.jpg') == COVER
+    assert sclib_asyncio.SoundcloudAPI(artwork_cache=cache).artwork_cache is cache
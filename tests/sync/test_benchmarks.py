@@ -0,0 +1,29 @@
+""" Smoke test of the benchmark suite against the fake server """
+import json
+
+from benchmarks import suite
+
+
+def test_suite_reports_results_as_json(tmp_path, capsys):
+    """ Test that a tiny run of one scenario writes the expected report """
+    path = tmp_path / 'results.json'
+    suite.main([
+        '--scenarios', 'resolve', '--clients', 'sync', 'asyncio', '--ops', '2',
+        '--concurrency', '1', '--latency', '0', '--json', str(path),
+    ])
+    report = json.loads(path.read_text(encoding='utf-8'))
+    assert set(report) == {'meta', 'requests', 'results'}
+    assert report['meta']['settings']['ops'] == 2
+    assert report['requests']
+    assert [(result['scenario'], result['client']) for result in report['results']] == [
+        ('Resolve', 'sync'), ('Resolve', 'asyncio')
+    ]
+    for result in report['results']:
+        assert set(result) == {
+            'scenario', 'client', 'ops', 'concurrency', 'errors', 'seconds', 'ops_per_second',
+            'throughput', 'unit', 'latency_ms', 'peak_memory_bytes',
+        }
+        assert result['ops'] == 2
+        assert result['errors'] == 0
+        assert set(result['latency_ms']) == {'p50', 'p90', 'p99', 'max'}
+    assert 'Resolve' in capsys.readouterr().out
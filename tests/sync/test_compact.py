@@ -0,0 +1,38 @@
+""" Test compact tracks and playlists that read their fields lazily """
+from sclib.sync import Playlist, SoundcloudAPI, Track
+from tests.stub import make_track_obj
+
+
+def test_compact_track_reads_fields_on_access():
+    """ Test that a compact track keeps the api object and fills in attributes when read """
+    obj = make_track_obj(1, title='Artist - Song', genre='house', duration=1000)
+    track = Track(obj=obj, client=SoundcloudAPI(client_id='test', compact=True))
+    assert (track.artist, track.title) == ('Artist', 'Song')
+    assert track._obj is obj  # pylint: disable=protected-access
+    assert track.genre == 'house'
+    assert track.album is None and track.visuals is None
+    assert track.media is obj['media']
+
+
+def test_compact_fields_keep_a_subset():
+    """ Test that only the named fields and the ones needed to download are kept """
+    obj = make_track_obj(1, genre='house', duration=1000, visuals={'urn': 'big'})
+    track = Track(obj=obj, client=SoundcloudAPI(client_id='test'), compact=('duration',))
+    assert set(track._obj) == set(Track.COMPACT_FIELDS) | {'duration'}  # pylint: disable=protected-access
+    assert track.duration == 1000
+    assert track.genre is None and track.visuals is None
+
+
+def test_compact_playlist_builds_compact_tracks():
+    """ Test that a compact client's playlist and its tracks are compact """
+    api = SoundcloudAPI(client_id='test', compact=True)
+    playlist = Playlist(obj={'id': 7, 'kind': 'playlist', 'title': 'mix', 'tracks': [make_track_obj(1)]}, client=api)
+    assert playlist.title == 'mix' and playlist.genre is None
+    track, = playlist
+    assert track._obj is not None  # pylint: disable=protected-access
+
+
+def test_eager_is_default():
+    """ Test that tracks copy every field unless compact is asked for """
+    track = Track(obj=make_track_obj(1, genre='house'), client=SoundcloudAPI(client_id='test'))
+    assert track._obj is None and track.genre == 'house'  # pylint: disable=protected-access
@@ -0,0 +1,119 @@
+""" Test client_id caching and refresh """
+import time
+
+import pytest
+
+from sclib import util
+from sclib.cache import CredentialCache, FileCredentialCache
+from sclib.sync import SoundcloudAPI
+from sclib.util import ClientIdScanner, find_script_urls
+from tests.stub import StubServer
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server with a page whose script holds client_id `fresh` """
+    with StubServer() as server:
+        server.routes['/page'] = f'<html><script src="{server.url}/app.js"></script></html>'.encode()
+        server.routes['/app.js'] = b'var a={client_id:"x"};fetch("/x?client_id=fresh")'
+        monkeypatch.setattr(util, 'SCRAPE_URLS', [f'{server.url}/page'])
+        yield server
+
+
+def test_find_script_urls():
+    """ Test that script sources are found without parsing the page """
+    html = (
+        '<script crossorigin src="https://a/1.js"></script><script>var a</script>'
+        "<SCRIPT SRC='https://cdn.cookielaw.org/x.js'></SCRIPT><script data-src=\"https://a/lazy.js\"></script>"
+        "<script async src=https://a/2.js></script><script>var s='<script src=fake.js>'</script>"
+        "<script\nsrc = 'https://a/3.js'></script>"
+    )
+    assert find_script_urls(html) == ['https://a/1.js', 'https://a/2.js', 'https://a/3.js']
+
+
+@pytest.mark.parametrize('chunk_size', [1, 3, 7, 16, 100])
+def test_scanner_finds_id_split_across_chunks(chunk_size):
+    """ Test that a client_id is found wherever the chunk boundaries fall """
+    script = b'x' * 50 + b'?client_id=abcDEF123&limit=1' + b'y' * 50
+    scanner = ClientIdScanner()
+    chunks = [script[i:i + chunk_size] for i in range(0, len(script), chunk_size)]
+    found = next(filter(None, map(scanner.feed, chunks)), None) or scanner.close()
+    assert found == 'abcDEF123'
+
+
+def test_file_cache_round_trip(tmp_path):
+    """ Test that a stored id is shared between cache instances """
+    FileCredentialCache(tmp_path / 'creds.json').set('abc')
+    assert FileCredentialCache(tmp_path / 'creds.json').get()['client_id'] == 'abc'
+
+
+def test_cache_expires():
+    """ Test that stale entries are not returned """
+    cache = CredentialCache(ttl=60)
+    cache.write({'client_id': 'abc', 'timestamp': time.time() - 120})
+    assert cache.get() is None
+
+
+def test_invalidate_keeps_newer_id():
+    """ Test that invalidating an old id does not drop a newer one """
+    cache = CredentialCache()
+    cache.set('new')
+    cache.invalidate('old')
+    assert cache.get()['client_id'] == 'new'
+    cache.invalidate('new')
+    assert cache.get() is None
+
+
+def test_cached_id_skips_scraping(stub):
+    """ Test that a cached client_id is used without scraping """
+    cache = CredentialCache()
+    cache.set('cached')
+    api = SoundcloudAPI(credential_cache=cache)
+    api.get_credentials()
+    assert api.client_id == 'cached'
+    assert not stub.requests
+
+
+def test_scraped_id_is_cached(stub):  # pylint: disable=unused-argument
+    """ Test that a scraped client_id is stored in the cache """
+    cache = CredentialCache()
+    api = SoundcloudAPI(credential_cache=cache)
+    api.get_credentials()
+    assert api.client_id == 'fresh'
+    assert cache.get()['client_id'] == 'fresh'
+
+
+def test_auth_failure_refreshes_and_retries(stub):
+    """ Test that a 401 invalidates the cached id and the call is retried once """
+    def endpoint(handler):
+        if 'client_id=fresh' in handler.path:
+            return 200, {}, b'{"ok": true}'
+        return 401, {}, b''
+
+    stub.routes['/api'] = endpoint
+    cache = CredentialCache()
+    cache.set('expired')
+    api = SoundcloudAPI(credential_cache=cache)
+    api.get_credentials()
+    assert api.get_obj_from(f'{stub.url}/api?client_id=expired') == {'ok': True}
+    assert api.client_id == 'fresh'
+    assert cache.get()['client_id'] == 'fresh'
+    assert [path for _, path in stub.requests].count('/api?client_id=expired') == 1
+
+
+def test_scrape_tries_last_script_first(stub):
+    """ Test that the script that held the id last time is the only one fetched """
+    stub.routes['/page'] = ''.join(
+        f'<script src="{stub.url}/{name}.js"></script>' for name in ('a', 'b', 'app')
+    ).encode()
+    stub.routes['/a.js'] = stub.routes['/b.js'] = b'no id here'
+    cache = CredentialCache()
+    api = SoundcloudAPI(credential_cache=cache)
+    api.get_credentials()
+    assert cache.get()['script_url'] == f'{stub.url}/app.js'
+
+    stub.requests.clear()
+    api.refresh_credentials()
+    assert api.client_id == 'fresh'
+    paths = [path for _, path in stub.requests]
+    assert paths[paths.index('/page'):] == ['/page', '/app.js']  # ignore requests of the first scrape
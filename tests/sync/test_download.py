@@ -0,0 +1,284 @@
+""" Test sync track downloads against a local server """
+import io
+import os
+import tempfile
+import tracemalloc
+
+import mutagen
+import pytest
+
+from sclib.retry import RetryPolicy
+from sclib.sync import APIError, Playlist, SoundcloudAPI, Track, UnsupportedFormatError
+from tests.stub import StubServer, add_hls_stream, make_mp3, make_track_obj, ranged_route, tracks_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture():
+    """ Local server """
+    with StubServer() as server:
+        yield server
+
+
+def make_track(stub, mp3, track_id=1):
+    """ Track whose progressive stream is served by the stub """
+    stub.routes[f'/transcodings/{track_id}/progressive'] = {'url': f'{stub.url}/audio/{track_id}.mp3'}
+    stub.routes[f'/audio/{track_id}.mp3'] = mp3
+    obj = make_track_obj(track_id, stub.url, title='Artist - Title')
+    return Track(obj=obj, client=SoundcloudAPI(client_id='test'))
+
+
+def test_write_mp3_to_copies_stream(stub):
+    """ Test that the whole stream is written and tagged """
+    mp3 = make_mp3(1024 * 1024)
+    track = make_track(stub, mp3)
+    with tempfile.TemporaryFile() as file:
+        track.write_mp3_to(file, chunk_size=4096)
+        audio = mutagen.File(file, filename='x.mp3')
+        file.seek(0, 2)
+        assert file.tell() > len(mp3)
+    assert audio.tags['TIT2'] == 'Title'
+    assert audio.tags['TPE1'] == 'Artist'
+    assert track.ready
+
+
+@pytest.mark.parametrize('size', [8 * 1024 * 1024, 32 * 1024 * 1024])
+def test_write_mp3_to_memory_is_flat(stub, size):
+    """ Test that peak memory does not depend on the length of the track """
+    track = make_track(stub, make_mp3(size))
+    with tempfile.TemporaryFile() as file:
+        tracemalloc.start()
+        try:
+            track.write_mp3_to(file)
+            _, peak = tracemalloc.get_traced_memory()
+        finally:
+            tracemalloc.stop()
+    assert peak < 4 * 1024 * 1024
+
+
+def test_downloads_reuse_connections(stub):
+    """ Test that the api, stream and download requests share pooled connections """
+    client = SoundcloudAPI(client_id='test')
+    for track_id in range(3):
+        track = make_track(stub, make_mp3(64 * 1024), track_id)
+        track.client = client
+        with tempfile.TemporaryFile() as file:
+            track.write_mp3_to(file)
+    assert len(stub.requests) == 6
+    assert len(stub.peers) == 1
+
+
+def make_album(stub, client):
+    """ Playlist of two downloadable tracks and one without a progressive stream """
+    tracks = []
+    for track_id in (1, 2, 3):
+        make_track(stub, make_mp3(64 * 1024), track_id)
+        tracks.append(make_track_obj(track_id, stub.url, title=f'Artist - Song {track_id}'))
+    tracks[1]['media']['transcodings'] = []
+    return Playlist(obj={'id': 9, 'kind': 'playlist', 'title': 'Album', 'tracks': tracks}, client=client)
+
+
+def test_download_all_writes_tagged_files_and_reports_errors(stub, tmp_path):
+    """ Test that a playlist is downloaded to a directory with per-track results """
+    playlist = make_album(stub, SoundcloudAPI(client_id='test'))
+    results = playlist.download_all(str(tmp_path), concurrency=2)
+
+    assert [result.track.id for result in results] == [1, 2, 3]
+    assert isinstance(results[1].error, UnsupportedFormatError)
+    assert sorted(os.listdir(tmp_path)) == ['Artist - Song 1.mp3', 'Artist - Song 3.mp3']
+    tags = mutagen.File(results[2].path).tags
+    assert (tags['TALB'], tags['TRCK']) == ('Album', '3')
+
+
+def test_download_all_gives_duplicate_tracks_their_own_files(stub, tmp_path):
+    """ Test that tracks with the same name do not share a file and a failed one leaves the other """
+    playlist = make_album(stub, SoundcloudAPI(client_id='test'))
+    duplicate = make_track_obj(1, stub.url, title='Artist - Song 1')
+    playlist.tracks = [playlist.tracks[0], duplicate, dict(duplicate, media={'transcodings': []})]
+    results = playlist.download_all(str(tmp_path), concurrency=3)
+
+    assert [os.path.basename(result.path) for result in results] == [
+        'Artist - Song 1.mp3', 'Artist - Song 1 (2).mp3', 'Artist - Song 1 (3).mp3'
+    ]
+    assert isinstance(results[2].error, UnsupportedFormatError)
+    assert sorted(os.listdir(tmp_path)) == ['Artist - Song 1 (2).mp3', 'Artist - Song 1.mp3']
+
+
+def test_download_all_reports_tracks_of_failed_batches(stub, tmp_path, monkeypatch):
+    """ Test that a stub whose batch failed gets a result and later tracks keep their position """
+    monkeypatch.setattr(SoundcloudAPI, 'TRACK_API_MAX_REQUEST_SIZE', 1)
+    monkeypatch.setattr(SoundcloudAPI, 'TRACKS_URL', stub.url + '/tracks?ids={track_ids}&client_id={client_id}')
+    stub.routes['/tracks'] = tracks_route(stub.url, failing={2})
+    for track_id in (1, 3):
+        make_track(stub, make_mp3(16 * 1024), track_id)
+    client = SoundcloudAPI(client_id='test', retry_policy=RetryPolicy(retries=0))
+    playlist = Playlist(obj={'id': 9, 'kind': 'playlist', 'title': 'Album', 'tracks': [{'id': i} for i in (1, 2, 3)]},
+                        client=client)
+    results = playlist.download_all(str(tmp_path))
+
+    assert len(results) == 3
+    assert results[1].track == {'id': 2} and results[1].path is None
+    assert isinstance(results[1].error, APIError)
+    assert [(results[i].error, results[i].track.track_no) for i in (0, 2)] == [(None, 1), (None, 3)]
+    assert mutagen.File(results[2].path).tags['TRCK'] == '3'
+
+
+def test_hls_segments_are_assembled_in_order(stub):
+    """ Test that a track without a progressive stream is assembled from HLS segments """
+    mp3 = make_mp3(256 * 1024)
+    obj = make_track_obj(1, stub.url, title='Artist - Title')
+    obj['media']['transcodings'] = add_hls_stream(stub, 1, mp3, segments=6, delays=(0.2, 0, 0.1, 0, 0.05))
+    track = Track(obj=obj, client=SoundcloudAPI(client_id='test'))
+    with tempfile.TemporaryFile() as file:
+        track.write_hls_to(file, window=3)
+        file.seek(0)
+        assert file.read() == mp3
+        track.write_mp3_to(file)
+        audio = mutagen.File(file, filename='x.mp3')
+    assert audio.tags['TIT2'] == 'Title'
+    segment_requests = [path for _, path in stub.requests if path.endswith('.mp3')]
+    assert len(segment_requests) == 12
+
+
+def test_encrypted_hls_is_unsupported(stub):
+    """ Test that encrypted playlists are refused """
+    obj = make_track_obj(1, stub.url, artwork_url=f'{stub.url}/cover-large.jpg')
+    obj['media']['transcodings'] = add_hls_stream(stub, 1, make_mp3(4096), segments=2)
+    stub.routes['/hls/1/playlist.m3u8'] = b'#EXTM3U\n#EXT-X-KEY:METHOD=AES-128,URI="key"\n#EXTINF:10.0,\n0.mp3\n'
+    track = Track(obj=obj, client=SoundcloudAPI(client_id='test'))
+    with tempfile.TemporaryFile() as file:
+        with pytest.raises(UnsupportedFormatError):
+            track.write_mp3_to(file)
+        assert file.seek(0, os.SEEK_END) == 0
+    assert '/cover-t500x500.jpg' not in [path for _, path in stub.requests]
+
+
+def make_resumable_track(stub, mp3, cut_at=None, etag='"v1"'):
+    """ Track whose progressive stream supports Range requests """
+    track = make_track(stub, mp3)
+    stub.routes['/audio/1.mp3'] = ranged_route(mp3, etag=etag, cut_at=cut_at)
+    return track
+
+
+def test_download_to_resumes_after_dropped_connection(stub, tmp_path):
+    """ Test that an interrupted download continues from its checkpoint """
+    mp3 = make_mp3(1024 * 1024)
+    track = make_resumable_track(stub, mp3, cut_at=300 * 1000)
+    path = tmp_path / 'track.mp3'
+    header, trailer = track.build_id3_tags()
+    with pytest.raises(Exception):
+        track.download_to(path)
+    assert not path.exists()
+    assert os.path.getsize(f'{path}.part') == len(header) + 300 * 1000
+
+    track.download_to(path)
+
+    ranges = [headers.get('Range') for _, route, headers in stub.received if route == '/audio/1.mp3']
+    assert ranges == [None, 'bytes=300000-']
+    assert not os.path.exists(f'{path}.part') and not os.path.exists(f'{path}.part.json')
+    assert path.read_bytes() == header + mp3 + trailer
+    assert mutagen.File(path).tags['TIT2'] == 'Title'
+
+
+def test_download_to_refreshes_expired_stream_url(stub, tmp_path):
+    """ Test that a resumed download asks for a new stream url when the old one is gone """
+    mp3 = make_mp3(256 * 1024)
+    track = make_resumable_track(stub, mp3, cut_at=100 * 1000)
+    path = tmp_path / 'track.mp3'
+    with pytest.raises(Exception):
+        track.download_to(path)
+    stub.routes['/transcodings/1/progressive'] = {'url': f'{stub.url}/audio/fresh.mp3'}
+    stub.routes['/audio/fresh.mp3'] = ranged_route(mp3)
+    del stub.routes['/audio/1.mp3']
+
+    track.download_to(path)
+
+    fresh = [headers.get('Range') for _, route, headers in stub.received if route == '/audio/fresh.mp3']
+    assert fresh == ['bytes=100000-']
+    assert mp3 in path.read_bytes()
+
+
+def test_download_to_restarts_when_the_stream_changed(stub, tmp_path):
+    """ Test that stale bytes are discarded when the validator no longer matches """
+    mp3 = make_mp3(256 * 1024)
+    track = make_resumable_track(stub, mp3, cut_at=100 * 1000)
+    path = tmp_path / 'track.mp3'
+    with pytest.raises(Exception):
+        track.download_to(path)
+    other = make_mp3(300 * 1024)
+    stub.routes['/audio/1.mp3'] = ranged_route(other, etag='"v2"')
+
+    track.download_to(path)
+
+    ranges = [headers.get('Range') for _, route, headers in stub.received if route == '/audio/1.mp3']
+    assert ranges == [None, 'bytes=100000-']
+    assert other in path.read_bytes()
+    assert len(path.read_bytes()) < len(other) + 100 * 1000
+
+
+def test_write_mp3_to_fetches_ranges_in_parallel(stub, monkeypatch):
+    """ Test that a stream is split into ranges written at their offsets """
+    monkeypatch.setattr(Track, 'MIN_RANGE_SIZE', 64 * 1024)
+    mp3 = make_mp3(1024 * 1024 + 5)
+    track = make_resumable_track(stub, mp3)
+    with tempfile.TemporaryFile() as file:
+        track.write_mp3_to(file, connections=4)
+        assert mp3 in file.read()
+        audio = mutagen.File(file, filename='x.mp3')
+    ranges = [headers.get('Range') for _, route, headers in stub.received if route == '/audio/1.mp3']
+    assert ranges[0] == 'bytes=0-0'
+    bounds = sorted(tuple(int(n) for n in value[6:].split('-')) for value in ranges[1:])
+    assert len(bounds) == 4 and bounds[0][0] == 0 and bounds[-1][1] == len(mp3) - 1
+    assert all(end + 1 == start for (_, end), (start, _) in zip(bounds, bounds[1:]))
+    assert audio.tags['TIT2'] == 'Title'
+
+
+def test_write_mp3_to_without_range_support_uses_one_stream(stub):
+    """ Test that servers ignoring Range fall back to a single request """
+    mp3 = make_mp3(256 * 1024)
+    track = make_track(stub, mp3)
+    with tempfile.TemporaryFile() as file:
+        track.write_mp3_to(file, connections=4)
+        assert mp3 in file.read()
+    assert len([path for _, path in stub.requests if path == '/audio/1.mp3']) == 2
+
+
+def test_write_mp3_to_skips_ranges_without_positional_writes(stub, monkeypatch):
+    """ Test that in-memory files and systems without os.pwrite use one stream and no Range probe """
+    mp3 = make_mp3(256 * 1024)
+    track = make_resumable_track(stub, mp3)
+    file = io.BytesIO()
+    track.write_mp3_to(file, connections=4)
+    assert mp3 in file.getvalue()
+    monkeypatch.delattr(os, 'pwrite')
+    with tempfile.TemporaryFile() as file:
+        track.write_mp3_to(file, connections=4)
+        assert mp3 in file.read()
+    assert [headers.get('Range') for _, route, headers in stub.received if route == '/audio/1.mp3'] == [None, None]
+
+
+class CountingFile(io.BytesIO):
+    """ In-memory file counting the bytes written to it """
+
+    def __init__(self):
+        super().__init__()
+        self.written = 0
+
+    def write(self, data):
+        self.written += len(data)
+        return super().write(data)
+
+
+def test_write_mp3_to_writes_each_byte_once(stub):
+    """ Test that the tag is written ahead of the audio instead of being inserted afterwards """
+    mp3 = make_mp3(512 * 1024)
+    track = make_track(stub, mp3)
+    track.album, track.track_no = 'Album', 3
+    file = CountingFile()
+    track.write_mp3_to(file)
+    data = file.getvalue()
+    assert file.written == len(data)
+    assert mp3 in data
+    assert data.startswith(b'ID3') and data[-128:].startswith(b'TAG')
+    tags = mutagen.File(file, filename='x.mp3').tags
+    assert (tags['TIT2'], tags['TPE1'], tags['TALB'], tags['TRCK']) == ('Title', 'Artist', 'Album', '3')
+    assert mutagen.File(io.BytesIO(data), filename='x.mp3').info.length > 0
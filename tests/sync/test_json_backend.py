@@ -0,0 +1,44 @@
+""" Test json backends and the client's use of them """
+import pytest
+
+from sclib import json_backend
+from sclib.sync import APIError, SoundcloudAPI
+from tests.stub import StubServer, tracks_route
+
+
+@pytest.mark.parametrize('name', list(json_backend.BACKENDS))
+def test_backends_decode_bytes(name):
+    """ Test that every installed backend decodes bytes and raises ValueError for bad json """
+    backend = json_backend.get_backend(name)
+    assert backend.loads('{"title": "café", "ids": [1, 2]}'.encode()) == {'title': 'café', 'ids': [1, 2]}
+    with pytest.raises(ValueError):
+        backend.loads(b'{"truncated": ')
+
+
+def test_get_backend():
+    """ Test default, named, custom and missing backends """
+    assert json_backend.get_backend() is json_backend.DEFAULT_BACKEND
+    assert json_backend.get_backend('json').name == 'json'
+    custom = json_backend.JsonBackend('custom', len)
+    assert json_backend.get_backend(custom) is custom
+    with pytest.raises(ValueError):
+        json_backend.get_backend('simdjson')
+
+
+def test_client_decodes_responses_with_its_backend(monkeypatch):
+    """ Test that api responses go to the backend as bytes """
+    decoded = []
+
+    def loads(data):
+        decoded.append(type(data))
+        return json_backend.get_backend('json').loads(data)
+
+    with StubServer() as stub:
+        stub.routes['/tracks'] = tracks_route(stub.url)
+        stub.routes['/broken'] = b'{"collection": ['
+        monkeypatch.setattr(SoundcloudAPI, 'TRACKS_URL', stub.url + '/tracks?ids={track_ids}&client_id={client_id}')
+        api = SoundcloudAPI(client_id='test', json_backend=json_backend.JsonBackend('recording', loads))
+        assert [track['id'] for track in api.fetch_tracks(1, 2).tracks] == [1, 2]
+        with pytest.raises(APIError):
+            api.get_obj_from(stub.url + '/broken')
+    assert decoded == [bytes, bytes]
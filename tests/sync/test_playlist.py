@@ -1,9 +1,12 @@
 """
 Test async playlists
 """
+import time
+
 import pytest
 
-from sclib.sync import SoundcloudAPI
+from sclib.sync import Playlist, SoundcloudAPI
+from tests.stub import StubServer, make_track_obj, tracks_route
 
 
 @pytest.fixture(name='sclib')
@@ -29,3 +32,51 @@ def test_playlist_type(sclib: SoundcloudAPI, playlist_url: str, expected_playlis
     """ Test async playlist type """
     test_playlist = sclib.resolve(playlist_url)
     assert test_playlist.kind == expected_playlist_kind
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering tracks?ids= with a delay """
+    with StubServer() as server:
+        route = tracks_route(server.url, missing={13})
+
+        def slow_route(handler):
+            time.sleep(0.1)
+            return route(handler)
+
+        server.routes['/tracks'] = slow_route
+        monkeypatch.setattr(SoundcloudAPI, 'TRACKS_URL', server.url + '/tracks?ids={track_ids}&client_id={client_id}')
+        yield server
+
+
+def make_playlist(complete_ids, stub_ids):
+    """ Playlist whose first tracks have metadata and the rest are id stubs """
+    tracks = [make_track_obj(i) for i in complete_ids] + [{'id': i} for i in stub_ids]
+    return Playlist(obj={'id': 1, 'kind': 'playlist', 'tracks': tracks}, client=SoundcloudAPI(client_id='test'))
+
+
+def test_playlist_hydration_keeps_order(stub):  # pylint: disable=unused-argument
+    """ Test that complete and hydrated tracks stay in playlist order and missing ones are dropped """
+    playlist = make_playlist([1000, 1001], list(range(120, 0, -1)))
+    assert [track.id for track in playlist] == [1000, 1001] + [i for i in range(120, 0, -1) if i != 13]
+
+
+def test_playlist_batches_are_fetched_concurrently(stub):
+    """ Test that batches are requested at once, up to the concurrency limit """
+    playlist = make_playlist([], range(500))
+    playlist.clean_attributes(concurrency=10)
+    assert len(stub.requests) == 10
+    assert len(playlist) == 499
+    assert 1 < stub.max_in_flight <= 10
+
+
+def test_iteration_yields_tracks_as_batches_arrive(stub):
+    """ Test that the first hydrated track is yielded after one batch rather than all of them """
+    playlist = make_playlist([1000], range(1, 301))
+    arrivals = [(track.id, len(stub.requests)) for track in playlist.iter_tracks(concurrency=1)]
+    assert [track_id for track_id, _ in arrivals] == [1000] + [i for i in range(1, 301) if i != 13]
+    assert arrivals[0][1] == 0  # complete tracks need no request
+    assert arrivals[1][1] <= 2  # after the first of six batches, the next may be on its way
+    assert arrivals[-1][1] == 6
+    assert stub.max_in_flight == 1
+    assert playlist.ready
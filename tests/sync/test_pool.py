@@ -0,0 +1,129 @@
+""" Test the sync connection pool """
+import threading
+import time
+from concurrent import futures
+from urllib.error import HTTPError
+
+import pytest
+
+from sclib import asyncio as sclib_asyncio
+from sclib.pool import ConnectionPool
+from sclib.sync import SoundcloudAPI
+from tests.stub import StubServer
+
+
+@pytest.fixture(name='stub')
+def stub_fixture():
+    """ Local server """
+    with StubServer() as server:
+        server.routes['/data'] = b'data'
+        yield server
+
+
+def test_connections_are_reused(stub):
+    """ Test that sequential requests share one connection """
+    pool = ConnectionPool()
+    for _ in range(5):
+        with pool.request(f'{stub.url}/data') as response:
+            assert response.read() == b'data'
+    assert len(stub.requests) == 5
+    assert len(stub.peers) == 1
+
+
+def test_unread_response_is_not_reused(stub):
+    """ Test that a connection with an unread body is dropped """
+    pool = ConnectionPool()
+    with pool.request(f'{stub.url}/data'):
+        pass
+    with pool.request(f'{stub.url}/data') as response:
+        response.read()
+    assert len(stub.peers) == 2
+
+
+def test_idle_connections_are_evicted(stub):
+    """ Test that connections idle for longer than idle_timeout are closed """
+    pool = ConnectionPool(idle_timeout=0)
+    for _ in range(2):
+        with pool.request(f'{stub.url}/data') as response:
+            response.read()
+    assert len(stub.peers) == 2
+
+
+class RecordingPool(ConnectionPool):
+    """ Pool that keeps every connection it opened """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.opened = []
+
+    def _new_connection(self, key):
+        conn = super()._new_connection(key)
+        self.opened.append(conn)
+        return conn
+
+
+def test_idle_connections_of_other_hosts_are_closed(stub):
+    """ Test that releasing a connection closes those idle for too long to any host """
+    pool = RecordingPool(idle_timeout=0.05)
+    with StubServer() as other:
+        other.routes['/data'] = b'other'
+        for url in (f'{stub.url}/data', f'{other.url}/data'):
+            with pool.request(url) as response:
+                response.read()
+            time.sleep(0.1)
+        assert [conn.sock is None for conn in pool.opened] == [True, False]
+
+
+def test_client_closes_its_connections(stub):
+    """ Test that the sync client used as a context manager closes its pool """
+    pool = RecordingPool()
+    with SoundcloudAPI(client_id='test', pool=pool) as api:
+        assert api.get_url(f'{stub.url}/data') == b'data'
+        assert pool.opened[0].sock is not None
+    assert pool.opened[0].sock is None
+    assert sclib_asyncio.SoundcloudAPI(client_id='test').pool is None
+
+
+def test_open_connections_are_bounded(stub):
+    """ Test that no more than maxsize connections are open to one host """
+    release = threading.Event()
+
+    def slow(_):
+        release.wait(5)
+        return 200, {}, b'slow'
+
+    stub.routes['/slow'] = slow
+    pool = ConnectionPool(maxsize=2)
+
+    def fetch():
+        with pool.request(f'{stub.url}/slow') as response:
+            return response.read()
+
+    with futures.ThreadPoolExecutor(4) as executor:
+        results = [executor.submit(fetch) for _ in range(4)]
+        futures.wait(results, timeout=0.3)
+        assert len(stub.requests) == 2
+        release.set()
+        assert [r.result() for r in results] == [b'slow'] * 4
+    assert len(stub.peers) == 2
+
+
+def test_redirects_are_followed(stub):
+    """ Test that redirects are followed and the final url is reported """
+    stub.routes['/short'] = lambda _: (302, {'Location': '/data'}, b'')
+    pool = ConnectionPool()
+    with pool.request(f'{stub.url}/short') as response:
+        assert response.read() == b'data'
+        assert response.geturl() == f'{stub.url}/data'
+    assert len(stub.peers) == 1
+
+
+def test_error_status_raises_http_error(stub):
+    """ Test that error responses raise like urlopen """
+    pool = ConnectionPool()
+    with pytest.raises(HTTPError) as info:
+        pool.request(f'{stub.url}/missing')
+    assert info.value.code == 404
+    with pool.request(f'{stub.url}/data') as response:
+        response.read()
+    assert len(stub.peers) == 1
@@ -0,0 +1,103 @@
+""" Test resolving urls against a local server """
+import json
+import threading
+import time
+from concurrent import futures
+
+import pytest
+
+from sclib.cache import LRUCache, ResolveCache
+from sclib.sync import Playlist, SoundcloudAPI, Track
+from tests.stub import StubServer, make_track_obj
+
+TRACK_URL = 'https://soundcloud.com/some-artist/some-track'
+PLAYLIST_URL = 'https://soundcloud.com/some-artist/sets/some-set'
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering resolve calls """
+    with StubServer() as server:
+        def resolve(handler):
+            if 'sets' in handler.path:
+                obj = {'id': 9, 'kind': 'playlist', 'tracks': [make_track_obj(1), make_track_obj(2)]}
+            else:
+                obj = make_track_obj(1)
+            return 200, {}, json.dumps(obj).encode()
+
+        server.routes['/resolve'] = resolve
+        monkeypatch.setattr(SoundcloudAPI, 'RESOLVE_URL', server.url + '/resolve?url={url}&client_id={client_id}')
+        yield server
+
+
+def test_lru_cache_evicts_oldest():
+    """ Test that the least recently used entry is evicted """
+    cache = LRUCache(maxsize=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+
+
+def test_lru_cache_expires():
+    """ Test that entries older than ttl are dropped """
+    cache = LRUCache(ttl=0.01)
+    cache.set('a', 1)
+    time.sleep(0.02)
+    assert cache.get('a') is None
+    assert len(cache) == 0
+
+
+def test_resolve_cache_keeps_an_empty_backend():
+    """ Test that an empty backend passed to the cache is used """
+    backend = LRUCache(maxsize=3)
+    assert ResolveCache(backend=backend).backend is backend
+
+
+def test_resolve_without_cache_always_fetches(stub):
+    """ Test that every resolve hits the api without a cache """
+    api = SoundcloudAPI(client_id='test')
+    for _ in range(2):
+        assert type(api.resolve(TRACK_URL)) is Track
+    assert len(stub.requests) == 2
+
+
+def test_resolve_cache_hits_skip_network(stub):
+    """ Test that equivalent urls are served from the cache """
+    cache = ResolveCache(maxsize=10)
+    api = SoundcloudAPI(client_id='test', resolve_cache=cache)
+    first = api.resolve(TRACK_URL)
+    second = api.resolve(TRACK_URL.replace('https://', 'https://www.') + '/?si=abc')
+    assert first is not second
+    assert second.title == first.title
+    assert len(stub.requests) == 1
+    assert (cache.hits, cache.misses) == (1, 1)
+
+
+def test_cached_playlist_is_not_consumed(stub):
+    """ Test that building a playlist from a cached object leaves the object intact """
+    api = SoundcloudAPI(client_id='test', resolve_cache=ResolveCache())
+    for _ in range(2):
+        playlist = api.resolve(PLAYLIST_URL)
+        assert type(playlist) is Playlist
+        assert [track.id for track in playlist] == [1, 2]
+    assert len(stub.requests) == 1
+
+
+def test_concurrent_identical_calls_are_coalesced(stub):
+    """ Test that threads asking for the same url at once share one request """
+    release = threading.Event()
+
+    def slow(_):
+        release.wait(5)
+        return 200, {}, b'{"kind": "slow"}'
+
+    stub.routes['/slow'] = slow
+    api = SoundcloudAPI(client_id='test')
+    with futures.ThreadPoolExecutor(8) as executor:
+        calls = [executor.submit(api.get_obj_from, f'{stub.url}/slow') for _ in range(8)]
+        time.sleep(0.2)
+        release.set()
+        assert [call.result() for call in calls] == [{'kind': 'slow'}] * 8
+    assert len(stub.requests) == 1
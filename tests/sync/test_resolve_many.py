@@ -0,0 +1,58 @@
+""" Test resolving many share links against a local server """
+import pytest
+
+from sclib.cache import LRUCache, RedirectCache
+from sclib.sync import APIError, SoundcloudAPI, Track
+from tests.stub import StubServer, redirect_route, resolve_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server with short links redirecting to track pages and a resolve endpoint """
+    with StubServer() as server:
+        for track_id in (1, 2):
+            server.routes[f'/s/{track_id}'] = redirect_route(f'{server.url}/artist/track-{track_id}')
+            server.routes[f'/artist/track-{track_id}'] = b'<html>a large page</html>'
+        server.routes['/s/no-head'] = redirect_route(f'{server.url}/artist/track-2', head_allowed=False)
+        server.routes['/s/deleted'] = redirect_route(f'{server.url}/artist/deleted')
+        server.routes['/artist/deleted'] = b''
+        server.routes['/resolve'] = resolve_route(server.url)
+        monkeypatch.setattr(SoundcloudAPI, 'RESOLVE_URL', server.url + '/resolve?url={url}&client_id={client_id}')
+        yield server
+
+
+def test_results_in_input_order_with_errors(stub):
+    """ Test that every url gets a result in order and failures are reported per url """
+    urls = [f'{stub.url}/s/2', f'{stub.url}/s/deleted', f'{stub.url}/s/1', f'{stub.url}/s/missing', f'{stub.url}/s/2']
+    results = SoundcloudAPI(client_id='test').resolve_many(urls, concurrency=3)
+    assert [result.url for result in results] == urls
+    assert [result.resource.id for result in results if result.error is None] == [2, 1, 2]
+    assert isinstance(results[0].resource, Track)
+    assert isinstance(results[1].error, APIError)
+    assert results[3].error.code == 404
+
+
+def test_redirects_use_head_and_are_cached(stub):
+    """ Test that share links are followed without downloading pages, once per link """
+    api = SoundcloudAPI(client_id='test')
+    urls = [f'{stub.url}/s/1', f'{stub.url}/s/2', f'{stub.url}/s/1']
+    api.resolve_many(urls)
+    api.resolve_many(urls)
+    page_requests = [(method, path) for method, path in stub.requests if not path.startswith('/resolve')]
+    assert sorted(page_requests) == [
+        ('HEAD', '/artist/track-1'), ('HEAD', '/artist/track-2'), ('HEAD', '/s/1'), ('HEAD', '/s/2')
+    ]
+    assert api.redirect_cache.get(f'{stub.url}/s/1') == f'{stub.url}/artist/track-1'
+
+
+def test_get_fallback_when_head_is_refused(stub):
+    """ Test that links refusing HEAD are followed with GET """
+    result, = SoundcloudAPI(client_id='test').resolve_many([f'{stub.url}/s/no-head'])
+    assert result.error is None and result.resource.id == 2
+    assert ('GET', '/s/no-head') in stub.requests
+
+
+def test_redirect_cache_keeps_an_empty_backend():
+    """ Test that an empty backend passed to the cache is used """
+    backend = LRUCache(maxsize=3)
+    assert RedirectCache(backend=backend).backend is backend
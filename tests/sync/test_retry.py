@@ -0,0 +1,110 @@
+""" Test rate limiting and retries against a local server that throttles """
+import time
+from email.utils import formatdate
+
+import pytest
+
+from sclib import sync
+from sclib.retry import RateLimiter, RetryPolicy, parse_retry_after
+from sclib.sync import APIError, RateLimitedError, SoundcloudAPI
+from tests.stub import StubServer, flaky_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture():
+    """ Local server """
+    with StubServer() as server:
+        yield server
+
+
+def make_api(**kwargs):
+    """ Client with short backoffs """
+    kwargs.setdefault('retry_policy', RetryPolicy(retries=3, backoff=0.01))
+    return SoundcloudAPI(client_id='test', **kwargs)
+
+
+def test_retry_after_is_honored_and_slows_the_limiter(stub):
+    """ Test that 429s are retried after Retry-After and lower the rate """
+    stub.routes['/api'] = flaky_route(2, 429, {'Retry-After': '0.2'})
+    limiter = RateLimiter(rate=40)
+    api = make_api(rate_limiter=limiter)
+    started = time.monotonic()
+    assert api.get_obj_from(f'{stub.url}/api?client_id=test') == {'ok': True}
+    assert time.monotonic() - started >= 0.4
+    assert len(stub.requests) == 3
+    assert limiter.rate == 10.5
+
+
+def test_server_errors_are_retried_then_raised(stub):
+    """ Test that 5xx responses are retried and end in a structured error """
+    stub.routes['/flaky'] = flaky_route(2, 503)
+    stub.routes['/down'] = flaky_route(10, 502)
+    api = make_api()
+    assert api.get_obj_from(f'{stub.url}/flaky') == {'ok': True}
+    with pytest.raises(APIError) as info:
+        api.get_obj_from(f'{stub.url}/down')
+    assert info.value.status == 502
+    assert info.value.url == f'{stub.url}/down'
+    assert len(stub.requests) == 3 + 4
+
+
+def test_client_errors_and_bad_json_are_not_retried(stub):
+    """ Test that 404s and invalid bodies raise at once """
+    stub.routes['/html'] = b'<html>'
+    api = make_api()
+    with pytest.raises(APIError) as info:
+        api.get_obj_from(f'{stub.url}/missing')
+    assert info.value.status == 404
+    with pytest.raises(APIError) as info:
+        api.get_obj_from(f'{stub.url}/html')
+    assert info.value.status is None
+    assert len(stub.requests) == 2
+
+
+def test_module_get_obj_from_raises(stub):
+    """ Test that the module level get_obj_from raises APIError instead of returning False """
+    stub.routes['/html'] = b'<html>'
+    with pytest.raises(APIError) as info:
+        sync.get_obj_from(f'{stub.url}/missing')
+    assert info.value.status == 404
+    with pytest.raises(APIError) as info:
+        sync.get_obj_from(f'{stub.url}/html')
+    assert info.value.status is None
+
+
+def test_persistent_429_raises_rate_limited_error(stub):
+    """ Test that a client that stays throttled gets RateLimitedError """
+    stub.routes['/api'] = flaky_route(10, 429)
+    with pytest.raises(RateLimitedError):
+        make_api(retry_policy=RetryPolicy(retries=1, backoff=0.01)).get_obj_from(f'{stub.url}/api?client_id=test')
+
+
+def test_token_bucket_spaces_requests():
+    """ Test that requests beyond the burst wait for tokens """
+    limiter = RateLimiter(rate=20, burst=2)
+    waits = [limiter.reserve() for _ in range(6)]
+    assert waits[:2] == [0, 0]
+    assert waits[-1] == pytest.approx(0.2, abs=0.01)
+    limiter.throttled(retry_after=1)
+    assert limiter.reserve() >= 0.9
+
+
+def test_default_limiter_is_unlimited_until_throttled():
+    """ Test that the default limiter only starts limiting after a 429 """
+    limiter = RateLimiter(burst=2, throttled_rate=20)
+    assert [limiter.reserve() for _ in range(100)] == [0] * 100
+    limiter.succeeded()
+    assert limiter.rate is None
+    limiter.throttled()
+    assert limiter.rate == 20
+    assert limiter.reserve() == pytest.approx(0.05, abs=0.01)
+    limiter.throttled()
+    assert limiter.rate == 10
+
+
+def test_retry_after_dates_are_parsed():
+    """ Test both Retry-After formats """
+    assert parse_retry_after('3') == 3
+    assert 8 < parse_retry_after(formatdate(time.time() + 10, usegmt=True)) <= 10
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(None) is None
@@ -0,0 +1,49 @@
+""" Test paginated search against a local server """
+import time
+
+import pytest
+
+from sclib.sync import Playlist, SoundcloudAPI, Track
+from tests.stub import StubServer, search_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering search?q= """
+    with StubServer() as server:
+        server.routes['/search'] = search_route(server.url, total=23)
+        monkeypatch.setattr(
+            SoundcloudAPI, 'SEARCH_URL',
+            server.url + '/search?q={query}&client_id={client_id}&limit={limit}&offset={offset}'
+        )
+        yield server
+
+
+def test_search_follows_cursors(stub):
+    """ Test that every page is fetched and users are skipped """
+    results = list(SoundcloudAPI(client_id='test').search('deep house', page_size=5))
+    assert [result.id for result in results] == [n for n in range(23) if n % 5 != 4]
+    assert isinstance(results[0], Track) and isinstance(results[3], Playlist)
+    paths = [path for _, path in stub.requests]
+    assert len(paths) == 5
+    assert paths[0].startswith('/search?q=deep%20house&client_id=test')
+    assert all('client_id=test' in path for path in paths)
+
+
+def test_next_page_is_prefetched(stub):
+    """ Test that the next page is requested while the current one is consumed """
+    results = SoundcloudAPI(client_id='test').search('query', page_size=10)
+    next(results)
+    for _ in range(100):
+        if len(stub.requests) == 2:
+            break
+        time.sleep(0.01)
+    assert len(stub.requests) == 2
+    results.close()
+
+
+def test_limit_stops_paging(stub):
+    """ Test that no page beyond the limit is fetched """
+    results = list(SoundcloudAPI(client_id='test').search('query', limit=7, page_size=5))
+    assert len(results) == 7
+    assert len(stub.requests) == 2
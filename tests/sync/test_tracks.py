@@ -0,0 +1,37 @@
+""" Test bulk track fetching against a local server """
+import pytest
+
+from sclib.retry import RetryPolicy
+from sclib.sync import SoundcloudAPI
+from tests.stub import StubServer, tracks_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering tracks?ids= """
+    with StubServer() as server:
+        server.routes['/tracks'] = tracks_route(server.url, missing={7}, failing={120})
+        monkeypatch.setattr(SoundcloudAPI, 'TRACKS_URL', server.url + '/tracks?ids={track_ids}&client_id={client_id}')
+        yield server
+
+
+def test_tracks_keep_order_of_first_appearance(stub):  # pylint: disable=unused-argument
+    """ Test that tracks come back in request order without duplicates """
+    track_ids = [5, 3, 9, 3, 1, 5]
+    tracks = SoundcloudAPI(client_id='test').get_tracks(*track_ids)
+    assert [track['id'] for track in tracks] == [5, 3, 9, 1]
+
+
+def test_duplicates_are_fetched_once(stub):
+    """ Test that duplicate ids do not add batches """
+    track_ids = list(range(50)) * 3
+    SoundcloudAPI(client_id='test').get_tracks(*track_ids)
+    assert len(stub.requests) == 1
+
+
+def test_missing_and_failed_ids_are_reported(stub):  # pylint: disable=unused-argument
+    """ Test that a failed batch and missing ids give partial results instead of raising """
+    track_ids = list(range(150))
+    result = SoundcloudAPI(client_id='test', retry_policy=RetryPolicy(retries=0)).fetch_tracks(*track_ids)
+    assert result.missing == [7] + list(range(100, 150))
+    assert [track['id'] for track in result.tracks] == [i for i in range(100) if i != 7]
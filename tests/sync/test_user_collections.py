@@ -0,0 +1,64 @@
+""" Test streaming a user's collections against a local server """
+import time
+from datetime import datetime, timezone
+
+import pytest
+
+from sclib.sync import SoundcloudAPI, Track
+from tests.stub import StubServer, tracks_route, user_collection_route
+
+
+@pytest.fixture(name='stub')
+def stub_fixture(monkeypatch):
+    """ Local server answering a user's tracks and likes and tracks?ids= """
+    with StubServer() as server:
+        server.routes['/users/7/tracks'] = user_collection_route(server.url, total=23)
+        server.routes['/users/7/likes'] = user_collection_route(server.url, total=8, likes=True)
+        server.routes['/tracks'] = tracks_route(server.url)
+        monkeypatch.setattr(SoundcloudAPI, 'TRACKS_URL', server.url + '/tracks?ids={track_ids}&client_id={client_id}')
+        monkeypatch.setattr(SoundcloudAPI, 'USER_TRACKS_URL', server.url + '/users/{user_id}/tracks?client_id={client_id}&limit={limit}')
+        monkeypatch.setattr(SoundcloudAPI, 'USER_LIKES_URL', server.url + '/users/{user_id}/likes?client_id={client_id}&limit={limit}')
+        monkeypatch.setattr(SoundcloudAPI, 'COLLECTION_PAGE_SIZE', 5)
+        yield server
+
+
+def page_requests(stub):
+    """ Paths of the requests for collection pages """
+    return [path for _, path in stub.requests if path.startswith('/users/')]
+
+
+def test_stream_hydrates_stubs_in_bulk(stub):
+    """ Test that every page is followed and the stubs of a page are fetched in one request """
+    tracks = list(SoundcloudAPI(client_id='test').iter_user_tracks(7))
+    assert [track.id for track in tracks] == list(range(23))
+    assert all(isinstance(track, Track) and track.media for track in tracks)
+    assert len(page_requests(stub)) == 5
+    assert len([path for _, path in stub.requests if path.startswith('/tracks')]) == 5
+    assert all('client_id=test' in path for _, path in stub.requests)
+
+
+def test_since_stops_at_older_items(stub):
+    """ Test that the stream ends at the cutoff without fetching later pages """
+    since = datetime(2023, 12, 31, 11, 30, tzinfo=timezone.utc)
+    tracks = list(SoundcloudAPI(client_id='test').iter_user_tracks(7, since=since))
+    assert [track.id for track in tracks] == list(range(13))
+    assert len(page_requests(stub)) == 3
+
+    tracks = list(SoundcloudAPI(client_id='test').iter_user_tracks(7, since='2023-12-31T22:00:00'))
+    assert [track.id for track in tracks] == list(range(3))
+
+
+def test_read_ahead_is_bounded(stub):
+    """ Test that only `read_ahead` pages are fetched ahead of the consumer """
+    tracks = SoundcloudAPI(client_id='test').iter_user_tracks(7, read_ahead=1)
+    next(tracks)
+    time.sleep(0.2)
+    assert len(page_requests(stub)) == 2
+    tracks.close()
+
+
+def test_likes_are_unwrapped(stub):  # pylint: disable=unused-argument
+    """ Test that liked tracks are yielded and filtered by the time of the like """
+    likes = list(SoundcloudAPI(client_id='test').iter_user_likes(7, since='2023-12-31T20:00:00Z'))
+    assert [track.id for track in likes] == [0, 1, 2, 3, 4]
+    assert all(isinstance(track, Track) for track in likes)